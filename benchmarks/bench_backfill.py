@@ -0,0 +1,75 @@
+"""
+Measures the backfill of a JSON Lines dump of OpenWeather responses: the readings/s
+of the decoding alone with 1 to N worker processes, then of the whole load (decoding
+pool plus the single writer) into the test database.
+
+    python -m benchmarks.bench_backfill [--readings 200000] [--stations 500] [--workers 1 2 4]
+
+SQLite serializes the writes; the COPY path of PostgreSQL is the one the >100k
+readings/s target is about (DATABASE_URL pointing to PostgreSQL).
+"""
+
+import argparse
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from .utils import Timer, report, setup_django
+
+setup_django()
+
+from django.db import connection  # noqa: E402
+from django.test.utils import override_settings  # noqa: E402
+
+from monitoring.backfill import parse_item, plan_work, run_backfill, setup_worker  # noqa: E402
+
+SAMPLE = json.loads((Path(__file__).parent.parent / "tests" / "data" / "openweather.json").read_text())
+SPLIT_BYTES = 4 * 1024 * 1024
+
+
+def write_dump(path, readings, stations):
+    start = int(time.time()) - readings // stations * 600
+    with open(path, "w") as f:
+        for index in range(readings):
+            SAMPLE["id"] = index % stations
+            SAMPLE["name"] = f"Station {index % stations}"
+            SAMPLE["dt"] = start + index // stations * 600
+            SAMPLE["main"]["temp"] = 10 + index % 17
+            f.write(json.dumps(SAMPLE))
+            f.write("\n")
+
+
+def decode_rate(path, workers):
+    items = plan_work([path], SPLIT_BYTES)
+    with Timer() as timer:
+        with ProcessPoolExecutor(max_workers=workers, initializer=setup_worker) as executor:
+            readings = sum(len(parsed.readings) for parsed in executor.map(parse_item, items))
+    return readings / timer.elapsed
+
+
+def main(readings, stations, worker_counts):
+    with tempfile.TemporaryDirectory() as directory:
+        path = Path(directory) / "openweather.jsonl"
+        write_dump(path, readings, stations)
+        rows = [("decode only", workers, f"{decode_rate(path, workers):.0f}") for workers in worker_counts]
+
+        connection.creation.create_test_db(verbosity=0)
+        state_file = os.path.join(directory, "state.json")
+        with override_settings(BACKFILL={"split_bytes": SPLIT_BYTES, "state_file": state_file}):
+            totals = run_backfill([path], workers=max(worker_counts))
+        rows.append(
+            (f"load into {connection.vendor}", max(worker_counts), f"{totals['readings'] / totals['elapsed']:.0f}")
+        )
+    report(f"Backfill of {readings} readings from {stations} stations", rows, ["stage", "workers", "readings/s"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readings", type=int, default=200000)
+    parser.add_argument("--stations", type=int, default=500)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    args = parser.parse_args()
+    main(args.readings, args.stations, args.workers)
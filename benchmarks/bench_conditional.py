@@ -0,0 +1,110 @@
+"""
+Measures the cost of the dashboard polls under 100 concurrent pollers, with and without
+revalidation: the pollers either ignore the validators (every poll renders) or send back
+the ETag of their previous response, as the browser does, and get 304 while nothing changed.
+
+    python -m benchmarks.bench_conditional [--pollers 100] [--polls 20]
+"""
+
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from .utils import Timer, report, setup_django
+
+setup_django()
+
+from django.db import connection, connections  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import CaptureQueriesContext, setup_test_environment  # noqa: E402
+from django.urls import reverse  # noqa: E402
+from django.utils.timezone import now  # noqa: E402
+
+from monitoring.models import WeatherData, WeatherStation  # noqa: E402
+from monitoring.postgres_probe import publish_statuses  # noqa: E402
+from monitoring.rollups import update_rollups  # noqa: E402
+
+
+def populate():
+    station = WeatherStation.objects.create(name="Bench", source="openweather", source_id="bench")
+    start = now() - timedelta(hours=24)
+    readings = WeatherData.objects.bulk_create(
+        WeatherData(station=station, timestamp=start + timedelta(minutes=index), temperature=15 + index % 7)
+        for index in range(1, 1440)
+    )
+    update_rollups(readings)
+    publish_statuses([{"target": "default", "status": "up", "latency_ms": 1.0, "error": None, "checked_at": now()}])
+    return station
+
+
+def poll(url, params, headers, polls, revalidate):
+    """One poller: returns the latency of every poll and the count of 304"""
+    client = Client()
+    latencies = []
+    not_modified = 0
+    etag = None
+    for _ in range(polls):
+        extra = dict(headers)
+        if revalidate and etag:
+            extra["HTTP_IF_NONE_MATCH"] = etag
+        with Timer() as timer:
+            response = client.get(url, params, **extra)
+        latencies.append(timer.elapsed)
+        if response.status_code == 304:
+            not_modified += 1
+        else:
+            etag = response.get("ETag")
+    connections.close_all()
+    return latencies, not_modified
+
+
+def queries_per_poll(url, params, headers, revalidate):
+    client = Client()
+    first = client.get(url, params, **headers)
+    extra = {**headers, "HTTP_IF_NONE_MATCH": first["ETag"]} if revalidate else headers
+    with CaptureQueriesContext(connection) as queries:
+        client.get(url, params, **extra)
+    return len(queries)
+
+
+def main(pollers, polls):
+    # lets the test client through ALLOWED_HOSTS
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0)
+    station = populate()
+    views = {
+        "temperature 24h": (reverse("temperature_data_partial"), {"station_id": station.id, "interval": "24h"}, {}),
+        "postgres dashboard": (reverse("postgres_dashboard"), {"interval": "24h"}, {"HTTP_HX_REQUEST": "true"}),
+        "task stats": (reverse("task_stats_partial"), {}, {}),
+    }
+    rows = []
+    for name, (url, params, headers) in views.items():
+        for revalidate in (False, True):
+            with ThreadPoolExecutor(pollers) as executor, Timer() as timer:
+                results = list(executor.map(lambda _: poll(url, params, headers, polls, revalidate), range(pollers)))
+            latencies = sorted(latency for poller_latencies, _ in results for latency in poller_latencies)
+            rows.append(
+                (
+                    name,
+                    "ETag" if revalidate else "none",
+                    f"{len(latencies) / timer.elapsed:.0f}",
+                    f"{statistics.mean(latencies) * 1000:.1f}",
+                    f"{latencies[int(len(latencies) * 0.95)] * 1000:.1f}",
+                    sum(not_modified for _, not_modified in results),
+                    queries_per_poll(url, params, headers, revalidate),
+                )
+            )
+    report(
+        f"{pollers} concurrent pollers, {polls} polls each",
+        rows,
+        ["view", "validators", "req/s", "mean ms", "p95 ms", "304", "queries/poll"],
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pollers", type=int, default=100)
+    parser.add_argument("--polls", type=int, default=20)
+    args = parser.parse_args()
+    main(args.pollers, args.polls)
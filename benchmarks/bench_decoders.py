@@ -0,0 +1,86 @@
+"""
+Measures the decoding throughput of the fast-path decoders against the DRF serializers
+on synthetic OpenWeather and Netatmo records (100k by default).
+
+Only the decoding and validation are timed, nothing is written to the database.
+
+    python -m benchmarks.bench_decoders [--records 100000]
+"""
+
+import argparse
+
+from .utils import Timer, report, setup_django
+
+setup_django()
+
+from monitoring.decoders import DECODERS, DecodeError  # noqa: E402
+from monitoring.serializers import NetatmoSerializer, OpenWeatherSerializer  # noqa: E402
+
+SERIALIZERS = {"openweather": OpenWeatherSerializer, "netatmo": NetatmoSerializer}
+
+
+def openweather_record(index):
+    return {
+        "coord": {"lon": 9.19 + index * 1e-6, "lat": 45.46},
+        "main": {"temp": 15.5 + index % 10, "feels_like": 14.9, "pressure": 1015, "humidity": 60},
+        "dt": 1741600000 + index,
+        "id": 3173435 + index,
+        "name": "Milan",
+    }
+
+
+def netatmo_record(index):
+    return {
+        "_id": f"70:ee:50:{index:08x}",
+        "place": {"location": [9.19, 45.46], "city": "Milano", "street": f"Via {index}"},
+        "measures": {
+            "02:00:00:00:00:01": {
+                "res": {str(1741600000 + index): [18.3 + index % 10, 64]},
+                "type": ["temperature", "humidity"],
+            },
+            "70:ee:50:00:00:01": {"res": {str(1741600000 + index): [1013.2]}, "type": ["pressure"]},
+        },
+    }
+
+
+def decode_fast(source, records):
+    decoder = DECODERS[source]
+    for record in records:
+        try:
+            decoder.decode(record)
+        except DecodeError:
+            pass
+
+
+def decode_strict(source, records):
+    serializer_class = SERIALIZERS[source]
+    for record in records:
+        serializer = serializer_class(data=record)
+        if serializer.is_valid():
+            serializer.pop_station_data(dict(serializer.validated_data))
+
+
+def main(size):
+    rows = []
+    for source, make_record in (("openweather", openweather_record), ("netatmo", netatmo_record)):
+        records = [make_record(index) for index in range(size)]
+        with Timer() as fast:
+            decode_fast(source, records)
+        with Timer() as strict:
+            decode_strict(source, records)
+        rows.append(
+            (
+                source,
+                f"{size / strict.elapsed:,.0f}",
+                f"{size / fast.elapsed:,.0f}",
+                f"{strict.elapsed / fast.elapsed:.1f}x",
+            )
+        )
+    report(f"Decoding {size:,} records", rows, ["source", "serializer rec/s", "fast rec/s", "speedup"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--records", type=int, default=100_000)
+    args = parser.parse_args()
+    main(args.records)
@@ -0,0 +1,84 @@
+"""
+Measures the chart payload size and the latency of temperature_data_partial with and
+without LTTB downsampling, for synthetic series of 10k, 100k and 1M points.
+
+The series is injected in place of get_temperature_series, so the timings cover the
+downsampling, JSON encoding and template rendering, not the database query. The readings
+of the station are marked as changed before every render: no fragment is served from the cache.
+
+    python -m benchmarks.bench_downsampling [--sizes 10000 100000 1000000] [--budget 500]
+"""
+
+import argparse
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+
+import numpy as np
+
+from .utils import Timer, report, setup_django
+
+setup_django()
+
+from django.conf import settings  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import RequestFactory  # noqa: E402
+
+from monitoring.conditional import touch  # noqa: E402
+from monitoring.downsampling import lttb  # noqa: E402
+from monitoring.models import WeatherStation  # noqa: E402
+from monitoring.views import temperature_data_partial  # noqa: E402
+
+
+def synthetic_series(size):
+    rnd = np.random.default_rng(0)
+    start = datetime(2025, 3, 10, tzinfo=timezone.utc)
+    temperatures = 15 + 5 * np.sin(np.linspace(0, 20, size)) + rnd.normal(0, 0.5, size)
+    return [(start + timedelta(seconds=index), float(value)) for index, value in enumerate(temperatures)]
+
+
+def render(station, series, budget):
+    settings.CHART_MAX_POINTS = budget
+    request = RequestFactory().get("/monitoring/temperature/data/", {"station_id": station.id, "interval": "24h"})
+    # a new version of the data: the fragment cached by the previous render is not used
+    touch(f"readings:{station.id}")
+    with patch("monitoring.views.get_temperature_series", return_value=series):
+        with Timer() as timer:
+            response = temperature_data_partial(request)
+    return len(response.content), timer.elapsed
+
+
+def main(sizes, budget):
+    connection.creation.create_test_db(verbosity=0)
+    station = WeatherStation.objects.create(name="Bench", source="openweather", source_id="bench")
+    rows = []
+    for size in sizes:
+        series = synthetic_series(size)
+        x = np.arange(size, dtype=np.float64)
+        y = np.fromiter((value for _, value in series), dtype=np.float64, count=size)
+        with Timer() as lttb_timer:
+            lttb(x, y, budget)
+        raw_bytes, raw_time = render(station, series, None)
+        small_bytes, small_time = render(station, series, budget)
+        rows.append(
+            (
+                size,
+                f"{raw_bytes / 1024:.0f}",
+                f"{small_bytes / 1024:.1f}",
+                f"{raw_time * 1000:.1f}",
+                f"{small_time * 1000:.1f}",
+                f"{lttb_timer.elapsed * 1000:.1f}",
+            )
+        )
+    report(
+        f"temperature_data_partial with a {budget} point budget",
+        rows,
+        ["points", "raw KiB", "lttb KiB", "raw view ms", "lttb view ms", "lttb ms"],
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--budget", type=int, default=500)
+    args = parser.parse_args()
+    main(args.sizes, args.budget)
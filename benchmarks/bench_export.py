@@ -0,0 +1,89 @@
+"""
+Measures the streaming export: throughput and peak Python memory (tracemalloc) while the
+response is consumed, for growing row counts, through WSGI and ASGI. The peak stays flat:
+rows are read as tuples chunk_size at a time and encoded batch_size at a time, never all
+held at once.
+
+    python -m benchmarks.bench_export [--rows 10000 100000 300000]
+"""
+
+import argparse
+import tracemalloc
+from datetime import timedelta
+
+from .utils import Timer, report, setup_django
+
+setup_django()
+
+from asgiref.sync import async_to_sync  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test import AsyncClient, Client  # noqa: E402
+from django.test.utils import setup_test_environment  # noqa: E402
+from django.urls import reverse  # noqa: E402
+from django.utils.timezone import now  # noqa: E402
+
+from monitoring.models import WeatherData, WeatherStation  # noqa: E402
+
+START = now().replace(microsecond=0) - timedelta(days=365)
+
+
+def populate(rows):
+    """Adds readings, one per minute from START, up to the given count"""
+    station = WeatherStation.objects.get_or_create(name="Bench", source="openweather", source_id="bench")[0]
+    existing = WeatherData.objects.count()
+    WeatherData.objects.bulk_create(
+        (
+            WeatherData(station=station, timestamp=START + timedelta(minutes=index), temperature=15 + index % 7)
+            for index in range(existing, rows)
+        ),
+        batch_size=5000,
+    )
+
+
+async def consume_asgi(url, params):
+    response = await AsyncClient().get(url, params)
+    return sum([len(chunk) async for chunk in response.streaming_content])
+
+
+def measure(rows, params, asgi=False):
+    url = reverse("export_readings")
+    params = {"start": START.isoformat(), "end": (START + timedelta(minutes=rows)).isoformat(), **params}
+    tracemalloc.start()
+    with Timer() as timer:
+        if asgi:
+            size = async_to_sync(consume_asgi)(url, params)
+        else:
+            size = sum(len(chunk) for chunk in Client().get(url, params).streaming_content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return timer.elapsed, size, peak
+
+
+def main(row_counts):
+    # lets the test client through ALLOWED_HOSTS
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0)
+    populate(100)
+    # imports and URL resolution out of the first measure
+    measure(100, {})
+    results = []
+    for rows in sorted(row_counts):
+        populate(rows)
+        for name, params, asgi in (
+            ("csv", {}, False),
+            ("ndjson", {"format": "ndjson"}, False),
+            ("csv gzip", {"compress": "gzip"}, False),
+            ("csv asgi", {}, True),
+        ):
+            elapsed, size, peak = measure(rows, params, asgi)
+            results.append(
+                (rows, name, f"{rows / elapsed:.0f}", f"{size / 1024 / 1024:.1f}", f"{peak / 1024 / 1024:.2f}")
+            )
+    report("Streaming export", results, ["rows", "format", "rows/s", "output MiB", "peak MiB"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 300000])
+    args = parser.parse_args()
+    main(args.rows)
@@ -0,0 +1,58 @@
+"""
+Measures the overhead the metrics add to a call: a no-op function and coroutine are
+called bare and wrapped with Operation.timed.
+
+    python -m benchmarks.bench_metrics [--calls 200000]
+"""
+
+import argparse
+import asyncio
+
+from .utils import Timer, report, setup_django
+
+setup_django()
+
+from monitoring.metrics import Registry  # noqa: E402
+
+
+def noop():
+    return None
+
+
+async def async_noop():
+    return None
+
+
+def time_sync(func, calls):
+    with Timer() as timer:
+        for _ in range(calls):
+            func()
+    return timer.elapsed
+
+
+def time_async(func, calls):
+    async def loop():
+        for _ in range(calls):
+            await func()
+
+    with Timer() as timer:
+        asyncio.run(loop())
+    return timer.elapsed
+
+
+def main(calls):
+    operation = Registry().operation("bench", "Benchmark calls", ["source"])
+    rows = []
+    for kind, timer, func in (("sync", time_sync, noop), ("async", time_async, async_noop)):
+        bare = timer(func, calls)
+        timed = timer(operation.timed(source="bench")(func), calls)
+        per_call = [elapsed / calls * 1e6 for elapsed in (bare, timed, timed - bare)]
+        rows.append((kind, *(f"{value:.2f}" for value in per_call)))
+    report(f"{calls:,} calls", rows, ["call", "bare us", "timed us", "overhead us"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=200_000)
+    args = parser.parse_args()
+    main(args.calls)
@@ -0,0 +1,112 @@
+"""
+Measures the station coverage of NetatmoAPIClient against a local fake getpublicdata
+holding thousands of synthetic stations and thinning out the results of large areas.
+
+    python -m benchmarks.bench_netatmo_tiling [--stations 5000] [--cap 200]
+"""
+
+import argparse
+import asyncio
+import random
+
+from aiohttp import web
+
+from .utils import Timer, report, setup_django
+
+setup_django()
+
+from django.conf import settings  # noqa: E402
+
+from monitoring.api_clients.netatmo import NetatmoAPIClient  # noqa: E402
+from monitoring.api_clients.session import close_session  # noqa: E402
+
+BBOX = {"lat_ne": 45.55, "lon_ne": 9.30, "lat_sw": 45.40, "lon_sw": 9.05}
+
+
+def synthetic_stations(count):
+    rnd = random.Random(0)
+    return [
+        {
+            "_id": f"70:ee:50:{index:06x}",
+            "place": {
+                "location": [rnd.uniform(BBOX["lon_sw"], BBOX["lon_ne"]), rnd.uniform(BBOX["lat_sw"], BBOX["lat_ne"])],
+                "city": "Milan",
+                "street": f"Via {index}",
+            },
+            "measures": {"02:00:00:00:00:00": {"res": {"1741362399": [18.3, 47]}, "type": ["temperature", "humidity"]}},
+        }
+        for index in range(count)
+    ]
+
+
+async def start_fake_netatmo(stations, cap):
+    """getpublicdata returning a random sample of at most `cap` stations of the requested box"""
+    rnd = random.Random(1)
+
+    async def getpublicdata(request):
+        box = {name: float(request.query[name]) for name in BBOX}
+        inside = [
+            station
+            for station in stations
+            if box["lon_sw"] <= station["place"]["location"][0] < box["lon_ne"]
+            and box["lat_sw"] <= station["place"]["location"][1] < box["lat_ne"]
+        ]
+        if len(inside) > cap:
+            inside = rnd.sample(inside, cap)
+        return web.json_response({"status": "ok", "body": inside})
+
+    app = web.Application()
+    app.router.add_get("/getpublicdata", getpublicdata)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}"
+
+
+async def main(count, cap):
+    stations = synthetic_stations(count)
+    runner, settings.NETATMO_BASE_URL = await start_fake_netatmo(stations, cap)
+    # every strategy makes its own requests, as fast as the fake server answers them
+    settings.API_RESPONSE_CACHE = {"backend": None}
+    settings.API_RATE_LIMIT = {"backend": None}
+    requests = {"count": 0}
+    original_fetch_tile = NetatmoAPIClient.fetch_tile
+
+    async def counting_fetch_tile(self, *args):
+        requests["count"] += 1
+        return await original_fetch_tile(self, *args)
+
+    NetatmoAPIClient.fetch_tile = counting_fetch_tile
+    strategies = [
+        ("single bbox request", {"max_stations": cap, "max_depth": 0, "concurrency": 10}),
+        ("adaptive quadtree, depth 2", {"max_stations": cap, "max_depth": 2, "concurrency": 10}),
+        ("adaptive quadtree, depth 4", {"max_stations": cap, "max_depth": 4, "concurrency": 10}),
+    ]
+    rows = []
+    try:
+        for name, tiling in strategies:
+            settings.NETATMO_TILING = tiling
+            requests["count"] = 0
+            with Timer() as timer:
+                data = await NetatmoAPIClient().get_weather_data(**BBOX)
+            found = len(data["body"])
+            rows.append((name, requests["count"], found, f"{found * 100 / count:.1f}%", f"{timer.elapsed * 1000:.1f}"))
+    finally:
+        NetatmoAPIClient.fetch_tile = original_fetch_tile
+        await close_session()
+        await runner.cleanup()
+    report(
+        f"Netatmo coverage ({count} stations, at most {cap} per response)",
+        rows,
+        ["strategy", "requests", "stations", "coverage", "ms"],
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stations", type=int, default=5000)
+    parser.add_argument("--cap", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.stations, args.cap))
@@ -0,0 +1,109 @@
+"""
+Counts the connections (DNS + TCP + TLS handshakes) opened per request against
+a local stub server, comparing one ClientSession per call with the pooled session.
+
+    python -m benchmarks.bench_sessions [--requests 500] [--concurrency 20]
+"""
+
+import argparse
+import asyncio
+
+import aiohttp
+from aiohttp import web
+
+from .utils import Timer, report, setup_django
+
+setup_django()
+
+from monitoring.api_clients.session import create_session  # noqa: E402
+
+PAYLOAD = {"coord": {"lon": 9.2, "lat": 45.4}, "main": {"temp": 12.3}, "dt": 1741599999, "id": 1, "name": "Stub"}
+
+
+async def start_stub_server():
+    async def weather(request):
+        return web.json_response(PAYLOAD)
+
+    app = web.Application()
+    app.router.add_get("/weather", weather)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/weather"
+
+
+def connection_counter():
+    counter = {"connections": 0}
+
+    async def on_connection_create_end(session, context, params):
+        counter["connections"] += 1
+
+    trace_config = aiohttp.TraceConfig()
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    return counter, trace_config
+
+
+async def per_call_sessions(url, requests, concurrency):
+    """Previous behaviour: every fetch opens and closes its own session"""
+    counter, trace_config = connection_counter()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch():
+        async with semaphore:
+            async with aiohttp.ClientSession(trace_configs=[trace_config]) as session:
+                async with session.get(url) as response:
+                    await response.json()
+
+    await asyncio.gather(*(fetch() for _ in range(requests)))
+    return counter["connections"]
+
+
+async def pooled_session(url, requests, concurrency):
+    """Current behaviour: every fetch reuses the keep-alive connections of one session"""
+    counter, trace_config = connection_counter()
+    semaphore = asyncio.Semaphore(concurrency)
+    session = create_session(trace_configs=[trace_config])
+
+    async def fetch():
+        async with semaphore:
+            async with session.get(url) as response:
+                await response.json()
+
+    await asyncio.gather(*(fetch() for _ in range(requests)))
+    await session.close()
+    return counter["connections"]
+
+
+async def main(requests, concurrency):
+    runner, url = await start_stub_server()
+    rows = []
+    try:
+        for name, strategy in (("per-call session", per_call_sessions), ("pooled session", pooled_session)):
+            with Timer() as timer:
+                connections = await strategy(url, requests, concurrency)
+            rows.append(
+                (
+                    name,
+                    requests,
+                    connections,
+                    f"{connections / requests:.3f}",
+                    f"{timer.elapsed * 1000 / requests:.3f}",
+                )
+            )
+    finally:
+        await runner.cleanup()
+    report(
+        f"Handshakes per request ({requests} requests, concurrency {concurrency})",
+        rows,
+        ["strategy", "requests", "connections", "handshakes/req", "ms/req"],
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.concurrency))
@@ -0,0 +1,34 @@
+import os
+import time
+
+import django
+
+
+def setup_django():
+    """Configures Django with the project settings, placeholder coordinates and a status cache of the run"""
+    for name in ("LATITUDE", "LONGITUDE", "LATITUDE_NE", "LONGITUDE_NE", "LATITUDE_SW", "LONGITUDE_SW"):
+        os.environ.setdefault(name, "0")
+    # the benchmarks use a test database: its data versions must not reach the cache of the project
+    os.environ.setdefault("STATUS_CACHE_URL", "locmemcache://")
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "weatherapp.settings")
+    django.setup()
+
+
+class Timer:
+    """Context manager measuring the elapsed wall-clock time in seconds"""
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
+
+
+def report(title, rows, columns):
+    """Prints the benchmark results as an aligned text table"""
+    print(f"\n{title}")
+    widths = [max(len(str(col)), *(len(str(row[i])) for row in rows)) for i, col in enumerate(columns)]
+    print("  ".join(str(col).ljust(w) for col, w in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(str(value).ljust(w) for value, w in zip(row, widths)))
@@ -1,5 +1,13 @@
+import json
 from typing import Protocol
 
+import aiohttp
+
+from .errors import ProviderResponseError, ProviderThrottled, ProviderUnavailable
+from .rate_limit import get_rate_limiter
+from .resilience import call_with_retries
+from .session import get_session
+
 
 class BaseAsyncAPIClient(Protocol):
     def __init__(self, base_url: str) -> None: ...
@@ -7,19 +15,62 @@ class BaseAsyncAPIClient(Protocol):
     _headers: dict = {}
     _query_params: dict = {}
     source: str = ""
+    # seconds between two updates of the provider data, used as the response cache TTL
+    update_interval: int = 0
 
     @property
     def headers(self) -> dict:
         return self._headers
 
     def add_headers(self, headers: dict) -> None:
-        self._headers.update(headers)
+        # copy instead of update: the class-level dict is shared by every client
+        self._headers = {**self._headers, **headers}
 
     @property
     def query_params(self) -> dict:
         return self._query_params
 
     def add_query_params(self, query_params: dict) -> None:
-        self._query_params.update(query_params)
+        self._query_params = {**self._query_params, **query_params}
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """Pooled session shared by every client running on the current event loop"""
+        return get_session()
+
+    async def throttle(self) -> None:
+        """Waits for a request slot of the provider, to call before every request (see rate_limit.py)"""
+        rate_limiter = get_rate_limiter()
+        if rate_limiter is not None:
+            await rate_limiter.acquire(self.source)
+
+    async def request_budget(self) -> float | None:
+        """Requests the rate limit lets through within its max_wait, None when unlimited"""
+        rate_limiter = get_rate_limiter()
+        if rate_limiter is None:
+            return None
+        return await rate_limiter.budget(self.source)
+
+    async def get_json(self, url: str, **kwargs):
+        """GETs the url and decodes its JSON body, with retries and the circuit breaker (see resilience.py)"""
+        return await call_with_retries(self.source, lambda: self.get_json_once(url, **kwargs))
+
+    async def get_json_once(self, url: str, **kwargs):
+        """One attempt of get_json, raising the typed errors of errors.py"""
+        await self.throttle()
+        async with self.session.get(url, **kwargs) as response:
+            if response.status == 429:
+                retry_after = response.headers.get("Retry-After", "")
+                raise ProviderThrottled(
+                    self.source, 429, response.reason, float(retry_after) if retry_after.isdigit() else None
+                )
+            if response.status >= 500:
+                raise ProviderUnavailable(self.source, f"{response.status} {response.reason}")
+            if response.status >= 400:
+                raise ProviderResponseError(self.source, response.status, response.reason)
+            try:
+                return json.loads(await response.text())
+            except ValueError as e:
+                raise ProviderUnavailable(self.source, f"invalid JSON response: {e}")
 
     async def get_weather_data(self, **kwargs) -> dict: ...
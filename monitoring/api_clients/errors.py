@@ -0,0 +1,46 @@
+class ProviderError(Exception):
+    """A weather provider request that did not return data"""
+
+    def __init__(self, source: str, message: str) -> None:
+        super().__init__(f"{source}: {message}")
+        self.source = source
+
+
+class ProviderUnavailable(ProviderError):
+    """5xx answer, timeout or connection failure: transient, the request is retried"""
+
+
+class ProviderResponseError(ProviderError):
+    """4xx answer: the request itself is wrong (credentials, parameters), retrying it is useless"""
+
+    def __init__(self, source: str, status: int, message: str) -> None:
+        super().__init__(source, f"{status} {message}")
+        self.status = status
+
+
+class ProviderThrottled(ProviderResponseError):
+    """429 answer: the provider quota is used up, retried after Retry-After when given"""
+
+    def __init__(self, source: str, status: int, message: str, retry_after: float | None) -> None:
+        super().__init__(source, status, message)
+        self.retry_after = retry_after
+
+
+class RateLimitExceeded(ProviderError):
+    """No request slot of the provider freed up within max_wait (see rate_limit.py)"""
+
+    def __init__(self, source: str, retry_after: float) -> None:
+        super().__init__(source, f"rate limit exceeded, next slot in {retry_after:.1f}s")
+        self.retry_after = retry_after
+
+
+class CircuitOpen(ProviderError):
+    """The provider failed repeatedly: its requests fail at once until the circuit breaker tries again"""
+
+    def __init__(self, source: str, retry_after: float) -> None:
+        super().__init__(source, f"provider unavailable, circuit open for {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(ProviderError):
+    """The request, retries included, ran out of its time budget"""
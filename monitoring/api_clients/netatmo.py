@@ -1,11 +1,33 @@
-import aiohttp
+import asyncio
+import logging
+
 from django.conf import settings
 
-from ..services import log_function_call_with_timing
+from .. import metrics
 from .base_client import BaseAsyncAPIClient
+from .resilience import with_deadline
+from .response_cache import cached_response
+from .single_flight import single_flight
+from .tiling import BoundingBox
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TILING_SETTINGS = {
+    "max_stations": 200,  # a tile returning this many stations is considered thinned out
+    "max_depth": 4,  # how many times a thinned out tile can be split into quadrants
+    "concurrency": 10,  # tile requests in flight at once
+}
+
+
+def get_tiling_settings() -> dict:
+    """Returns the tiling settings, overridable with NETATMO_TILING"""
+    return {**DEFAULT_TILING_SETTINGS, **getattr(settings, "NETATMO_TILING", {})}
 
 
 class NetatmoAPIClient(BaseAsyncAPIClient):
+    # Netatmo stations upload their measures every 5 minutes
+    update_interval = 300
+
     def __init__(self):
         self.token = settings.NETATMO_TOKEN
         self.base_url = settings.NETATMO_BASE_URL
@@ -33,16 +55,65 @@ class NetatmoAPIClient(BaseAsyncAPIClient):
             }
         )
 
-    @log_function_call_with_timing
+    @cached_response
+    @single_flight
+    @metrics.provider_fetch.timed(source="netatmo")
+    @with_deadline
     async def get_weather_data(self, endpoint="getpublicdata", **kwargs) -> dict:
+        """Fetches the stations of the bounding box, splitting it into tiles where needed.
+
+        The box is requested whole first; every tile that comes back thinned out
+        (max_stations) is split into its quadrants, fetched concurrently, as long as the
+        rate limit budget of the provider allows. Stations are deduplicated by "_id".
+        Failed tiles are listed in the "errors" of the payload, the stations of the others
+        are kept; the error is raised when no tile answered.
+        """
         self.set_query_params(**kwargs)
         self.set_auth_token()
+        conf = get_tiling_settings()
+        semaphore = asyncio.Semaphore(conf["concurrency"])
+        stations = {}
+        errors = []
+        tiles = [BoundingBox(*(self.query_params[name] for name in BoundingBox._fields))]
+        for _ in range(conf["max_depth"] + 1):
+            bodies = await asyncio.gather(
+                *(self.fetch_tile(endpoint, tile, semaphore) for tile in tiles), return_exceptions=True
+            )
+            thinned_out = []
+            for tile, body in zip(tiles, bodies):
+                if isinstance(body, Exception):
+                    errors.append(body)
+                    continue
+                for station in body:
+                    stations.setdefault(station["_id"], station)
+                if len(body) >= conf["max_stations"]:
+                    thinned_out.extend(tile.quadrants())
+            if not thinned_out:
+                break
+            # split only the tiles whose quadrants the rate limit lets through, the others keep their stations
+            budget = await self.request_budget()
+            if budget is not None and len(thinned_out) > budget:
+                planned = int(budget) // 4 * 4
+                logger.warning(
+                    f"Rate limit budget of {budget:.0f} Netatmo requests: "
+                    f"{(len(thinned_out) - planned) // 4} thinned out tile(s) not split"
+                )
+                thinned_out = thinned_out[:planned]
+                if not thinned_out:
+                    break
+            tiles = thinned_out
+        if errors and not stations:
+            raise errors[0]
+        payload = {"status": "ok", "body": list(stations.values())}
+        if errors:
+            logger.warning(f"{len(errors)} Netatmo tile(s) failed, {len(stations)} stations fetched: {errors[0]}")
+            payload["errors"] = [f"Tile not fetched: {error}" for error in errors]
+        return payload
+
+    async def fetch_tile(self, endpoint, tile: BoundingBox, semaphore: asyncio.Semaphore) -> list:
+        """Returns the stations of a single tile"""
         url = f"{self.base_url}/{endpoint}"
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.get(url, headers=self.headers, params=self.query_params) as response:
-                    response.raise_for_status()
-                    return await response.text()
-            except aiohttp.ClientError as e:
-                print(f"An error occurred calling Netatmo API: {e}")
-                raise aiohttp.ClientError({"Error": str(e)})
+        params = {**self.query_params, **tile.as_params()}
+        async with semaphore:
+            response = await self.get_json(url, headers=self.headers, params=params)
+        return response.get("body", [])
@@ -1,11 +1,16 @@
-import aiohttp
 from django.conf import settings
 
-from ..services import log_function_call_with_timing
+from .. import metrics
 from .base_client import BaseAsyncAPIClient
+from .resilience import with_deadline
+from .response_cache import cached_response
+from .single_flight import single_flight
 
 
 class OpenWeatherAPIClient(BaseAsyncAPIClient):
+    # OpenWeather refreshes its current weather every 10 minutes
+    update_interval = 600
+
     def __init__(self):
         self.api_key = settings.OPENWEATHER_API_KEY
         self.base_url = settings.OPENWEATHER_BASE_URL
@@ -29,15 +34,11 @@ class OpenWeatherAPIClient(BaseAsyncAPIClient):
             }
         )
 
-    @log_function_call_with_timing
+    @cached_response
+    @single_flight
+    @metrics.provider_fetch.timed(source="openweather")
+    @with_deadline
     async def get_weather_data(self, endpoint="weather", **kwargs) -> dict:
+        """Fetches the current weather, raising a ProviderError (errors.py) when it cannot"""
         self.set_query_params(**kwargs)
-        url = f"{self.base_url}/{endpoint}"
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.get(url, params=self.query_params) as response:
-                    response.raise_for_status()
-                    return await response.json()
-            except aiohttp.ClientError as e:
-                print(f"An error occurred calling OpenWeather API: {e}")
-                return {"Error": str(e)}
+        return await self.get_json(f"{self.base_url}/{endpoint}", params=self.query_params)
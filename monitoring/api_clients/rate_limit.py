@@ -0,0 +1,162 @@
+import asyncio
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import F, Value
+from django.db.models.functions import Greatest, Least
+
+from .. import metrics
+from ..models import RateLimitBucket
+from .errors import RateLimitExceeded
+
+DEFAULT_RATE_LIMIT_SETTINGS = {
+    "backend": "local",  # "local" (per process), "database" (shared by every worker) or None to disable
+    "max_wait": 10,  # seconds a request may wait for a slot before failing
+    # token bucket per provider: sustained requests per second and requests allowed in a burst
+    "limits": {},
+}
+
+
+def get_rate_limit_settings() -> dict:
+    """Returns the rate limit settings, overridable with API_RATE_LIMIT"""
+    return {**DEFAULT_RATE_LIMIT_SETTINGS, **getattr(settings, "API_RATE_LIMIT", {})}
+
+
+class LocalBackend:
+    """Token buckets of this process only"""
+
+    def __init__(self) -> None:
+        self._buckets: dict = {}
+        self._lock = threading.Lock()
+
+    async def take(self, name: str, rate: float, burst: float) -> float:
+        """Takes a token if one is available; returns 0, or the seconds until the next one"""
+        with self._lock:
+            current = time.monotonic()
+            tokens, updated_at = self._buckets.get(name, (burst, current))
+            tokens = min(burst, tokens + (current - updated_at) * rate)
+            if tokens >= 1:
+                self._buckets[name] = (tokens - 1, current)
+                return 0.0
+            self._buckets[name] = (tokens, current)
+            return (1 - tokens) / rate
+
+    async def peek(self, name: str, rate: float, burst: float) -> float:
+        """Returns the tokens available now, without taking any"""
+        with self._lock:
+            current = time.monotonic()
+            tokens, updated_at = self._buckets.get(name, (burst, current))
+            return min(burst, tokens + (current - updated_at) * rate)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buckets.clear()
+
+
+class DatabaseBackend:
+    """Token buckets stored in RateLimitBucket rows, shared by the web server and the Django-Q workers.
+
+    A token is taken with a single conditional UPDATE refilling the bucket: two processes
+    can never both take the last one.
+    """
+
+    async def take(self, name: str, rate: float, burst: float) -> float:
+        return await sync_to_async(self.take_sync)(name, rate, burst)
+
+    def take_sync(self, name: str, rate: float, burst: float) -> float:
+        current = time.time()
+        available = Least(
+            Value(float(burst)), F("tokens") + Greatest(Value(current) - F("updated_at"), Value(0.0)) * Value(rate)
+        )
+        taken = (
+            RateLimitBucket.objects.filter(name=name)
+            .alias(available=available)
+            .filter(available__gte=1)
+            .update(tokens=available - 1, updated_at=Value(current))
+        )
+        if taken:
+            return 0.0
+        bucket, created = RateLimitBucket.objects.get_or_create(
+            name=name, defaults={"tokens": burst - 1, "updated_at": current}
+        )
+        if created:
+            return 0.0
+        tokens = min(burst, bucket.tokens + max(current - bucket.updated_at, 0) * rate)
+        if tokens >= 1:
+            # the bucket was created by another process meanwhile: try again at once
+            return 0.001
+        return (1 - tokens) / rate
+
+    async def peek(self, name: str, rate: float, burst: float) -> float:
+        bucket = await RateLimitBucket.objects.filter(name=name).values_list("tokens", "updated_at").afirst()
+        if bucket is None:
+            return burst
+        tokens, updated_at = bucket
+        return min(burst, tokens + max(time.time() - updated_at, 0) * rate)
+
+    def clear(self) -> None:
+        RateLimitBucket.objects.all().delete()
+
+
+class RateLimiter:
+    """Makes the provider requests wait for a token of their provider bucket"""
+
+    def __init__(self, backend, limits: dict, max_wait: float) -> None:
+        self.backend = backend
+        self.limits = limits
+        self.max_wait = max_wait
+
+    async def acquire(self, source: str) -> float:
+        """Waits for a request slot of the provider; returns the seconds waited"""
+        limit = self.limits.get(source)
+        if limit is None:
+            return 0.0
+        started = time.monotonic()
+        waited = 0.0
+        while True:
+            wait = await self.backend.take(source, limit["rate"], limit["burst"])
+            if wait <= 0:
+                break
+            if waited + wait > self.max_wait:
+                metrics.rate_limit_rejected.inc(source=source)
+                raise RateLimitExceeded(source, wait)
+            await asyncio.sleep(wait)
+            waited = time.monotonic() - started
+        metrics.rate_limit_wait.observe(waited, source=source)
+        return waited
+
+    async def budget(self, source: str) -> float | None:
+        """Requests of the provider that can get a slot within max_wait from now, None when unlimited.
+
+        A forecast, not a reservation: the other processes draw from the same bucket.
+        """
+        limit = self.limits.get(source)
+        if limit is None:
+            return None
+        tokens = await self.backend.peek(source, limit["rate"], limit["burst"])
+        return tokens + self.max_wait * limit["rate"]
+
+
+_rate_limiter: RateLimiter | None = None
+
+
+def get_rate_limiter() -> RateLimiter | None:
+    """Returns the rate limiter configured by API_RATE_LIMIT, or None when disabled"""
+    global _rate_limiter
+    conf = get_rate_limit_settings()
+    if conf["backend"] is None:
+        return None
+    if _rate_limiter is None:
+        backend = DatabaseBackend() if conf["backend"] == "database" else LocalBackend()
+        _rate_limiter = RateLimiter(backend, conf["limits"], conf["max_wait"])
+    return _rate_limiter
+
+
+def reset_rate_limiter() -> None:
+    """Forgets the buckets of the local backend and rebuilds the limiter from the settings on the next use"""
+    global _rate_limiter
+    if _rate_limiter is not None and isinstance(_rate_limiter.backend, LocalBackend):
+        _rate_limiter.backend.clear()
+    _rate_limiter = None
@@ -0,0 +1,172 @@
+import asyncio
+import contextvars
+import functools
+import logging
+import random
+import threading
+import time
+
+import aiohttp
+from django.conf import settings
+
+from .. import metrics
+from .errors import (CircuitOpen, DeadlineExceeded, ProviderError, ProviderResponseError, ProviderThrottled,
+                     ProviderUnavailable)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RESILIENCE_SETTINGS = {
+    "deadline": 20,  # seconds for a whole get_weather_data call, retries and rate limit waits included
+    "attempt_timeout": 10,  # seconds for a single request
+    "retries": 2,  # further attempts of a request after a 5xx, 429, timeout or connection error
+    "backoff": 0.5,  # seconds, base of the exponential backoff; the delay is drawn in [0, base * 2^attempt]
+    "max_backoff": 8,
+    "failure_threshold": 5,  # consecutive failures opening the circuit of a provider
+    "reset_timeout": 60,  # seconds the circuit stays open before a trial request is let through
+}
+# the transient failures: retried, and counted by the circuit breaker
+TRANSIENT_ERRORS = (ProviderUnavailable, aiohttp.ClientError, asyncio.TimeoutError)
+
+_deadline: contextvars.ContextVar = contextvars.ContextVar("provider_deadline", default=None)
+
+
+def get_resilience_settings() -> dict:
+    """Returns the retry, deadline and circuit breaker settings, overridable with API_RESILIENCE"""
+    return {**DEFAULT_RESILIENCE_SETTINGS, **getattr(settings, "API_RESILIENCE", {})}
+
+
+class CircuitBreaker:
+    """Circuit of a provider in this process.
+
+    Closed, it lets every request through; failure_threshold transient failures in a row
+    open it, and requests then fail at once. After reset_timeout one trial request is let
+    through (half-open): its success closes the circuit, its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int, reset_timeout: float) -> None:
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.trial = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if self.trial or time.monotonic() >= self.opened_at + self.reset_timeout else "open"
+
+    def before_request(self, source: str) -> None:
+        """Raises CircuitOpen unless the request may go to the provider"""
+        with self._lock:
+            if self.opened_at is None:
+                return
+            remaining = self.opened_at + self.reset_timeout - time.monotonic()
+            if remaining > 0 or self.trial:
+                metrics.circuit_open.inc(source=source)
+                raise CircuitOpen(source, max(remaining, 0))
+            self.trial = True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.trial or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.trial = False
+
+    def release(self) -> None:
+        """The request stopped before reaching the provider: a later one makes the trial"""
+        with self._lock:
+            self.trial = False
+
+
+_breakers: dict = {}
+
+
+def get_circuit_breaker(source: str) -> CircuitBreaker:
+    breaker = _breakers.get(source)
+    if breaker is None:
+        conf = get_resilience_settings()
+        breaker = _breakers.setdefault(source, CircuitBreaker(conf["failure_threshold"], conf["reset_timeout"]))
+    return breaker
+
+
+def reset_circuit_breakers() -> None:
+    """Closes every circuit, rebuilding them from the settings on the next use"""
+    _breakers.clear()
+
+
+def with_deadline(get_weather_data):
+    """Gives the whole call, every request and retry included, the API_RESILIENCE deadline"""
+
+    @functools.wraps(get_weather_data)
+    async def wrapper(*args, **kwargs):
+        if _deadline.get() is not None:
+            return await get_weather_data(*args, **kwargs)
+        token = _deadline.set(time.monotonic() + get_resilience_settings()["deadline"])
+        try:
+            return await get_weather_data(*args, **kwargs)
+        finally:
+            _deadline.reset(token)
+
+    return wrapper
+
+
+async def call_with_retries(source: str, request):
+    """Awaits request() through the circuit breaker of the provider, retrying the transient failures.
+
+    Every attempt is bounded by attempt_timeout and by the deadline of the call; the
+    retries wait an exponential backoff with full jitter, or the Retry-After of a 429.
+    """
+    conf = get_resilience_settings()
+    deadline = _deadline.get() or time.monotonic() + conf["deadline"]
+    breaker = get_circuit_breaker(source)
+    attempt = 0
+    while True:
+        breaker.before_request(source)
+        remaining = deadline - time.monotonic()
+        retry_after = None
+        try:
+            if remaining <= 0:
+                raise DeadlineExceeded(source, "deadline reached before the request")
+            async with asyncio.timeout(min(conf["attempt_timeout"], remaining)):
+                response = await request()
+        except ProviderThrottled as e:
+            # the provider answered: it is up
+            breaker.record_success()
+            error, retry_after = e, e.retry_after
+        except ProviderResponseError:
+            breaker.record_success()
+            raise
+        except TRANSIENT_ERRORS as e:
+            breaker.record_failure()
+            error = e
+        except BaseException:
+            breaker.release()
+            raise
+        else:
+            breaker.record_success()
+            return response
+
+        if time.monotonic() >= deadline:
+            raise DeadlineExceeded(source, f"deadline reached after {attempt + 1} attempt(s)") from error
+        if attempt >= conf["retries"]:
+            if isinstance(error, ProviderError):
+                raise error
+            raise ProviderUnavailable(source, str(error) or type(error).__name__) from error
+        delay = random.uniform(0, min(conf["max_backoff"], conf["backoff"] * 2**attempt))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        if time.monotonic() + delay >= deadline:
+            raise DeadlineExceeded(source, f"no time left to retry after: {error}") from error
+        attempt += 1
+        metrics.provider_retries.inc(source=source)
+        logger.warning(f"Retrying {source} request in {delay:.2f}s (attempt {attempt + 1}): {error}")
+        await asyncio.sleep(delay)
@@ -0,0 +1,153 @@
+import functools
+import inspect
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .. import metrics
+
+DEFAULT_RESPONSE_CACHE_SETTINGS = {
+    "backend": "local",  # "local" (per process), "django" (shared cache framework) or None to disable
+    "cache_alias": "default",  # Django cache used by the "django" backend
+    "max_size": 1024,  # responses kept by the "local" backend
+    "precision": 3,  # decimals of the coordinates in the key (~100 m)
+    "ttl": {},  # seconds per provider, defaults to the client update_interval
+}
+
+
+def round_value(value, precision: int):
+    try:
+        return round(float(value), precision)
+    except (TypeError, ValueError):
+        return value
+
+
+def request_key(prefix: str, source: str, endpoint: str, params: dict, precision: int) -> str:
+    """Identity of a provider request: provider, endpoint and parameters, coordinates rounded to precision"""
+    values = ",".join(f"{name}={round_value(value, precision)}" for name, value in sorted(params.items()))
+    return f"{prefix}:{source}:{endpoint}:{values}"
+
+
+class LocalBackend:
+    """In-process LRU store with a TTL per entry"""
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    async def set(self, key, value, ttl: float) -> None:
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+class DjangoCacheBackend:
+    """Store shared between processes through Django's cache framework"""
+
+    def __init__(self, alias: str) -> None:
+        self.cache = caches[alias]
+
+    async def get(self, key):
+        return await self.cache.aget(key)
+
+    async def set(self, key, value, ttl: float) -> None:
+        await self.cache.aset(key, value, ttl)
+
+    def clear(self) -> None:
+        self.cache.clear()
+
+
+class ResponseCache:
+    """Caches provider responses by provider, endpoint and rounded coordinates"""
+
+    def __init__(self, backend, precision: int, ttl: dict) -> None:
+        self.backend = backend
+        self.precision = precision
+        self.ttl = ttl
+        self.hits: Counter = Counter()
+        self.misses: Counter = Counter()
+
+    def make_key(self, source: str, endpoint: str, params: dict) -> str:
+        return request_key("weather-response", source, endpoint, params, self.precision)
+
+    async def get_or_fetch(self, client, endpoint: str, params: dict, fetch):
+        key = self.make_key(client.source, endpoint, params)
+        response = await self.backend.get(key)
+        if response is not None:
+            self.hits[client.source] += 1
+            metrics.response_cache.inc(source=client.source, result="hit")
+            return response
+        self.misses[client.source] += 1
+        metrics.response_cache.inc(source=client.source, result="miss")
+        response = await fetch()
+        # failures raise a ProviderError and are never stored; an {"Error": ...} payload is not served again,
+        # nor a partial one listing its "errors" (Netatmo tiles)
+        if not (isinstance(response, dict) and ("Error" in response or "errors" in response)):
+            await self.backend.set(key, response, self.ttl.get(client.source, client.update_interval))
+        return response
+
+    def stats(self) -> dict:
+        return {"hits": dict(self.hits), "misses": dict(self.misses)}
+
+
+_response_cache: ResponseCache | None = None
+
+
+def get_response_cache() -> ResponseCache | None:
+    """Returns the response cache configured by API_RESPONSE_CACHE, or None when disabled"""
+    global _response_cache
+    conf = {**DEFAULT_RESPONSE_CACHE_SETTINGS, **getattr(settings, "API_RESPONSE_CACHE", {})}
+    if conf["backend"] is None:
+        return None
+    if _response_cache is None:
+        if conf["backend"] == "django":
+            backend = DjangoCacheBackend(conf["cache_alias"])
+        else:
+            backend = LocalBackend(conf["max_size"])
+        _response_cache = ResponseCache(backend, conf["precision"], conf["ttl"])
+    return _response_cache
+
+
+def reset_response_cache() -> None:
+    """Empties the cache and rebuilds it from the settings on the next use"""
+    global _response_cache
+    if _response_cache is not None:
+        _response_cache.backend.clear()
+    _response_cache = None
+
+
+def cached_response(get_weather_data):
+    """Serves get_weather_data from the response cache while the provider has no newer data"""
+    default_endpoint = inspect.signature(get_weather_data).parameters["endpoint"].default
+
+    @functools.wraps(get_weather_data)
+    async def wrapper(self, endpoint=default_endpoint, **kwargs):
+        response_cache = get_response_cache()
+        if response_cache is None:
+            return await get_weather_data(self, endpoint, **kwargs)
+        return await response_cache.get_or_fetch(
+            self, endpoint, kwargs, lambda: get_weather_data(self, endpoint, **kwargs)
+        )
+
+    return wrapper
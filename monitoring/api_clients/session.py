@@ -0,0 +1,137 @@
+import asyncio
+import atexit
+import logging
+import os
+from multiprocessing import util as mp_util
+from weakref import WeakKeyDictionary
+
+import aiohttp
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SESSION_SETTINGS = {
+    "limit": 100,  # total connections in the pool
+    "limit_per_host": 10,  # connections kept open towards a single provider
+    "keepalive_timeout": 30,  # seconds an idle connection stays in the pool
+    "ttl_dns_cache": 300,  # seconds a resolved host is cached
+    "total_timeout": 30,  # seconds allowed for a whole request
+}
+
+# One session per event loop: aiohttp sessions cannot be shared across loops
+_sessions: "WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]" = WeakKeyDictionary()
+# Task closing the session of a loop other than _loop when that loop ends
+_closers: "WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Task]" = WeakKeyDictionary()
+# Event loop kept alive between Django-Q tasks so pooled connections survive
+_loop: asyncio.AbstractEventLoop | None = None
+
+
+def get_session_settings() -> dict:
+    """Returns the connection pool settings, overridable with API_CLIENT_SESSION"""
+    return {**DEFAULT_SESSION_SETTINGS, **getattr(settings, "API_CLIENT_SESSION", {})}
+
+
+def create_session(**session_kwargs) -> aiohttp.ClientSession:
+    """Creates a session backed by a keep-alive connector with DNS caching"""
+    conf = get_session_settings()
+    connector = aiohttp.TCPConnector(
+        limit=conf["limit"],
+        limit_per_host=conf["limit_per_host"],
+        keepalive_timeout=conf["keepalive_timeout"],
+        ttl_dns_cache=conf["ttl_dns_cache"],
+        use_dns_cache=True,
+    )
+    return aiohttp.ClientSession(
+        connector=connector,
+        timeout=aiohttp.ClientTimeout(total=conf["total_timeout"]),
+        **session_kwargs,
+    )
+
+
+def get_session() -> aiohttp.ClientSession:
+    """Returns the pooled session bound to the running event loop.
+
+    The session of a loop other than the process-wide one is closed when that loop ends:
+    async_to_sync (async views under WSGI) runs a new loop per call with asyncio.run.
+    """
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        session = create_session()
+        _sessions[loop] = session
+        if loop is not _loop:
+            _closers[loop] = loop.create_task(_close_at_loop_end(loop, session))
+    return session
+
+
+async def _close_at_loop_end(loop, session: aiohttp.ClientSession) -> None:
+    # asyncio.run cancels the tasks left once its coroutine returns, before closing the loop
+    try:
+        await loop.create_future()
+    finally:
+        # the task holds the loop: forget it, or the weak keys would never be released
+        if _closers.get(loop) is asyncio.current_task():
+            del _closers[loop]
+        if _sessions.get(loop) is session:
+            del _sessions[loop]
+        if not session.closed:
+            await session.close()
+
+
+async def close_session() -> None:
+    """Closes the pooled session bound to the running event loop"""
+    loop = asyncio.get_running_loop()
+    session = _sessions.pop(loop, None)
+    closer = _closers.pop(loop, None)
+    if closer is not None:
+        closer.cancel()
+    if session is not None and not session.closed:
+        await session.close()
+
+
+def run(coro):
+    """Runs a coroutine on the process-wide event loop.
+
+    Unlike asyncio.run, the loop (and therefore the pooled connections) is
+    reused by the following calls made from the same worker process.
+    """
+    global _loop
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+        # Django-Q workers are multiprocessing children: they skip atexit when
+        # recycled but still run the multiprocessing finalizers
+        mp_util.Finalize(None, shutdown, exitpriority=10)
+    return _loop.run_until_complete(coro)
+
+
+def shutdown() -> None:
+    """Closes the pooled session and the process-wide event loop"""
+    global _loop
+    loop, _loop = _loop, None
+    if loop is None or loop.is_closed():
+        return
+    try:
+        loop.run_until_complete(_close_loop_session(loop))
+        loop.run_until_complete(loop.shutdown_asyncgens())
+    except Exception as e:
+        logger.warning(f"Error while closing the API client session: {e}")
+    finally:
+        loop.close()
+
+
+async def _close_loop_session(loop) -> None:
+    session = _sessions.pop(loop, None)
+    if session is not None and not session.closed:
+        await session.close()
+
+
+def _reset_after_fork() -> None:
+    # Sockets inherited from the parent must never be reused by the child
+    global _loop
+    _loop = None
+    _sessions.clear()
+    _closers.clear()
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+atexit.register(shutdown)
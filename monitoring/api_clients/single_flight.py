@@ -0,0 +1,128 @@
+import asyncio
+import concurrent.futures
+import functools
+import inspect
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .. import metrics
+from .response_cache import request_key
+
+DEFAULT_SINGLE_FLIGHT_SETTINGS = {
+    "enabled": True,  # identical concurrent requests of this process share one call
+    # also share them with the other processes (web server, Django-Q workers) through a lock in
+    # cache_alias: atomic with Redis, Memcached or the database cache, best effort with the file cache
+    "shared": False,
+    "cache_alias": "status",
+    "lock_timeout": 30,  # seconds a lock outlives a crashed process, and the longest wait for it
+    "result_ttl": 30,  # seconds the response stays readable by the processes that waited for it
+    "poll_interval": 0.1,  # seconds between two checks of a lock held by another process
+    "precision": 3,  # decimals of the coordinates in the key, as in API_RESPONSE_CACHE
+}
+
+
+def get_single_flight_settings() -> dict:
+    """Returns the request coalescing settings, overridable with API_SINGLE_FLIGHT"""
+    return {**DEFAULT_SINGLE_FLIGHT_SETTINGS, **getattr(settings, "API_SINGLE_FLIGHT", {})}
+
+
+class SingleFlight:
+    """Calls in flight by key: the first caller runs the call, the concurrent ones await its outcome.
+
+    The outcome is a thread-safe future, so that callers on other event loops of the
+    process (sync views, one loop per thread) share it too.
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict = {}
+        self._lock = threading.Lock()
+
+    async def run(self, key: str, call, source: str):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = concurrent.futures.Future()
+        if not leader:
+            metrics.single_flight.inc(source=source, role="follower")
+            try:
+                return await asyncio.wrap_future(future)
+            except asyncio.CancelledError:
+                if asyncio.current_task().cancelling():
+                    raise
+                # the leader was cancelled, not this caller: make the call again
+                return await self.run(key, call, source)
+        metrics.single_flight.inc(source=source, role="leader")
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+
+flights = SingleFlight()
+
+
+async def run_shared(key: str, call, source: str, conf: dict):
+    """Runs the call under a lock shared by every process; a process finding it held waits for the result"""
+    cache = caches[conf["cache_alias"]]
+    lock_key = f"{key}:lock"
+    result_key = f"{key}:result"
+    token = uuid.uuid4().hex
+    while True:
+        if await cache.aadd(lock_key, token, conf["lock_timeout"]):
+            try:
+                result = await call()
+                await cache.aset(result_key, result, conf["result_ttl"])
+                return result
+            finally:
+                if await cache.aget(lock_key) == token:
+                    await cache.adelete(lock_key)
+        give_up = time.monotonic() + conf["lock_timeout"]
+        while await cache.aget(lock_key) is not None and time.monotonic() < give_up:
+            await asyncio.sleep(conf["poll_interval"])
+        result = await cache.aget(result_key)
+        if result is not None:
+            metrics.single_flight.inc(source=source, role="remote")
+            return result
+        # the other process failed: make the call here
+
+
+async def coalesce(source: str, endpoint: str, params: dict, call, shared: bool = False):
+    """Awaits call(), or the identical call already in flight; shared extends it to the other processes"""
+    conf = get_single_flight_settings()
+    if not conf["enabled"]:
+        return await call()
+    key = request_key("single-flight", source, endpoint, params, conf["precision"])
+    if shared and conf["shared"]:
+        return await flights.run(key, functools.partial(run_shared, key, call, source, conf), source)
+    return await flights.run(key, call, source)
+
+
+def single_flight(get_weather_data):
+    """Identical concurrent get_weather_data calls share one provider request, across processes when shared"""
+    default_endpoint = inspect.signature(get_weather_data).parameters["endpoint"].default
+
+    @functools.wraps(get_weather_data)
+    async def wrapper(self, endpoint=default_endpoint, **kwargs):
+        return await coalesce(
+            self.source, endpoint, kwargs, lambda: get_weather_data(self, endpoint, **kwargs), shared=True
+        )
+
+    return wrapper
@@ -0,0 +1,25 @@
+from typing import NamedTuple
+
+
+class BoundingBox(NamedTuple):
+    """Area delimited by its north-east and south-west corners, in the getpublicdata format"""
+
+    lat_ne: float
+    lon_ne: float
+    lat_sw: float
+    lon_sw: float
+
+    def quadrants(self) -> list["BoundingBox"]:
+        """Splits the box into its four quadrants"""
+        lat_mid = (self.lat_ne + self.lat_sw) / 2
+        lon_mid = (self.lon_ne + self.lon_sw) / 2
+        return [
+            BoundingBox(self.lat_ne, self.lon_ne, lat_mid, lon_mid),
+            BoundingBox(self.lat_ne, lon_mid, lat_mid, self.lon_sw),
+            BoundingBox(lat_mid, self.lon_ne, self.lat_sw, lon_mid),
+            BoundingBox(lat_mid, lon_mid, self.lat_sw, self.lon_sw),
+        ]
+
+    def as_params(self) -> dict:
+        return self._asdict()
+
@@ -0,0 +1,396 @@
+import gzip
+import io
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import NamedTuple
+
+import django
+from django.apps import apps
+from django.conf import settings
+from django.db import connection, connections, transaction
+
+from .decoders import DECODERS, DecodeError
+from .models import WeatherData
+from .rollups import rebuild_rollups
+from .stations import get_or_create_stations, station_key
+
+DEFAULT_BACKFILL_SETTINGS = {
+    "workers": None,  # processes parsing the dumps, None: one per CPU
+    "batch_size": 10000,  # readings per insert transaction
+    "split_bytes": 16 * 1024 * 1024,  # JSON Lines files are parsed in ranges of this size, in parallel
+    "state_file": "backfill-state.json",  # the parts already loaded, to resume an interrupted backfill
+    "progress_seconds": 5,
+}
+DUMP_SUFFIXES = (".json", ".jsonl", ".ndjson")
+JSON_LINES_SUFFIXES = (".jsonl", ".ndjson")
+TABLE = WeatherData._meta.db_table
+COLUMNS = ("station_id", "timestamp", "temperature", "feels_like", "humidity", "pressure")
+
+
+def get_backfill_settings() -> dict:
+    """Returns the backfill settings, overridable with BACKFILL"""
+    return {**DEFAULT_BACKFILL_SETTINGS, **getattr(settings, "BACKFILL", {})}
+
+
+class WorkItem(NamedTuple):
+    """A part of a dump parsed by one worker: a byte range of a JSON Lines file, or a whole file"""
+
+    path: str
+    start: int
+    end: int
+    split: bool
+
+    @property
+    def key(self) -> str:
+        return f"{self.path}:{self.start}-{self.end}"
+
+
+class ParsedItem(NamedTuple):
+    """What a worker hands to the writer: stations by (source, source_id) and reading tuples"""
+
+    key: str
+    stations: dict
+    # (station key, timestamp, temperature, feels_like, humidity, pressure)
+    readings: list
+    documents: int
+    errors: int
+
+
+def find_dumps(paths) -> list:
+    """The dump files among the paths, directories searched recursively, gzipped files included"""
+    files = []
+    for path in map(Path, paths):
+        candidates = sorted(path.rglob("*")) if path.is_dir() else [path]
+        for candidate in candidates:
+            name = candidate.name.removesuffix(".gz")
+            if candidate.is_file() and name.endswith(DUMP_SUFFIXES):
+                files.append(candidate.resolve())
+    return files
+
+
+def plan_work(files, split_bytes: int) -> list:
+    """Splits the plain JSON Lines files into ranges of split_bytes, other files are parsed whole"""
+    items = []
+    for path in files:
+        size = path.stat().st_size
+        if path.name.endswith(JSON_LINES_SUFFIXES) and size:
+            items.extend(
+                WorkItem(str(path), start, min(start + split_bytes, size), True)
+                for start in range(0, size, split_bytes)
+            )
+        else:
+            items.append(WorkItem(str(path), 0, size, False))
+    return items
+
+
+def open_text(path: str):
+    return gzip.open(path, "rt", encoding="utf-8") if path.endswith(".gz") else open(path, encoding="utf-8")
+
+
+def iter_documents(stream, block_size: int = 1024 * 1024):
+    """JSON documents read one after the other from a text stream: one document, JSON Lines or concatenated.
+
+    A document is decoded once fully buffered; the block read grows while it does not fit,
+    so that a large document costs a linear number of decode attempts.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    size = block_size
+    eof = False
+    while True:
+        # skip the whitespace between documents
+        while position < len(buffer) and buffer[position].isspace():
+            position += 1
+        if position == len(buffer):
+            if eof:
+                return
+            buffer, position = stream.read(size), 0
+            eof = not buffer
+            continue
+        try:
+            document, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            block = stream.read(size)
+            eof = not block
+            buffer = buffer[position:] + block
+            position = 0
+            size *= 2
+            continue
+        size = block_size
+        yield document
+
+
+def iter_lines(item: WorkItem):
+    """Lines of the byte range of a JSON Lines file: those starting in it, the first one included"""
+    with open(item.path, "rb") as f:
+        if item.start:
+            # the line running over the start belongs to the previous range
+            f.seek(item.start - 1)
+            f.readline()
+        while f.tell() < item.end:
+            line = f.readline()
+            if not line:
+                return
+            yield line
+
+
+def detect_source(response) -> str | None:
+    """Provider of a response: Netatmo answers with a "body" list, OpenWeather with "main" measures"""
+    if "body" in response:
+        return "netatmo"
+    if "main" in response:
+        return "openweather"
+    return None
+
+
+def parse_item(item: WorkItem, source: str | None = None) -> ParsedItem:
+    """Decodes the provider responses of a work item with the compiled decoders, in a worker process"""
+    stations = {}
+    readings = []
+    documents = 0
+    errors = 0
+
+    def responses():
+        nonlocal errors
+        if item.split:
+            for line in iter_lines(item):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    errors += 1
+        else:
+            with open_text(item.path) as stream:
+                yield from iter_documents(stream)
+
+    for document in responses():
+        # a dump may hold a list of responses as well
+        for response in document if isinstance(document, list) else [document]:
+            documents += 1
+            response_source = source or (detect_source(response) if isinstance(response, dict) else None)
+            if response_source is None:
+                errors += 1
+                continue
+            decoder = DECODERS[response_source]
+            for record in decoder.decode_payload(response):
+                try:
+                    station, reading = decoder.decode(record)
+                except DecodeError:
+                    errors += 1
+                    continue
+                key = station_key(station)
+                stations.setdefault(key, station)
+                readings.append(
+                    (
+                        key,
+                        reading["timestamp"],
+                        reading["temperature"],
+                        reading.get("feels_like"),
+                        reading["humidity"],
+                        reading["pressure"],
+                    )
+                )
+    return ParsedItem(item.key, stations, readings, documents, errors)
+
+
+def setup_worker() -> None:
+    """Initializes Django in a pool process started without fork"""
+    if not apps.ready:
+        django.setup()
+
+
+def copy_readings(rows) -> None:
+    """PostgreSQL: COPY into a temporary table, then one INSERT ... ON CONFLICT DO NOTHING"""
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(r"\N" if value is None else str(value) for value in row))
+        buffer.write("\n")
+    buffer.seek(0)
+    columns = ", ".join(f'"{column}"' for column in COLUMNS)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS backfill_readings (station_id bigint, "
+            '"timestamp" timestamp with time zone, temperature double precision, feels_like double precision, '
+            "humidity integer, pressure double precision) ON COMMIT DELETE ROWS"
+        )
+        cursor.copy_expert(f"COPY backfill_readings ({columns}) FROM STDIN", buffer)
+        cursor.execute(
+            f'INSERT INTO "{TABLE}" ({columns}) SELECT {columns} FROM backfill_readings '
+            f'ON CONFLICT (station_id, "timestamp") DO NOTHING'
+        )
+
+
+def insert_readings(rows) -> None:
+    """Inserts (station_id, timestamp, ...) rows in one transaction, skipping those already stored"""
+    with transaction.atomic():
+        if connection.vendor == "postgresql":
+            copy_readings(rows)
+        else:
+            WeatherData.objects.bulk_create(
+                (WeatherData(**dict(zip(COLUMNS, row))) for row in rows), ignore_conflicts=True
+            )
+
+
+def write_item(parsed: ParsedItem, batch_size: int) -> dict:
+    """Stores the readings of a parsed item in batches; returns the UTC days written per station id"""
+    stations = get_or_create_stations(parsed.stations.values())
+    days = {}
+    for index in range(0, len(parsed.readings), batch_size):
+        rows = []
+        for key, timestamp, *values in parsed.readings[index : index + batch_size]:
+            station_id = stations[key].id
+            rows.append((station_id, timestamp, *values))
+            days.setdefault(station_id, set()).add(timestamp.astimezone(timezone.utc).date().toordinal())
+        insert_readings(rows)
+    return days
+
+
+def to_runs(days) -> list:
+    """Sorted day ordinals as [first, last] runs of consecutive days"""
+    runs = []
+    for day in sorted(days):
+        if runs and day == runs[-1][1] + 1:
+            runs[-1][1] = day
+        else:
+            runs.append([day, day])
+    return runs
+
+
+class BackfillState:
+    """Work items already stored and days whose rollups are still to rebuild, saved to a JSON file.
+
+    The file is rewritten (atomically) once the readings of an item are committed: an
+    interrupted backfill resumes with the items left, the conflicting rows of a partly
+    written item being skipped by the inserts.
+    """
+
+    def __init__(self, path) -> None:
+        self.path = Path(path)
+        self.done = set()
+        self.days = {}
+        if self.path.exists():
+            state = json.loads(self.path.read_text())
+            self.done = set(state["done"])
+            self.days = {
+                int(station_id): {day for first, last in runs for day in range(first, last + 1)}
+                for station_id, runs in state["days"].items()
+            }
+
+    def complete(self, key: str, days: dict) -> None:
+        self.done.add(key)
+        for station_id, station_days in days.items():
+            self.days.setdefault(station_id, set()).update(station_days)
+        self.save()
+
+    def save(self) -> None:
+        state = {
+            "done": sorted(self.done),
+            "days": {str(station_id): to_runs(days) for station_id, days in self.days.items()},
+        }
+        partial = self.path.with_name(f".{self.path.name}.partial")
+        partial.write_text(json.dumps(state))
+        os.replace(partial, self.path)
+
+
+def rebuild_backfilled_rollups(state: BackfillState) -> int:
+    """Rebuilds the rollups of the days written, run by run so that archived months in between are kept"""
+    written = 0
+    for station_id, days in sorted(state.days.items()):
+        for first, last in to_runs(days):
+            since = datetime.combine(date.fromordinal(first), datetime.min.time(), tzinfo=timezone.utc)
+            until = since + timedelta(days=last - first + 1)
+            written += rebuild_rollups(since=since, station_ids=[station_id], until=until)
+    state.days = {}
+    state.save()
+    return written
+
+
+def run_backfill(paths, source=None, workers=None, state_file=None, restart=False, progress=None) -> dict:
+    """Loads provider dumps: a pool of processes decodes them, this process alone writes the readings.
+
+    Returns the totals; ``progress`` is called with them every BACKFILL["progress_seconds"].
+    """
+    conf = get_backfill_settings()
+    workers = conf["workers"] if workers is None else workers
+    state = BackfillState(state_file or conf["state_file"])
+    if restart:
+        state.done = set()
+    items = plan_work(find_dumps(paths), conf["split_bytes"])
+    pending = [item for item in items if item.key not in state.done]
+    totals = {
+        "items": len(items),
+        "done": len(items) - len(pending),
+        "documents": 0,
+        "readings": 0,
+        "errors": 0,
+        "failed": [],
+        "rollups": 0,
+    }
+    started = last_report = time.monotonic()
+
+    def store(parsed: ParsedItem) -> None:
+        nonlocal last_report
+        state.complete(parsed.key, write_item(parsed, conf["batch_size"]))
+        totals["done"] += 1
+        totals["documents"] += parsed.documents
+        totals["readings"] += len(parsed.readings)
+        totals["errors"] += parsed.errors
+        totals["elapsed"] = time.monotonic() - started
+        if progress and time.monotonic() - last_report >= conf["progress_seconds"]:
+            last_report = time.monotonic()
+            progress(totals)
+
+    def fail(item: WorkItem, error: BaseException) -> None:
+        # left out of the state: the next run retries the item
+        totals["failed"].append((item.key, f"{type(error).__name__}: {error}"))
+
+    def process(item: WorkItem, parse) -> None:
+        """Parses then stores an item; whatever fails, the other items are still loaded"""
+        try:
+            store(parse())
+        except Exception as e:
+            fail(item, e)
+
+    if workers == 0:
+        for item in pending:
+            process(item, lambda: parse_item(item, source))
+    else:
+        # the forked workers must not share the connections of the writer
+        connections.close_all()
+        workers = workers or os.cpu_count()
+        window = 2 * workers
+        queue = iter(pending)
+        broken = True
+        while broken:
+            broken = False
+            with ProcessPoolExecutor(max_workers=workers, initializer=setup_worker) as executor:
+                futures = {}
+                while not broken:
+                    # a bounded number of items parsed ahead of the writer: the memory stays flat
+                    for item in queue:
+                        futures[executor.submit(parse_item, item, source)] = item
+                        if len(futures) >= window:
+                            break
+                    if not futures:
+                        break
+                    completed, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    if any(isinstance(future.exception(), BrokenProcessPool) for future in completed):
+                        # a worker died (killed, out of memory): the items in flight are lost with the pool
+                        broken = True
+                        completed, _ = wait(futures)
+                    for future in completed:
+                        process(futures.pop(future), future.result)
+            # the items left go on in a new pool
+
+    totals["rollups"] = rebuild_backfilled_rollups(state)
+    totals["elapsed"] = time.monotonic() - started
+    return totals
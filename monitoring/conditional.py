@@ -0,0 +1,89 @@
+from datetime import datetime
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from django.utils.timezone import now
+
+DEFAULT_CONDITIONAL_SETTINGS = {
+    "cache_alias": "status",  # cache shared by the processes that change the data and the web server
+    "task_granularity": 60,  # seconds: task counts also change as tasks leave the last hour
+}
+MODIFIED_KEY = "modified"
+
+
+def get_conditional_settings() -> dict:
+    """Returns the conditional responses settings, overridable with CONDITIONAL_RESPONSES"""
+    return {**DEFAULT_CONDITIONAL_SETTINGS, **getattr(settings, "CONDITIONAL_RESPONSES", {})}
+
+
+def modified_key(scope: str) -> str:
+    return f"{MODIFIED_KEY}:{scope}"
+
+
+def touch(*scopes: str) -> None:
+    """Records that the data of the scopes (e.g. "readings:<station id>") changed now"""
+    if scopes:
+        caches[get_conditional_settings()["cache_alias"]].set_many(
+            {modified_key(scope): now() for scope in scopes}, timeout=None
+        )
+
+
+def last_modified(scope: str) -> datetime:
+    """When the data of the scope last changed; an unknown scope counts as changed now"""
+    return caches[get_conditional_settings()["cache_alias"]].get_or_set(modified_key(scope), now, timeout=None)
+
+
+def set_validators(response, etag: str, modified: datetime | None):
+    if response.status_code in (200, 304):
+        response.headers.setdefault("ETag", etag)
+        if modified is not None:
+            response.headers.setdefault("Last-Modified", http_date(modified.timestamp()))
+        # revalidate every time instead of letting the browser guess a freshness from Last-Modified
+        patch_cache_control(response, no_cache=True)
+        # HTMX requests get a partial, the others the full page
+        patch_vary_headers(response, ["HX-Request"])
+    return response
+
+
+def conditional(validators):
+    """Answers 304 Not Modified before running the view when the client already has the current data.
+
+    validators(request, *args, **kwargs) returns the (etag, last_modified) of the response
+    and must be cheap: it runs on every request, the view only when the data changed.
+    """
+
+    def decorator(view):
+        def check(request, etag_value, modified):
+            etag = quote_etag(etag_value)
+            if request.method not in ("GET", "HEAD"):
+                return etag, None
+            timestamp = int(modified.timestamp()) if modified is not None else None
+            return etag, get_conditional_response(request, etag=etag, last_modified=timestamp)
+
+        if iscoroutinefunction(view):
+
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                etag_value, modified = await sync_to_async(validators)(request, *args, **kwargs)
+                etag, response = check(request, etag_value, modified)
+                if response is None:
+                    response = await view(request, *args, **kwargs)
+                return set_validators(response, etag, modified)
+
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            etag_value, modified = validators(request, *args, **kwargs)
+            etag, response = check(request, etag_value, modified)
+            if response is None:
+                response = view(request, *args, **kwargs)
+            return set_validators(response, etag, modified)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,179 @@
+import json
+import re
+from datetime import datetime, timezone
+from typing import NamedTuple
+
+from .json_paths import compile_path
+from .serializers import NetatmoSerializer, OpenWeatherSerializer
+
+REQUIRED = "This field is required."
+INVALID_NUMBER = "A valid number is required."
+INVALID_INTEGER = "A valid integer is required."
+# trailing zero decimals, the only ones rest_framework's IntegerField accepts
+ZERO_DECIMALS = re.compile(r"\.0*\s*$")
+
+
+class DecodedReading(NamedTuple):
+    """Plain record handed to the bulk writer: station fields and WeatherData fields"""
+
+    station: dict
+    reading: dict
+
+
+class DecodeError(ValueError):
+    """Raised with {field: [messages]}, the shape of serializer.errors, when a record is invalid"""
+
+    def __init__(self, errors: dict) -> None:
+        super().__init__(errors)
+        self.errors = errors
+
+
+def to_float(value, field, errors, required=False):
+    if value is None:
+        if required:
+            errors[field] = [REQUIRED]
+        return None
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        errors[field] = [INVALID_NUMBER]
+
+
+def to_int(value, field, errors):
+    if value is None:
+        return None
+    if type(value) is int:
+        return value
+    try:
+        # as the serializers: 47.0 and "47.0" are integers, 47.6 is rejected rather than truncated
+        return int(ZERO_DECIMALS.sub("", str(value)))
+    except (TypeError, ValueError):
+        errors[field] = [INVALID_INTEGER]
+
+
+def to_datetime(value, field, errors):
+    if value is None:
+        errors[field] = [REQUIRED]
+        return None
+    try:
+        return datetime.fromtimestamp(float(value), tz=timezone.utc)
+    except (TypeError, ValueError, OverflowError, OSError):
+        errors[field] = ["Invalid timestamp value."]
+
+
+class OpenWeatherDecoder:
+    """Fast-path equivalent of OpenWeatherSerializer, with the paths compiled once"""
+
+    source = "openweather"
+
+    def __init__(self, field_mapping: dict) -> None:
+        self.extractors = tuple((field, compile_path(path)) for field, path in field_mapping.items())
+        self.name = compile_path("name")
+        self.source_id = compile_path("id")
+
+    def decode_payload(self, payload) -> list:
+        return [payload]
+
+    def decode(self, data) -> DecodedReading:
+        values = {field: extract(data) for field, extract in self.extractors}
+        name = self.name(data)
+        source_id = self.source_id(data)
+        errors = {}
+        reading = {
+            "temperature": to_float(values["temperature"], "temperature", errors, required=True),
+            "feels_like": to_float(values["feels_like"], "feels_like", errors),
+            "humidity": to_int(values["humidity"], "humidity", errors),
+            "pressure": to_float(values["pressure"], "pressure", errors),
+            "timestamp": to_datetime(values["timestamp"], "timestamp", errors),
+        }
+        if name is None:
+            errors["station_name"] = [REQUIRED]
+        if source_id is None:
+            errors["source_id"] = [REQUIRED]
+        station = {
+            "name": str(name),
+            "source": self.source,
+            "source_id": str(source_id),
+            "longitude": to_float(values["longitude"], "longitude", errors),
+            "latitude": to_float(values["latitude"], "latitude", errors),
+            "locality": None,
+        }
+        if errors:
+            raise DecodeError(errors)
+        return DecodedReading(station, reading)
+
+
+class NetatmoDecoder:
+    """Fast-path equivalent of NetatmoSerializer, with the paths compiled once"""
+
+    source = "netatmo"
+    reading_types = {"temperature": to_float, "humidity": to_int, "pressure": to_float}
+
+    def __init__(self, field_mapping: dict) -> None:
+        self.extractors = tuple((field, compile_path(path)) for field, path in field_mapping.items())
+
+    def decode_payload(self, payload) -> list:
+        if isinstance(payload, str):
+            payload = json.loads(payload)
+        return payload.get("body", [])
+
+    def decode(self, data) -> DecodedReading:
+        values = {field: extract(data) for field, extract in self.extractors}
+        errors = {}
+        measures = {}
+        timestamp = None
+        for module in (values["measures"] or {}).values():
+            if "type" not in module or not module.get("res"):
+                continue
+            # a module reports one {timestamp: [values in "type" order]} entry
+            module_timestamp, module_values = next(iter(module["res"].items()))
+            for metric, value in zip(module["type"], module_values):
+                measures[metric] = value
+                timestamp = module_timestamp
+        reading = {"timestamp": to_datetime(timestamp, "timestamp", errors)}
+        for metric, convert in self.reading_types.items():
+            reading[metric] = convert(measures.get(metric), metric, errors)
+        if reading["temperature"] is None and "temperature" not in errors:
+            errors["temperature"] = [REQUIRED]
+        city, street = values["city"], values["street"]
+        name = " - ".join(part for part in (city, street) if part)
+        if not name:
+            errors["name"] = [REQUIRED]
+        if values["source_id"] is None:
+            errors["source_id"] = [REQUIRED]
+        station = {
+            "name": name,
+            "source": self.source,
+            "source_id": str(values["source_id"]),
+            "longitude": to_float(values["longitude"], "longitude", errors),
+            "city": city,
+            "latitude": to_float(values["latitude"], "latitude", errors),
+            "locality": street,
+        }
+        if errors:
+            raise DecodeError(errors)
+        return DecodedReading(station, reading)
+
+
+DECODERS = {
+    "openweather": OpenWeatherDecoder(OpenWeatherSerializer.field_mapping),
+    "netatmo": NetatmoDecoder(NetatmoSerializer.field_mapping),
+}
+
+
+def decode_response(source, json_data) -> tuple[list, list]:
+    """Decodes a provider response into DecodedReading rows and (success, error) results"""
+    try:
+        decoder = DECODERS[source]
+    except KeyError:
+        raise ValueError("Invalid source")
+    rows = []
+    results = []
+    for record in decoder.decode_payload(json_data):
+        try:
+            rows.append(decoder.decode(record))
+        except DecodeError as e:
+            results.append((False, e.errors))
+        else:
+            results.append((True, "Success"))
+    return rows, results
@@ -0,0 +1,54 @@
+import numpy as np
+from django.conf import settings
+
+
+def lttb(x, y, threshold: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: indices of the `threshold` points that best keep the shape of (x, y).
+
+    The first and last points are always kept; every bucket in between keeps the point
+    forming the largest triangle with the point kept in the previous bucket and the
+    average of the next one. Only the walk over the buckets is a Python loop.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    size = len(x)
+    if threshold >= size or threshold < 3:
+        return np.arange(size)
+
+    # bucket boundaries of the size - 2 inner points, the last bucket being the final point
+    edges = np.floor(np.linspace(1, size - 1, threshold - 1)).astype(np.int64)
+    edges = np.append(edges, size)
+    starts, ends = edges[:-1], edges[1:]
+    # average point of every bucket, computed at once with cumulative sums
+    x_sums = np.concatenate(([0.0], np.cumsum(x)))
+    y_sums = np.concatenate(([0.0], np.cumsum(y)))
+    counts = ends - starts
+    x_avg = (x_sums[ends] - x_sums[starts]) / counts
+    y_avg = (y_sums[ends] - y_sums[starts]) / counts
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = size - 1
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, end = starts[bucket], ends[bucket]
+        next_x, next_y = x_avg[bucket + 1], y_avg[bucket + 1]
+        # twice the triangle areas, the constant factor does not change the argmax
+        bucket_x, bucket_y = x[start:end], y[start:end]
+        areas = np.abs(
+            (x[previous] - next_x) * (bucket_y - y[previous]) - (x[previous] - bucket_x) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(areas))
+        selected[bucket + 1] = previous
+    return selected
+
+
+def downsample_series(series: list, max_points: int | None = None) -> list:
+    """Reduces (timestamp, value) pairs to at most max_points (CHART_MAX_POINTS by default) with LTTB"""
+    if max_points is None:
+        max_points = settings.CHART_MAX_POINTS
+    if not max_points or len(series) <= max_points:
+        return series
+    timestamps = np.fromiter((timestamp.timestamp() for timestamp, _ in series), dtype=np.float64, count=len(series))
+    values = np.fromiter((value for _, value in series), dtype=np.float64, count=len(series))
+    return [series[index] for index in lttb(timestamps, values, max_points)]
@@ -0,0 +1,209 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections
+
+from .models import WeatherData
+from .task_stats import get_task_summary
+
+DEFAULT_EVENTS_SETTINGS = {
+    "queue_size": 100,  # events buffered per subscriber before it is asked to reload
+    "heartbeat": 15,  # seconds between two keep-alive comments on an idle stream
+    "relay_interval": 1,  # seconds between two polls of the data committed by other processes
+    # seconds of readings the relay reads again, for the rows committed after a row with a higher id
+    "relay_overlap": 30,
+    "task_interval": 5,  # seconds between two task count refreshes
+}
+TOPICS = {"readings", "postgres", "tasks"}
+
+logger = logging.getLogger(__name__)
+
+
+def get_events_settings() -> dict:
+    """Returns the push channel settings, overridable with DASHBOARD_EVENTS"""
+    return {**DEFAULT_EVENTS_SETTINGS, **getattr(settings, "DASHBOARD_EVENTS", {})}
+
+
+class Subscription:
+    """Events of some topics queued for one subscriber, on the event loop that subscribed"""
+
+    def __init__(self, broker: "Broker", topics: set, size: int) -> None:
+        self.broker = broker
+        self.topics = topics
+        self.loop = asyncio.get_running_loop()
+        self.queue: asyncio.Queue = asyncio.Queue(size)
+        self.overflowed = False
+
+    def deliver(self, topic: str, data) -> None:
+        try:
+            self.queue.put_nowait((topic, data))
+        except asyncio.QueueFull:
+            # a subscriber too slow to keep up is told to reload instead of blocking the publishers
+            self.overflowed = True
+
+    async def get(self) -> tuple:
+        if self.overflowed:
+            self.overflowed = False
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            return "reset", {}
+        return await self.queue.get()
+
+    def close(self) -> None:
+        self.broker.unsubscribe(self)
+
+
+class Broker:
+    """In-process publish/subscribe of dashboard events, safe to publish to from any thread"""
+
+    def __init__(self, recent_size: int = 10000) -> None:
+        self._subscriptions: set = set()
+        self._lock = threading.Lock()
+        # (station_id, timestamp) of the readings already published, so that the relay skips them:
+        # more than the readings committed in DASHBOARD_EVENTS["relay_overlap"], read again by the relay
+        self._recent_readings: OrderedDict = OrderedDict()
+        self.recent_size = recent_size
+
+    def subscribe(self, topics, size: int | None = None) -> Subscription:
+        subscription = Subscription(self, set(topics), size or get_events_settings()["queue_size"])
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def has_subscribers(self, topic: str | None = None) -> bool:
+        with self._lock:
+            return any(topic is None or topic in subscription.topics for subscription in self._subscriptions)
+
+    def publish(self, topic: str, data) -> None:
+        with self._lock:
+            subscriptions = [subscription for subscription in self._subscriptions if topic in subscription.topics]
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, topic, data)
+            except RuntimeError:
+                # the loop of the subscriber is closed
+                self.unsubscribe(subscription)
+
+    def publish_readings(self, rows) -> None:
+        """Publishes newly committed readings as (station_id, timestamp, temperature) rows"""
+        if not self.has_subscribers("readings"):
+            return
+        with self._lock:
+            rows = [row for row in rows if row[:2] not in self._recent_readings]
+            for row in rows:
+                self._recent_readings[row[:2]] = None
+            while len(self._recent_readings) > self.recent_size:
+                self._recent_readings.popitem(last=False)
+        if rows:
+            self.publish(
+                "readings",
+                [
+                    {"station_id": station_id, "timestamp": timestamp.isoformat(), "temperature": temperature}
+                    for station_id, timestamp, temperature in rows
+                ],
+            )
+
+
+class Relay:
+    """Publishes what other processes (Django-Q workers, the prober) commit, polling once for all subscribers"""
+
+    def __init__(self, broker: Broker) -> None:
+        self.broker = broker
+        self.task: asyncio.Task | None = None
+        self.last_reading_id = None
+        # (monotonic time, last_reading_id) of the polls of the last relay_overlap seconds
+        self.reading_marks: deque = deque()
+        self.postgres: dict = {}
+        self.task_counts = None
+        self.next_task_poll = 0.0
+
+    def ensure_running(self) -> None:
+        """Starts polling on the running loop, until the last subscriber leaves"""
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self.run())
+
+    async def run(self) -> None:
+        conf = get_events_settings()
+        while self.broker.has_subscribers():
+            try:
+                await sync_to_async(self.poll)()
+            except Exception:
+                # a database or cache outage must not stop the events of every dashboard
+                logger.exception("Dashboard events relay poll failed")
+                await sync_to_async(close_old_connections)()
+            await asyncio.sleep(conf["relay_interval"])
+
+    def poll(self) -> None:
+        if self.broker.has_subscribers("readings"):
+            self.poll_readings()
+        if self.broker.has_subscribers("postgres"):
+            self.poll_postgres()
+        if self.broker.has_subscribers("tasks") and time.monotonic() >= self.next_task_poll:
+            self.next_task_poll = time.monotonic() + get_events_settings()["task_interval"]
+            self.poll_tasks()
+
+    def poll_readings(self, limit: int = 1000) -> None:
+        """Publishes the readings committed since the previous polls.
+
+        An id is taken at insert but visible at commit: a row committed after one with a higher
+        id would be skipped by an id cursor. The ids above the last one seen relay_overlap seconds
+        ago are read again, the broker dropping the readings already published.
+        """
+        current = time.monotonic()
+        if self.last_reading_id is None:
+            # only what is committed from now on: the dashboards load the history themselves
+            self.last_reading_id = WeatherData.objects.order_by("-id").values_list("id", flat=True).first() or 0
+            self.reading_marks.append((current, self.last_reading_id))
+            return
+        marks = self.reading_marks
+        while len(marks) > 1 and marks[1][0] <= current - get_events_settings()["relay_overlap"]:
+            marks.popleft()
+        cursor = marks[0][1] if marks else self.last_reading_id
+        while True:
+            rows = list(
+                WeatherData.objects.filter(id__gt=cursor)
+                .order_by("id")
+                .values_list("id", "station_id", "timestamp", "temperature")[:limit]
+            )
+            if rows:
+                cursor = rows[-1][0]
+                self.broker.publish_readings([row[1:] for row in rows])
+            if len(rows) < limit:
+                break
+        self.last_reading_id = max(self.last_reading_id, cursor)
+        marks.append((current, self.last_reading_id))
+
+    def poll_postgres(self) -> None:
+        from .postgres_probe import get_probe_settings, get_targets, status_key
+
+        statuses = caches[get_probe_settings()["cache_alias"]].get_many([status_key(name) for name in get_targets()])
+        for status in statuses.values():
+            previous = self.postgres.get(status["target"])
+            self.postgres[status["target"]] = status["status"]
+            if previous is not None and previous != status["status"]:
+                self.broker.publish("postgres", status_event(status))
+
+    def poll_tasks(self) -> None:
+        summary = get_task_summary()
+        counts = {"success_count": summary["success_count"], "failure_count": summary["failure_count"]}
+        if counts != self.task_counts:
+            self.task_counts = counts
+            self.broker.publish("tasks", counts)
+
+
+def status_event(status: dict) -> dict:
+    return {**status, "checked_at": status["checked_at"].isoformat()}
+
+
+broker = Broker()
+relay = Relay(broker)
@@ -0,0 +1,104 @@
+import csv
+import json
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from .models import WeatherData, WeatherDataRollup
+from .rollups import RESOLUTIONS
+
+DEFAULT_EXPORT_SETTINGS = {
+    "chunk_size": 2000,  # rows fetched from the database at once
+    "batch_size": 500,  # rows encoded into one chunk of the response
+    "max_days": 366,  # longest time range of one export
+}
+FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+RAW_COLUMNS = ["station_id", "timestamp", "temperature", "feels_like", "humidity", "pressure"]
+ROLLUP_COLUMNS = ["station_id", "bucket_start", "count", "temperature_min", "temperature_max", "temperature_avg"]
+
+
+def get_export_settings() -> dict:
+    """Returns the export settings, overridable with EXPORT"""
+    return {**DEFAULT_EXPORT_SETTINGS, **getattr(settings, "EXPORT", {})}
+
+
+def export_rows(start: datetime, end: datetime, station_ids=None, resolution: str = "raw", chunk_size: int = 2000):
+    """(columns, rows) of the readings or rollups in [start, end), streamed as tuples without model instances.
+
+    Raw readings only exist within the retention TTL, the rollups cover the archived months too.
+    Rows come in (station, time) order, the order of the unique indexes.
+    """
+    if resolution == "raw":
+        queryset = WeatherData.objects.filter(timestamp__gte=start, timestamp__lt=end).order_by(
+            "station_id", "timestamp"
+        )
+        columns = RAW_COLUMNS
+    elif resolution in RESOLUTIONS:
+        queryset = WeatherDataRollup.objects.filter(
+            resolution=resolution, bucket_start__gte=start, bucket_start__lt=end
+        ).order_by("station_id", "bucket_start")
+        columns = ROLLUP_COLUMNS
+    else:
+        raise ValueError(f"Unknown resolution: {resolution}")
+    if station_ids:
+        queryset = queryset.filter(station_id__in=station_ids)
+    return columns, queryset.values_list(*columns).iterator(chunk_size=chunk_size)
+
+
+def batched(rows, size: int):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class LineBuffer:
+    """File-like object handing back what csv.writer writes, as in the Django streaming CSV recipe"""
+
+    def write(self, value):
+        return value
+
+
+def encode_csv(columns, rows, batch_size: int):
+    """Bytes of the CSV document, one chunk per batch of rows"""
+    writer = csv.writer(LineBuffer())
+    yield writer.writerow(columns).encode()
+    for batch in batched(rows, batch_size):
+        yield "".join(
+            writer.writerow([value.isoformat() if isinstance(value, datetime) else value for value in row])
+            for row in batch
+        ).encode()
+
+
+def encode_ndjson(columns, rows, batch_size: int):
+    """Bytes of one JSON object per line, one chunk per batch of rows"""
+    encoder = json.JSONEncoder(separators=(",", ":"))
+    time_index = 1
+    for batch in batched(rows, batch_size):
+        lines = []
+        for row in batch:
+            row = list(row)
+            row[time_index] = row[time_index].isoformat()
+            lines.append(encoder.encode(dict(zip(columns, row))))
+        lines.append("")
+        yield "\n".join(lines).encode()
+
+
+ENCODERS = {"csv": encode_csv, "ndjson": encode_ndjson}
+
+
+async def aiterate(chunks):
+    """Async iterator over the chunks of a sync iterator, each one read in the thread of the sync code.
+
+    Under ASGI, StreamingHttpResponse reads a sync iterator to the end before sending
+    its first byte: the export is streamed to ASGI clients through this one instead.
+    """
+    chunks = iter(chunks)
+    read = sync_to_async(next)
+    while (chunk := await read(chunks, None)) is not None:
+        yield chunk
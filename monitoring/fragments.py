@@ -0,0 +1,43 @@
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import caches
+
+from . import metrics
+
+DEFAULT_FRAGMENT_CACHE_SETTINGS = {
+    # Django cache holding the rendered fragments, "status" being shared by every process: with a
+    # per-process cache (LocMem) each worker renders and keeps its own copy of every fragment
+    "cache_alias": "status",
+    # seconds an unused fragment is kept: it only frees the memory of outdated versions,
+    # a fragment is never served once newer data is committed
+    "timeout": 3600,
+}
+FRAGMENT_KEY = "fragment"
+
+
+def get_fragment_cache_settings() -> dict:
+    """Returns the fragment cache settings, overridable with FRAGMENT_CACHE"""
+    return {**DEFAULT_FRAGMENT_CACHE_SETTINGS, **getattr(settings, "FRAGMENT_CACHE", {})}
+
+
+def fragment_key(fragment: str, parts, version: datetime | None) -> str:
+    """The key changes with the version of the data, so committing new data invalidates it"""
+    stamp = version.timestamp() if version is not None else "none"
+    return ":".join([FRAGMENT_KEY, fragment, *(str(part) for part in parts), str(stamp)])
+
+
+def get_fragment(fragment: str, parts, version: datetime | None, render) -> str:
+    """The fragment rendered for these key parts and this version of the data, render() on a miss"""
+    conf = get_fragment_cache_settings()
+    cache = caches[conf["cache_alias"]]
+    key = fragment_key(fragment, parts, version)
+    html = cache.get(key)
+    if html is None:
+        metrics.fragment_cache.inc(fragment=fragment, result="miss")
+        html = render()
+        cache.set(key, html, conf["timeout"])
+    else:
+        metrics.fragment_cache.inc(fragment=fragment, result="hit")
+    metrics.registry.maybe_flush()
+    return html
@@ -0,0 +1,52 @@
+from django.db import connection
+from django.db.models.expressions import Col
+
+
+def insert_ignoring_conflicts(objs, unique_fields, batch_size=500) -> list:
+    """Inserts model objects, skipping those whose unique_fields are stored already; returns the ones written.
+
+    Unlike bulk_create(ignore_conflicts=True), the rows a concurrent transaction committed
+    first are told apart: INSERT ... ON CONFLICT DO NOTHING RETURNING (PostgreSQL, SQLite
+    3.35+) returns only the rows this statement wrote, whose objects get their pk.
+    """
+    objs = list(objs)
+    if not objs:
+        return []
+    meta = objs[0]._meta
+    fields = [field for field in meta.concrete_fields if not field.primary_key]
+    unique = [meta.get_field(name) for name in unique_fields]
+    quote = connection.ops.quote_name
+    columns = ", ".join(quote(field.column) for field in fields)
+    returning = ", ".join(quote(field.column) for field in [meta.pk, *unique])
+    # the values of the unique fields as read back from the database, the same for both sides of the comparison
+    cols = [Col(meta.db_table, field) for field in unique]
+    converters = [connection.ops.get_db_converters(col) + col.get_db_converters(connection) for col in cols]
+
+    def read_back(values):
+        for value, col, field_converters in zip(values, cols, converters):
+            for converter in field_converters:
+                value = converter(value, col, connection)
+            yield value
+
+    row = "(" + ", ".join(["%s"] * len(fields)) + ")"
+    written = []
+    with connection.cursor() as cursor:
+        for index in range(0, len(objs), batch_size):
+            batch = objs[index : index + batch_size]
+            params = []
+            by_key = {}
+            for obj in batch:
+                params.extend(field.get_db_prep_save(getattr(obj, field.attname), connection) for field in fields)
+                key = read_back(field.get_db_prep_save(getattr(obj, field.attname), connection) for field in unique)
+                by_key[tuple(key)] = obj
+            cursor.execute(
+                f"INSERT INTO {quote(meta.db_table)} ({columns}) VALUES {', '.join([row] * len(batch))} "
+                f"ON CONFLICT ({', '.join(quote(field.column) for field in unique)}) DO NOTHING RETURNING {returning}",
+                params,
+            )
+            for pk, *key in cursor.fetchall():
+                obj = by_key[tuple(read_back(key))]
+                obj.pk = pk
+                obj._state.adding = False
+                written.append(obj)
+    return written
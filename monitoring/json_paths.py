@@ -0,0 +1,23 @@
+import re
+from functools import lru_cache
+
+PATH_PART = re.compile(r"([^.\[\]]+)|\[(\d+)\]")
+
+
+@lru_cache(maxsize=None)
+def compile_path(path: str):
+    """Compiles a JSON path such as "place.location[0]" into a function extracting its value.
+
+    The path is parsed once; the extractor returns None as soon as a key or index is missing.
+    """
+    steps = tuple(key if index == "" else int(index) for key, index in PATH_PART.findall(path))
+
+    def extract(data):
+        for step in steps:
+            try:
+                data = data[step]
+            except (KeyError, IndexError, TypeError):
+                return None
+        return data
+
+    return extract
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from ...retention import apply_retention, get_retention_settings
+
+
+class Command(BaseCommand):
+    help = (
+        "Archives the months of raw WeatherData older than the retention TTL to compressed columnar files, "
+        "then drops them (monthly partitions on PostgreSQL, chunked deletes elsewhere); rollups are kept"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--raw-days", type=int, help="Days of raw readings to keep, default: RETENTION")
+        parser.add_argument("--archive-dir", help="Directory of the archives, default: RETENTION")
+
+    def handle(self, *args, **options):
+        conf = get_retention_settings()
+        raw_days = options["raw_days"] if options["raw_days"] is not None else conf["raw_days"]
+        if raw_days is None:
+            self.stdout.write("No raw data TTL configured, nothing to archive")
+            return
+        results = apply_retention(raw_days=raw_days, archive_dir=options["archive_dir"])
+        for month, rows, path in results:
+            self.stdout.write(f"{month:%Y-%m}: {rows} readings archived to {path}")
+        self.stdout.write(self.style.SUCCESS(f"{len(results)} month(s) archived"))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from ...backfill import run_backfill
+from ...decoders import DECODERS
+
+
+class Command(BaseCommand):
+    help = (
+        "Loads dumps of raw OpenWeather and Netatmo responses (files or directories of .json, .jsonl, .ndjson, "
+        "gzipped or not): a process pool decodes them, a single writer inserts the readings in batches"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("paths", nargs="+", help="Dump files or directories")
+        parser.add_argument(
+            "--source", choices=sorted(DECODERS), help="Provider of every response, default: detected per response"
+        )
+        parser.add_argument("--workers", type=int, help="Decoding processes, 0 decodes in this process")
+        parser.add_argument("--state-file", help="Progress of the backfill, to resume it, default: BACKFILL")
+        parser.add_argument("--restart", action="store_true", help="Load again the parts already loaded")
+
+    def handle(self, *args, **options):
+        totals = run_backfill(
+            options["paths"],
+            source=options["source"],
+            workers=options["workers"],
+            state_file=options["state_file"],
+            restart=options["restart"],
+            progress=self.report,
+        )
+        self.report(totals)
+        self.stdout.write(f"{totals['rollups']} rollup buckets rebuilt")
+        for key, error in totals["failed"]:
+            self.stderr.write(f"{key}: {error}")
+        if totals["failed"]:
+            raise CommandError(f"{len(totals['failed'])} part(s) failed, run the command again to retry them")
+        self.stdout.write(self.style.SUCCESS(f"{totals['readings']} readings loaded"))
+
+    def report(self, totals):
+        elapsed = totals.get("elapsed") or 0
+        rate = totals["readings"] / elapsed if elapsed else 0
+        self.stdout.write(
+            f"{totals['done']}/{totals['items']} parts, {totals['documents']} responses, "
+            f"{totals['readings']} readings ({rate:.0f}/s), {totals['errors']} invalid"
+        )
@@ -0,0 +1,19 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from ...postgres_probe import get_probe_settings, get_targets, run_prober
+
+
+class Command(BaseCommand):
+    help = "Probes the monitored Postgres targets on a fixed cadence and publishes their status for the views"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--interval", type=float, help="Seconds between two probes, default: POSTGRES_PROBE")
+        parser.add_argument("--once", action="store_true", help="Probe a single time and exit")
+
+    def handle(self, *args, **options):
+        interval = options["interval"] or get_probe_settings()["interval"]
+        if not options["once"]:
+            self.stdout.write(f"Probing {len(get_targets())} Postgres target(s) every {interval}s")
+        asyncio.run(run_prober(interval, iterations=1 if options["once"] else None))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+from django.utils.timezone import is_naive, make_aware
+
+from ...rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Backfills or rebuilds the WeatherData rollups (5 minutes, 1 hour, 1 day) from the raw readings"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--since", help="Only rebuild from this date/time on (ISO 8601), default: all history")
+        parser.add_argument("--station", type=int, action="append", dest="stations", help="Station id, repeatable")
+
+    def handle(self, *args, **options):
+        since = None
+        if options["since"]:
+            since = parse_datetime(options["since"]) or parse_datetime(f"{options['since']}T00:00:00")
+            if since is None:
+                raise CommandError(f"Invalid --since value: {options['since']}")
+            if is_naive(since):
+                since = make_aware(since)
+        written = rebuild_rollups(since=since, station_ids=options["stations"])
+        self.stdout.write(self.style.SUCCESS(f"{written} rollup buckets written"))
@@ -0,0 +1,397 @@
+import atexit
+import bisect
+import contextlib
+import fcntl
+import functools
+import glob
+import inspect
+import json
+import os
+import threading
+import time
+
+from django.conf import settings
+
+DEFAULT_METRICS_SETTINGS = {
+    # directory where every process (web server, Django-Q workers) publishes its metrics,
+    # None keeps them in the process serving /monitoring/metrics
+    "multiprocess_dir": None,
+    "flush_interval": 5,  # seconds between two publications of the same process
+}
+# counters of the exited processes, folded together by the process serving the endpoint
+MERGED_FILE = "metrics-merged.json"
+# Upper bounds in seconds of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def get_metrics_settings() -> dict:
+    """Returns the metrics settings, overridable with METRICS"""
+    return {**DEFAULT_METRICS_SETTINGS, **getattr(settings, "METRICS", {})}
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Metric:
+    """Values of a metric family, one per combination of label values"""
+
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labels=()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: dict = {}
+        self._lock = threading.Lock()
+
+    def key(self, labels: dict) -> tuple:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {key: self.copy_value(value) for key, value in self._values.items()}
+
+    def copy_value(self, value):
+        return value
+
+    def merge(self, current, value):
+        return value if current is None else current + value
+
+    def reset(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+    def render(self, values: dict) -> list:
+        lines = [f"# HELP {self.name} {escape(self.documentation)}", f"# TYPE {self.name} {self.type}"]
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{format_labels(self.labels, key)} {float(value)!r}")
+        return lines
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        self.inc_key(self.key(labels), amount)
+
+    def inc_key(self, key: tuple, amount: float = 1.0) -> None:
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc_key(self.key(labels), -amount)
+
+
+class Histogram(Metric):
+    """Observations counted in fixed buckets; a value is [count per bucket..., count above the last, sum]"""
+
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels=(), buckets=DEFAULT_BUCKETS) -> None:
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, amount: float, **labels) -> None:
+        self.observe_key(self.key(labels), amount)
+
+    def observe_key(self, key: tuple, amount: float) -> None:
+        index = bisect.bisect_left(self.buckets, amount)
+        with self._lock:
+            value = self._values.get(key)
+            if value is None:
+                value = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            value[index] += 1
+            value[-1] += amount
+
+    def copy_value(self, value):
+        return list(value)
+
+    def merge(self, current, value):
+        return list(value) if current is None else [a + b for a, b in zip(current, value)]
+
+    def render(self, values: dict) -> list:
+        lines = [f"# HELP {self.name} {escape(self.documentation)}", f"# TYPE {self.name} {self.type}"]
+        names = (*self.labels, "le")
+        for key, value in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), value[:-1]):
+                cumulative += count
+                bucket = format_labels(names, (*key, str(bound)))
+                lines.append(f"{self.name}_bucket{bucket} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, key)} {float(value[-1])!r}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class Tracker:
+    """Context manager measuring one call of an operation"""
+
+    __slots__ = ("operation", "key", "start")
+
+    def __init__(self, operation: "Operation", key: tuple) -> None:
+        self.operation = operation
+        self.key = key
+
+    def __enter__(self):
+        self.operation.in_progress.inc_key(self.key)
+        self.start = time.perf_counter()
+
+    def __exit__(self, exc_type, exc, tb):
+        operation = self.operation
+        operation.duration.observe_key(self.key, time.perf_counter() - self.start)
+        operation.in_progress.inc_key(self.key, -1)
+        operation.calls.inc_key((*self.key, "ok" if exc_type is None else "error"))
+        operation.registry.maybe_flush()
+
+
+class Operation:
+    """Latency histogram, outcome counter and in-flight gauge of one kind of call"""
+
+    def __init__(self, registry: "Registry", name: str, documentation: str, labels=()) -> None:
+        self.registry = registry
+        self.duration = registry.register(Histogram(f"{name}_duration_seconds", f"{documentation} latency", labels))
+        self.calls = registry.register(Counter(f"{name}_total", f"{documentation} by outcome", (*labels, "outcome")))
+        self.in_progress = registry.register(Gauge(f"{name}_in_progress", f"{documentation} in flight", labels))
+
+    def track(self, **labels) -> Tracker:
+        """Measures the enclosed block, counted as an error if it raises"""
+        return Tracker(self, self.duration.key(labels))
+
+    def timed(self, **labels):
+        """Decorator measuring every call of a function; coroutines are measured until they complete"""
+        # the label values are resolved once, not on every call
+        key = self.duration.key(labels)
+
+        def decorator(func):
+            if inspect.iscoroutinefunction(func):
+
+                @functools.wraps(func)
+                async def async_wrapper(*args, **kwargs):
+                    with Tracker(self, key):
+                        return await func(*args, **kwargs)
+
+                return async_wrapper
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                with Tracker(self, key):
+                    return func(*args, **kwargs)
+
+            return wrapper
+
+        return decorator
+
+
+class Registry:
+    """Metrics of the process, optionally merged with the ones published by the other processes"""
+
+    def __init__(self, multiprocess_dir: str | None = None, flush_interval: float = 5) -> None:
+        self.directory = multiprocess_dir
+        self.flush_interval = flush_interval
+        self.metrics: dict = {}
+        self._next_flush = 0.0
+        self.start_process()
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels=()) -> Counter:
+        return self.register(Counter(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels=(), buckets=DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def operation(self, name: str, documentation: str, labels=()) -> Operation:
+        return Operation(self, name, documentation, labels)
+
+    def reset(self) -> None:
+        for metric in self.metrics.values():
+            metric.reset()
+        self._next_flush = 0.0
+
+    def snapshot(self) -> dict:
+        return {name: metric.snapshot() for name, metric in self.metrics.items()}
+
+    def start_process(self) -> None:
+        """Names the file of this process by its pid and start time: a recycled pid gets a new file"""
+        self.process = f"{os.getpid()}-{time.time_ns()}"
+
+    def path(self) -> str:
+        return os.path.join(self.directory, f"metrics-{self.process}.json")
+
+    def maybe_flush(self) -> None:
+        if self.directory is not None and time.monotonic() >= self._next_flush:
+            self.flush()
+
+    def flush(self) -> None:
+        """Publishes the metrics of this process for the process serving the endpoint"""
+        if self.directory is None:
+            return
+        self._next_flush = time.monotonic() + self.flush_interval
+        os.makedirs(self.directory, exist_ok=True)
+        metrics = {
+            name: [[list(key), value] for key, value in values.items()] for name, values in self.snapshot().items()
+        }
+        write_atomic(self.path(), {"pid": os.getpid(), "metrics": metrics})
+
+    def collect(self) -> dict:
+        """Merges the metrics of this process with the ones published by the others.
+
+        The files of exited processes are folded into MERGED_FILE and removed, so that the
+        directory does not grow with every recycled Django-Q worker.
+        """
+        collected = self.snapshot()
+        if self.directory is None:
+            return collected
+        exited = []
+        # a concurrent fold would move counters between the files while they are read
+        with self.lock(fcntl.LOCK_SH):
+            merged = read_published(os.path.join(self.directory, MERGED_FILE))
+            if merged is not None:
+                self.add(collected, merged["metrics"], gauges=False)
+            folded = set(merged["folded"]) if merged is not None else set()
+            for path in glob.glob(os.path.join(self.directory, "metrics-*.json")):
+                name = os.path.basename(path)
+                if path == self.path() or name == MERGED_FILE or name in folded:
+                    continue
+                published = read_published(path)
+                if published is None:
+                    continue
+                # counters of exited processes still count, their in-flight gauges do not; the file of
+                # an exited process whose pid was recycled is folded once the new process exits too
+                alive = is_alive(published["pid"])
+                self.add(collected, published["metrics"], gauges=alive)
+                if not alive:
+                    exited.append(path)
+        if exited:
+            self.fold(exited)
+        return collected
+
+    def add(self, collected: dict, published: dict, gauges: bool) -> None:
+        for name, values in published.items():
+            metric = self.metrics.get(name)
+            if metric is None or (metric.type == "gauge" and not gauges):
+                continue
+            merged = collected[name]
+            for key, value in values:
+                key = tuple(key)
+                merged[key] = metric.merge(merged.get(key), value)
+
+    @contextlib.contextmanager
+    def lock(self, operation: int):
+        """Lock of the directory shared by every process: LOCK_SH to read the files, LOCK_EX to fold them"""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, "metrics.lock"), "w") as lock:
+            fcntl.flock(lock, operation)
+            yield
+
+    def fold(self, paths) -> None:
+        """Adds the counters of exited processes to MERGED_FILE and removes their files"""
+        with self.lock(fcntl.LOCK_EX):
+            merged_path = os.path.join(self.directory, MERGED_FILE)
+            merged = read_published(merged_path) or {"metrics": {}, "folded": []}
+            totals = {name: {} for name in self.metrics}
+            self.add(totals, merged["metrics"], gauges=False)
+            # names listed by a fold interrupted before it removed them
+            folded = {name for name in merged["folded"] if os.path.exists(os.path.join(self.directory, name))}
+            for path in paths:
+                name = os.path.basename(path)
+                published = read_published(path)
+                if name in folded or published is None:
+                    continue
+                self.add(totals, published["metrics"], gauges=False)
+                folded.add(name)
+            metrics = {name: [[list(key), value] for key, value in values.items()] for name, values in totals.items()}
+            write_atomic(merged_path, {"metrics": metrics, "folded": sorted(folded)})
+            for name in folded:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+
+    def render(self) -> str:
+        """Prometheus text exposition format"""
+        collected = self.collect()
+        lines = []
+        for name, metric in self.metrics.items():
+            lines.extend(metric.render(collected[name]))
+        return "\n".join(lines) + "\n"
+
+
+def read_published(path: str) -> dict | None:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_atomic(path: str, content: dict) -> None:
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(content, f)
+    # readers never see a half written file
+    os.replace(f"{path}.tmp", path)
+
+
+def is_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+registry = Registry(**get_metrics_settings())
+atexit.register(registry.flush)
+# a forked Django-Q worker starts from zero, in its own file, instead of counting its parent's calls again
+os.register_at_fork(after_in_child=registry.reset)
+os.register_at_fork(after_in_child=registry.start_process)
+
+provider_fetch = registry.operation("weather_provider_fetch", "Weather provider requests", ["source"])
+decode = registry.operation("weather_decode", "Provider response decoding", ["source"])
+db_write = registry.operation("weather_db_write", "Ingestion transactions")
+postgres_probe = registry.operation("postgres_probe", "Monitored Postgres checks", ["target"])
+readings_inserted = registry.counter("weather_readings_inserted_total", "Readings stored by the ingestion")
+fragment_cache = registry.counter(
+    "dashboard_fragment_cache_total", "Dashboard fragments served from the cache (hit) or rendered (miss)",
+    ["fragment", "result"],
+)
+response_cache = registry.counter(
+    "weather_provider_response_cache_total",
+    "Provider responses served from the response cache (hit) or fetched (miss)",
+    ["source", "result"],
+)
+rate_limit_wait = registry.histogram(
+    "weather_provider_rate_limit_wait_seconds",
+    "Time provider requests waited for a rate limit slot",
+    ["source"],
+    buckets=(0.0, 0.01, 0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+rate_limit_rejected = registry.counter(
+    "weather_provider_rate_limit_rejected_total", "Provider requests failed without a rate limit slot", ["source"]
+)
+provider_retries = registry.counter(
+    "weather_provider_retries_total", "Provider requests retried after a transient failure", ["source"]
+)
+circuit_open = registry.counter(
+    "weather_provider_circuit_open_total", "Provider requests failed at once by an open circuit breaker", ["source"]
+)
+single_flight = registry.counter(
+    "weather_provider_single_flight_total",
+    "Provider calls by role: leader made the call, follower awaited it in this process, remote in another",
+    ["source", "role"],
+)
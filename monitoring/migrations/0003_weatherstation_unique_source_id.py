@@ -0,0 +1,32 @@
+# Generated by Django 4.2.19 on 2026-10-18 05:29
+
+from django.db import migrations, models
+
+
+def merge_duplicate_stations(apps, schema_editor):
+    """Moves the readings of duplicated stations to the oldest one and deletes the others"""
+    WeatherStation = apps.get_model('monitoring', 'WeatherStation')
+    WeatherData = apps.get_model('monitoring', 'WeatherData')
+    kept = {}
+    for station in WeatherStation.objects.order_by('id'):
+        key = (station.source, station.source_id)
+        if key not in kept:
+            kept[key] = station.id
+            continue
+        WeatherData.objects.filter(station_id=station.id).update(station_id=kept[key])
+        station.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0002_postgresstatuslog'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_stations, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='weatherstation',
+            constraint=models.UniqueConstraint(fields=('source', 'source_id'), name='unique_station_source_id'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2.19 on 2026-10-18 05:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0003_weatherstation_unique_source_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeatherDataRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.CharField(choices=[('5m', '5 minutes'), ('1h', '1 hour'), ('1d', '1 day')], max_length=2)),
+                ('bucket_start', models.DateTimeField()),
+                ('count', models.PositiveIntegerField()),
+                ('temperature_min', models.FloatField()),
+                ('temperature_max', models.FloatField()),
+                ('temperature_avg', models.FloatField()),
+                ('station', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='monitoring.weatherstation')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='weatherdatarollup',
+            constraint=models.UniqueConstraint(fields=('station', 'resolution', 'bucket_start'), name='unique_rollup_bucket'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.19 on 2026-10-18 05:36
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def delete_duplicate_readings(apps, schema_editor):
+    """Keeps the oldest row of every (station, timestamp) pair stored more than once"""
+    WeatherData = apps.get_model('monitoring', 'WeatherData')
+    duplicates = (
+        WeatherData.objects.values('station_id', 'timestamp')
+        .annotate(first_id=Min('id'), rows=models.Count('id'))
+        .filter(rows__gt=1)
+        .order_by()
+    )
+    for duplicate in duplicates.iterator():
+        WeatherData.objects.filter(station_id=duplicate['station_id'], timestamp=duplicate['timestamp']).exclude(
+            id=duplicate['first_id']
+        ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0004_weatherdatarollup'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_readings, migrations.RunPython.noop),
+        migrations.AlterModelOptions(
+            name='weatherdata',
+            options={},
+        ),
+        migrations.AddConstraint(
+            model_name='weatherdata',
+            constraint=models.UniqueConstraint(fields=('station', 'timestamp'), name='unique_reading_station_timestamp'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.19 on 2026-10-18 05:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0005_weatherdata_unique_station_timestamp'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='postgresstatuslog',
+            name='latency_ms',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='postgresstatuslog',
+            name='target',
+            field=models.CharField(default='default', max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='postgresstatuslog',
+            index=models.Index(fields=['target', 'timestamp'], name='status_log_target_timestamp'),
+        ),
+    ]
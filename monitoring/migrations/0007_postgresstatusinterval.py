@@ -0,0 +1,79 @@
+# Generated by Django 4.2.19 on 2026-10-18 05:48
+
+from django.db import migrations, models
+
+# a gap between two logs longer than this starts a new interval even if the status did not change
+MAX_GAP_SECONDS = 120
+
+
+def compact_status_logs(apps, schema_editor):
+    """Folds every run of consecutive logs with the same status and target into one interval"""
+    PostgresStatusLog = apps.get_model('monitoring', 'PostgresStatusLog')
+    PostgresStatusInterval = apps.get_model('monitoring', 'PostgresStatusInterval')
+    intervals = []
+    current = None
+    logs = PostgresStatusLog.objects.order_by('target', 'timestamp').values_list(
+        'target', 'status', 'timestamp', 'latency_ms'
+    )
+    for target, status, timestamp, latency_ms in logs.iterator(chunk_size=10000):
+        if current is not None and current.target == target:
+            if (timestamp - current.ended_at).total_seconds() <= MAX_GAP_SECONDS:
+                if current.status == status:
+                    current.ended_at = timestamp
+                    current.sample_count += 1
+                    if latency_ms is not None:
+                        if current.latency_avg is None:
+                            current.latency_min = current.latency_max = current.latency_avg = latency_ms
+                        else:
+                            current.latency_min = min(current.latency_min, latency_ms)
+                            current.latency_max = max(current.latency_max, latency_ms)
+                            current.latency_avg += (latency_ms - current.latency_avg) / current.sample_count
+                    continue
+                current.ended_at = timestamp
+        current = PostgresStatusInterval(
+            target=target,
+            status=status,
+            started_at=timestamp,
+            ended_at=timestamp,
+            latency_min=latency_ms,
+            latency_max=latency_ms,
+            latency_avg=latency_ms,
+        )
+        intervals.append(current)
+        if len(intervals) >= 10000:
+            # keep the interval still being extended for the next batch
+            PostgresStatusInterval.objects.bulk_create(intervals[:-1])
+            intervals = intervals[-1:]
+    PostgresStatusInterval.objects.bulk_create(intervals)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0006_postgresstatuslog_target_latency'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PostgresStatusInterval',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('target', models.CharField(default='default', max_length=100)),
+                ('status', models.CharField(choices=[('up', 'UP'), ('down', 'DOWN')], max_length=10)),
+                ('started_at', models.DateTimeField()),
+                ('ended_at', models.DateTimeField()),
+                ('sample_count', models.PositiveIntegerField(default=1)),
+                ('latency_min', models.FloatField(blank=True, null=True)),
+                ('latency_max', models.FloatField(blank=True, null=True)),
+                ('latency_avg', models.FloatField(blank=True, null=True)),
+            ],
+        ),
+        migrations.RunPython(compact_status_logs, migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name='PostgresStatusLog',
+        ),
+        migrations.AddIndex(
+            model_name='postgresstatusinterval',
+            index=models.Index(fields=['target', 'ended_at'], name='status_interval_target_end'),
+        ),
+    ]
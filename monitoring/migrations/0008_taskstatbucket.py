@@ -0,0 +1,64 @@
+# Generated by Django 4.2.19 on 2026-10-18 06:01
+
+import bisect
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.utils import timezone
+
+# as in monitoring/task_stats.py when this migration was written
+DURATION_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+KEEP_DAYS = 7
+
+
+def count_saved_tasks(apps, schema_editor):
+    """Builds the buckets of the tasks Django-Q saved over the last days, so the dashboard starts populated"""
+    Task = apps.get_model('django_q', 'Task')
+    TaskStatBucket = apps.get_model('monitoring', 'TaskStatBucket')
+    buckets = {}
+    tasks = Task.objects.filter(stopped__gte=timezone.now() - timedelta(days=KEEP_DAYS)).values_list(
+        'func', 'started', 'stopped', 'success'
+    )
+    for func, started, stopped, success in tasks.iterator(chunk_size=10000):
+        minute = stopped.replace(second=0, microsecond=0)
+        bucket = buckets.get((minute, func))
+        if bucket is None:
+            bucket = buckets[minute, func] = TaskStatBucket(
+                minute=minute, func=func, duration_buckets=[0] * (len(DURATION_BUCKETS) + 1)
+            )
+        if success:
+            bucket.success_count += 1
+        else:
+            bucket.failure_count += 1
+        duration = (stopped - started).total_seconds()
+        bucket.duration_sum += duration
+        bucket.duration_buckets[bisect.bisect_left(DURATION_BUCKETS, duration)] += 1
+    TaskStatBucket.objects.bulk_create(buckets.values(), batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0007_postgresstatusinterval'),
+        ('django_q', '0014_schedule_cluster'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskStatBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('minute', models.DateTimeField()),
+                ('func', models.CharField(max_length=256)),
+                ('success_count', models.PositiveIntegerField(default=0)),
+                ('failure_count', models.PositiveIntegerField(default=0)),
+                ('duration_sum', models.FloatField(default=0.0)),
+                ('duration_buckets', models.JSONField(default=list)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='taskstatbucket',
+            constraint=models.UniqueConstraint(fields=('minute', 'func'), name='unique_task_stat_bucket'),
+        ),
+        migrations.RunPython(count_saved_tasks, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta, timezone
+
+from django.db import migrations
+
+TABLE = 'monitoring_weatherdata'
+MONTHS_AHEAD = 2
+
+
+def month_start(timestamp):
+    timestamp = timestamp.astimezone(timezone.utc)
+    return datetime(timestamp.year, timestamp.month, 1, tzinfo=timezone.utc)
+
+
+def next_month(month):
+    return (month + timedelta(days=32)).replace(day=1)
+
+
+def partition_weatherdata(apps, schema_editor):
+    """Turns WeatherData into a table partitioned by month of timestamp, on PostgreSQL only.
+
+    A partitioned table needs the partition column in its primary key: the key becomes
+    (id, timestamp), id still being unique through its sequence. Other databases keep the
+    plain table, the retention deletes their expired readings in chunks.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'SELECT min("timestamp"), max(id) FROM {TABLE}')
+        first, last_id = cursor.fetchone()
+    now = datetime.now(timezone.utc)
+    month = month_start(first or now)
+    end = next_month(month_start(now))
+    for _ in range(MONTHS_AHEAD):
+        end = next_month(end)
+
+    statements = [
+        f'ALTER TABLE {TABLE} RENAME TO {TABLE}_unpartitioned',
+        f'CREATE SEQUENCE {TABLE}_partitioned_id_seq',
+        f'''CREATE TABLE {TABLE} (
+            id bigint NOT NULL DEFAULT nextval('{TABLE}_partitioned_id_seq'),
+            temperature double precision NOT NULL,
+            feels_like double precision NULL,
+            humidity integer NULL,
+            pressure double precision NULL,
+            "timestamp" timestamp with time zone NOT NULL,
+            station_id bigint NOT NULL,
+            PRIMARY KEY (id, "timestamp")
+        ) PARTITION BY RANGE ("timestamp")''',
+        f'ALTER SEQUENCE {TABLE}_partitioned_id_seq OWNED BY {TABLE}.id',
+        # readings outside the monthly partitions (far past or future) still have a home
+        f'CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT',
+    ]
+    while month < end:
+        statements.append(
+            f"CREATE TABLE {TABLE}_p{month:%Y%m} PARTITION OF {TABLE} "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month(month).isoformat()}')"
+        )
+        month = next_month(month)
+    columns = 'id, temperature, feels_like, humidity, pressure, "timestamp", station_id'
+    statements += [
+        f'INSERT INTO {TABLE} ({columns}) SELECT {columns} FROM {TABLE}_unpartitioned',
+        f"SELECT setval('{TABLE}_partitioned_id_seq', {last_id or 1}, {last_id is not None})",
+        f'DROP TABLE {TABLE}_unpartitioned',
+        f'ALTER TABLE {TABLE} ADD CONSTRAINT unique_reading_station_timestamp UNIQUE (station_id, "timestamp")',
+        f'ALTER TABLE {TABLE} ADD CONSTRAINT {TABLE}_station_id_fk FOREIGN KEY (station_id) '
+        f'REFERENCES monitoring_weatherstation (id) DEFERRABLE INITIALLY DEFERRED',
+        f'CREATE INDEX {TABLE}_station_id_idx ON {TABLE} (station_id)',
+    ]
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0008_taskstatbucket'),
+    ]
+
+    operations = [
+        # the model state is unchanged: Django keeps seeing id as the primary key
+        migrations.RunPython(partition_weatherdata, migrations.RunPython.noop),
+    ]
@@ -12,6 +12,9 @@ class WeatherStation(models.Model):
     source = models.CharField(max_length=20, choices=SOURCE_CHOICES)
     source_id = models.CharField(max_length=100)
 
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["source", "source_id"], name="unique_station_source_id")]
+
     def __str__(self):
         return f"{self.name}"
 
@@ -25,17 +28,86 @@ class WeatherData(models.Model):
     timestamp = models.DateTimeField()
 
     class Meta:
-        ordering = ["-timestamp"]
+        # a reading is identified by its station and time: re-polls inside the provider update window are no-ops
+        constraints = [
+            models.UniqueConstraint(fields=["station", "timestamp"], name="unique_reading_station_timestamp")
+        ]
 
 
-class PostgresStatusLog(models.Model):
+class PostgresStatusInterval(models.Model):
+    """Period during which a monitored target kept the same status, extended in place by every agreeing probe"""
+
     STATUS_CHOICES = [
         ("up", "UP"),
         ("down", "DOWN"),
     ]
 
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # name of the probed entry of DATABASE_TO_MONITOR
+    target = models.CharField(max_length=100, default="default")
     status = models.CharField(max_length=10, choices=STATUS_CHOICES)
+    started_at = models.DateTimeField()
+    # time of the last probe, or of the next transition when the status changed
+    ended_at = models.DateTimeField()
+    sample_count = models.PositiveIntegerField(default=1)
+    # round trip of the probe queries, None while the target was down
+    latency_min = models.FloatField(null=True, blank=True)
+    latency_max = models.FloatField(null=True, blank=True)
+    latency_avg = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["target", "ended_at"], name="status_interval_target_end")]
+
+    def __str__(self):
+        return f"{self.target} - {self.started_at} -> {self.ended_at} - {self.get_status_display()}"
+
+
+class WeatherDataRollup(models.Model):
+    """Temperature statistics of a station over a time bucket, kept up to date at ingestion"""
+
+    RESOLUTION_CHOICES = [("5m", "5 minutes"), ("1h", "1 hour"), ("1d", "1 day")]
+
+    station = models.ForeignKey(WeatherStation, on_delete=models.CASCADE)
+    resolution = models.CharField(max_length=2, choices=RESOLUTION_CHOICES)
+    bucket_start = models.DateTimeField()
+    count = models.PositiveIntegerField()
+    temperature_min = models.FloatField()
+    temperature_max = models.FloatField()
+    temperature_avg = models.FloatField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["station", "resolution", "bucket_start"], name="unique_rollup_bucket")
+        ]
+
+    def __str__(self):
+        return f"{self.station} - {self.resolution} - {self.bucket_start}"
+
+
+class TaskStatBucket(models.Model):
+    """Outcomes and durations of the Django-Q tasks of one function that stopped within one minute"""
+
+    minute = models.DateTimeField()
+    func = models.CharField(max_length=256)
+    success_count = models.PositiveIntegerField(default=0)
+    failure_count = models.PositiveIntegerField(default=0)
+    duration_sum = models.FloatField(default=0.0)
+    # tasks per bound of monitoring.task_stats.DURATION_BUCKETS, the last count above them
+    duration_buckets = models.JSONField(default=list)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["minute", "func"], name="unique_task_stat_bucket")]
+
+    def __str__(self):
+        return f"{self.func} - {self.minute}"
+
+
+class RateLimitBucket(models.Model):
+    """Token bucket of a weather provider, shared by every process calling it"""
+
+    name = models.CharField(max_length=50, unique=True)
+    tokens = models.FloatField()
+    # epoch seconds of the last refill, comparable across processes
+    updated_at = models.FloatField()
 
     def __str__(self):
-        return f"{self.timestamp} - {self.get_status_display()}"
+        return f"{self.name} - {self.tokens:.2f}"
@@ -0,0 +1,221 @@
+import asyncio
+import logging
+import os
+import time
+
+import psycopg2
+import psycopg2.extensions
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections
+from django.utils.timezone import now
+
+from . import metrics
+from .api_clients.session import run
+from .events import broker, status_event
+from .status_history import record_statuses
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROBE_SETTINGS = {
+    "interval": 10,  # seconds between two probes of the prober loop
+    "connect_timeout": 3,  # seconds allowed to open a connection
+    "statement_timeout": 2000,  # milliseconds allowed to the probe query
+    "concurrency": 10,  # targets probed at once
+    "stale_after": 120,  # seconds after which a published status is reported as unknown
+    "cache_alias": "status",  # cache shared by the prober and the web server
+}
+STATUS_KEY = "postgres-status"
+
+
+def get_probe_settings() -> dict:
+    """Returns the prober settings, overridable with POSTGRES_PROBE"""
+    return {**DEFAULT_PROBE_SETTINGS, **getattr(settings, "POSTGRES_PROBE", {})}
+
+
+def get_targets() -> dict:
+    """The named databases to probe, from DATABASE_TO_MONITOR"""
+    return settings.DATABASE_TO_MONITOR
+
+
+def status_key(target: str) -> str:
+    return f"{STATUS_KEY}:{target}"
+
+
+async def wait_ready(conn, timeout: float) -> None:
+    """Waits for an asynchronous psycopg2 connection to complete its pending operation"""
+    loop = asyncio.get_running_loop()
+
+    async def poll():
+        while True:
+            state = conn.poll()
+            if state == psycopg2.extensions.POLL_OK:
+                return
+            fd = conn.fileno()
+            ready = loop.create_future()
+            if state == psycopg2.extensions.POLL_READ:
+                add, remove = loop.add_reader, loop.remove_reader
+            else:
+                add, remove = loop.add_writer, loop.remove_writer
+            add(fd, lambda: ready.done() or ready.set_result(None))
+            try:
+                await ready
+            finally:
+                remove(fd)
+
+    await asyncio.wait_for(poll(), timeout)
+
+
+class PostgresProber:
+    """Checks many monitored databases concurrently, keeping one open connection per target"""
+
+    def __init__(self) -> None:
+        self.connections: dict = {}
+
+    async def connect(self, target: dict, conf: dict):
+        conn = psycopg2.connect(
+            dbname=target["NAME"],
+            user=target["USER"],
+            password=target["PASSWORD"],
+            host=target["HOST"],
+            port=target["PORT"],
+            options=f"-c statement_timeout={conf['statement_timeout']}",
+            async_=True,
+        )
+        try:
+            await wait_ready(conn, conf["connect_timeout"])
+        except BaseException:
+            conn.close()
+            raise
+        return conn
+
+    async def select_one(self, conn, conf: dict) -> float:
+        """Round trip of SELECT 1 in milliseconds"""
+        start = time.perf_counter()
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1")
+        await wait_ready(conn, conf["statement_timeout"] / 1000)
+        cursor.fetchone()
+        return (time.perf_counter() - start) * 1000
+
+    async def check(self, name: str, target: dict) -> float:
+        """Probes a target, raising if it is unreachable; returns the query latency"""
+        # per target CONNECT_TIMEOUT/STATEMENT_TIMEOUT override the POSTGRES_PROBE defaults
+        conf = get_probe_settings()
+        conf["connect_timeout"] = target.get("CONNECT_TIMEOUT", conf["connect_timeout"])
+        conf["statement_timeout"] = target.get("STATEMENT_TIMEOUT", conf["statement_timeout"])
+        conn = self.connections.pop(name, None)
+        if conn is not None and not conn.closed:
+            try:
+                latency = await self.select_one(conn, conf)
+                self.connections[name] = conn
+                return latency
+            except Exception:
+                # the server may have restarted since the last probe: try once with a new connection
+                conn.close()
+        conn = await self.connect(target, conf)
+        try:
+            latency = await self.select_one(conn, conf)
+        except BaseException:
+            conn.close()
+            raise
+        self.connections[name] = conn
+        return latency
+
+    async def probe(self, name: str, target: dict) -> dict:
+        status = {"target": name, "status": "up", "latency_ms": None, "error": None}
+        try:
+            with metrics.postgres_probe.track(target=name):
+                status["latency_ms"] = round(await self.check(name, target), 1)
+        except Exception as e:
+            logger.warning(f"Postgres Error on {name}: {e!r}")
+            status.update(status="down", error=str(e) or type(e).__name__)
+        status["checked_at"] = now()
+        return status
+
+    async def probe_all(self, targets: dict | None = None, concurrency: int | None = None) -> list:
+        """Probes the targets concurrently, at most `concurrency` at once"""
+        targets = get_targets() if targets is None else targets
+        semaphore = asyncio.Semaphore(concurrency or get_probe_settings()["concurrency"])
+
+        async def bounded(name, target):
+            async with semaphore:
+                return await self.probe(name, target)
+
+        return await asyncio.gather(*(bounded(name, target) for name, target in targets.items()))
+
+    def close(self) -> None:
+        for conn in self.connections.values():
+            conn.close()
+        self.connections.clear()
+
+    def reset_after_fork(self) -> None:
+        # closing would terminate the parent's sessions over the shared sockets: leak them instead
+        _inherited_connections.extend(self.connections.values())
+        self.connections = {}
+
+
+_inherited_connections: list = []
+prober = PostgresProber()
+os.register_at_fork(after_in_child=prober.reset_after_fork)
+
+
+def publish_statuses(statuses: list) -> list:
+    """Publishes the statuses for the views and folds them into the status history"""
+    conf = get_probe_settings()
+    cache = caches[conf["cache_alias"]]
+    previous = cache.get_many([status_key(status["target"]) for status in statuses])
+    # the history first: a view seeing the new status in the cache also finds it in the history
+    intervals = record_statuses(statuses, max_gap=conf["stale_after"])
+    cache.set_many({status_key(status["target"]): status for status in statuses}, timeout=None)
+    for status in statuses:
+        if previous.get(status_key(status["target"]), {}).get("status") != status["status"]:
+            broker.publish("postgres", status_event(status))
+    return intervals
+
+
+async def probe_and_save(targets: dict | None = None) -> list:
+    statuses = await prober.probe_all(targets)
+    return await sync_to_async(publish_statuses)(statuses)
+
+
+def get_postgres_status(target: str = "default") -> dict:
+    """Latest status of a target published by the prober, "unknown" if it has not reported recently"""
+    conf = get_probe_settings()
+    status = caches[conf["cache_alias"]].get(status_key(target))
+    if status is None or (now() - status["checked_at"]).total_seconds() > conf["stale_after"]:
+        return {
+            "target": target,
+            "status": "unknown",
+            "latency_ms": None,
+            "error": None,
+            "checked_at": status["checked_at"] if status else None,
+        }
+    return status
+
+
+def save_postgres_status() -> list:
+    """Probes every target once, for callers outside the prober loop (the Django-Q task)"""
+    return run(probe_and_save())
+
+
+async def run_prober(interval: float | None = None, iterations: int | None = None) -> None:
+    """Probes the targets on a fixed cadence, a slow round does not shift the next ones"""
+    interval = interval or get_probe_settings()["interval"]
+    loop = asyncio.get_running_loop()
+    next_run = loop.time()
+    count = 0
+    try:
+        while iterations is None or count < iterations:
+            await sync_to_async(close_old_connections)()
+            await probe_and_save()
+            count += 1
+            next_run += interval
+            # a round longer than the interval skips the missed slots instead of probing back to back
+            while next_run < loop.time():
+                next_run += interval
+            if iterations is None or count < iterations:
+                await asyncio.sleep(next_run - loop.time())
+    finally:
+        prober.close()
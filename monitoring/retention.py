@@ -0,0 +1,290 @@
+import logging
+import os
+import tempfile
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Min
+from django.utils.timezone import now
+
+from .export import batched
+from .models import WeatherData
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RETENTION_SETTINGS = {
+    "raw_days": 90,  # raw readings kept at least this long, None keeps them forever; rollups are never pruned
+    "archive_dir": "archive",  # where expired months are archived before being dropped
+    "chunk_size": 10000,  # rows read or deleted at once
+    "months_ahead": 2,  # PostgreSQL partitions created in advance
+}
+TABLE = WeatherData._meta.db_table
+# partition of the readings outside the monthly ones (see migration 0009)
+DEFAULT_PARTITION = f"{TABLE}_default"
+PARTITION_COLUMNS = ["id", "temperature", "feels_like", "humidity", "pressure", "timestamp", "station_id"]
+# archived columns, nullable numbers are stored as float64 with NaN
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+ARCHIVE_COLUMNS = ["id", "station_id", "timestamp", "temperature", "feels_like", "humidity", "pressure"]
+
+
+def get_retention_settings() -> dict:
+    """Returns the retention settings, overridable with RETENTION"""
+    return {**DEFAULT_RETENTION_SETTINGS, **getattr(settings, "RETENTION", {})}
+
+
+def month_start(timestamp: datetime) -> datetime:
+    """First instant of the UTC month of the timestamp"""
+    timestamp = timestamp.astimezone(timezone.utc)
+    return datetime(timestamp.year, timestamp.month, 1, tzinfo=timezone.utc)
+
+
+def next_month(month: datetime) -> datetime:
+    return (month + timedelta(days=32)).replace(day=1)
+
+
+def months_between(start: datetime, end: datetime) -> list:
+    """The months starting from the one of start, up to the one before end"""
+    months = []
+    month = month_start(start)
+    while month < end:
+        months.append(month)
+        month = next_month(month)
+    return months
+
+
+def retention_boundary(raw_days: int | None, current: datetime | None = None) -> datetime | None:
+    """Months ending at or before this instant are expired; raw readings are kept at least raw_days"""
+    if raw_days is None:
+        return None
+    return month_start((current or now()) - timedelta(days=raw_days))
+
+
+def partition_name(month: datetime) -> str:
+    return f"{TABLE}_p{month:%Y%m}"
+
+
+def is_partitioned() -> bool:
+    """Whether WeatherData is the monthly partitioned table of PostgreSQL (see migration 0009)"""
+    if connection.vendor != "postgresql":
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass", [TABLE])
+        return cursor.fetchone() is not None
+
+
+def partition_months() -> list:
+    """Months of the existing monthly partitions, oldest first"""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = %s::regclass",
+            [TABLE],
+        )
+        names = [name for (name,) in cursor.fetchall()]
+    prefix = f"{TABLE}_p"
+    return sorted(
+        datetime.strptime(name[len(prefix):], "%Y%m").replace(tzinfo=timezone.utc)
+        for name in names
+        if name.startswith(prefix)
+    )
+
+
+def ensure_partitions(months_ahead: int, current: datetime | None = None) -> list:
+    """Creates the partitions of the current month and the next ones; returns the months created"""
+    existing = set(partition_months())
+    month = month_start(current or now())
+    created = []
+    for _ in range(months_ahead + 1):
+        if month not in existing:
+            create_partition(month)
+            created.append(month)
+        month = next_month(month)
+    return created
+
+
+def create_partition(month: datetime) -> None:
+    """Creates the partition of the month, moving there the readings the default partition holds for it.
+
+    PostgreSQL refuses a new partition for rows the default partition already holds,
+    as when the retention did not run for longer than months_ahead.
+    """
+    name = partition_name(month)
+    bounds = [month, next_month(month)]
+    with transaction.atomic(), connection.cursor() as cursor:
+        # no reading can be added to the default partition until the new one takes them
+        cursor.execute(f'LOCK TABLE "{DEFAULT_PARTITION}" IN EXCLUSIVE MODE')
+        cursor.execute(
+            f'SELECT EXISTS (SELECT 1 FROM "{DEFAULT_PARTITION}" WHERE "timestamp" >= %s AND "timestamp" < %s)', bounds
+        )
+        if not cursor.fetchone()[0]:
+            cursor.execute(f'CREATE TABLE "{name}" PARTITION OF "{TABLE}" FOR VALUES FROM (%s) TO (%s)', bounds)
+            return
+        columns = ", ".join(f'"{column}"' for column in PARTITION_COLUMNS)
+        cursor.execute(f'CREATE TABLE "{name}" (LIKE "{TABLE}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)')
+        cursor.execute(
+            f'WITH moved AS (DELETE FROM "{DEFAULT_PARTITION}" WHERE "timestamp" >= %s AND "timestamp" < %s '
+            f'RETURNING {columns}) INSERT INTO "{name}" ({columns}) SELECT {columns} FROM moved',
+            bounds,
+        )
+        cursor.execute(f'ALTER TABLE "{TABLE}" ATTACH PARTITION "{name}" FOR VALUES FROM (%s) TO (%s)', bounds)
+
+
+def expired_months(boundary: datetime, partitioned: bool) -> list:
+    """Months holding raw readings that ended at or before the boundary, oldest first"""
+    if partitioned:
+        months = [month for month in partition_months() if next_month(month) <= boundary]
+    else:
+        months = []
+    # rows of other months: SQLite, or the default partition of PostgreSQL
+    first = WeatherData.objects.filter(timestamp__lt=boundary).aggregate(first=Min("timestamp"))["first"]
+    if first is not None:
+        months = sorted(set(months) | set(months_between(first, boundary)))
+    return months
+
+
+def archive_path(directory, month: datetime) -> Path:
+    return Path(directory) / f"weatherdata-{month:%Y-%m}.npz"
+
+
+ARCHIVE_DTYPES = {
+    "id": np.int64,
+    "station_id": np.int64,
+    # microseconds since the epoch, UTC
+    "timestamp": np.int64,
+    "temperature": np.float64,
+    "feels_like": np.float64,
+    "humidity": np.float64,
+    "pressure": np.float64,
+}
+
+
+def chunk_arrays(rows) -> dict:
+    """Column arrays of a chunk of ARCHIVE_COLUMNS rows"""
+    columns = dict(zip(ARCHIVE_COLUMNS, zip(*rows)))
+    columns["timestamp"] = [round(value.timestamp() * 1_000_000) for value in columns["timestamp"]]
+    return {
+        name: np.fromiter(
+            (np.nan if value is None else value for value in columns[name]), ARCHIVE_DTYPES[name], len(rows)
+        )
+        for name in ARCHIVE_COLUMNS
+    }
+
+
+def archive_month(month: datetime, directory, chunk_size: int) -> tuple:
+    """Writes the readings of the month to a compressed columnar .npz file; returns (path, rows, last id).
+
+    Every chunk of rows is converted to arrays and appended to one raw file per column,
+    compressed from memory maps at the end: the memory used does not grow with the month.
+    The file is written under a temporary name and renamed once complete, so that an
+    interrupted run never leaves a partial archive behind deleted readings.
+    """
+    readings = (
+        WeatherData.objects.filter(timestamp__gte=month, timestamp__lt=next_month(month))
+        .order_by("id")
+        .values_list(*ARCHIVE_COLUMNS)
+    )
+    path = archive_path(directory, month)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    rows = 0
+    last_id = None
+    with tempfile.TemporaryDirectory(dir=path.parent, prefix=".archive-") as work_dir:
+        files = {name: open(Path(work_dir) / name, "wb") for name in ARCHIVE_COLUMNS}
+        try:
+            for chunk in batched(readings.iterator(chunk_size=chunk_size), chunk_size):
+                for name, values in chunk_arrays(chunk).items():
+                    files[name].write(values.tobytes())
+                rows += len(chunk)
+                last_id = chunk[-1][0]
+        finally:
+            for f in files.values():
+                f.close()
+        if not rows:
+            return (path if path.exists() else None), 0, None
+        arrays = {
+            name: np.memmap(Path(work_dir) / name, dtype=ARCHIVE_DTYPES[name], mode="r", shape=(rows,))
+            for name in ARCHIVE_COLUMNS
+        }
+        if path.exists():
+            # an earlier run archived the month, then stopped or got late readings: keep the rows it deleted
+            with np.load(path) as previous:
+                kept = ~np.isin(previous["id"], arrays["id"])
+                arrays = {name: np.concatenate([previous[name][kept], values]) for name, values in arrays.items()}
+        partial = path.with_name(f".{path.name}.partial")
+        with open(partial, "wb") as f:
+            np.savez_compressed(f, **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        # the maps must be closed before their files are removed
+        del arrays
+    os.replace(partial, path)
+    return path, rows, last_id
+
+
+def read_archive(path) -> dict:
+    """Columns of an archive written by archive_month, timestamps as aware datetimes"""
+    with np.load(path) as archive:
+        columns = {name: archive[name] for name in archive.files}
+    columns["timestamp"] = [
+        EPOCH + timedelta(microseconds=int(value)) for value in columns["timestamp"]
+    ]
+    return columns
+
+
+def drop_partition(month: datetime, directory, chunk_size: int) -> tuple:
+    """Archives the partition of the month, then drops it; returns (path, rows)"""
+    name = partition_name(month)
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            # no reading can be added to the month between its archive and the drop
+            cursor.execute(f'LOCK TABLE "{name}" IN EXCLUSIVE MODE')
+        path, rows, _ = archive_month(month, directory, chunk_size)
+        with connection.cursor() as cursor:
+            cursor.execute(f'ALTER TABLE "{TABLE}" DETACH PARTITION "{name}"')
+            cursor.execute(f'DROP TABLE "{name}"')
+    return path, rows
+
+
+def delete_readings(month: datetime, chunk_size: int, last_id: int) -> None:
+    """Deletes the readings of the month up to the last archived id, one chunk per transaction"""
+    # a reading stored meanwhile has a higher id: it is left for the next run to archive
+    readings = WeatherData.objects.filter(timestamp__gte=month, timestamp__lt=next_month(month), id__lte=last_id)
+    while True:
+        # short transactions: the ingestion keeps writing meanwhile
+        with transaction.atomic():
+            ids = list(readings.values_list("id", flat=True)[:chunk_size])
+            if not ids:
+                return
+            WeatherData.objects.filter(id__in=ids).delete()
+
+
+def apply_retention(raw_days: int | None = None, archive_dir=None, current: datetime | None = None) -> list:
+    """Archives then removes the months of raw readings older than the TTL; returns (month, rows, path) per month.
+
+    On PostgreSQL the expired monthly partitions are dropped, elsewhere (and for the rows of
+    the default partition) the readings are deleted in chunks. The rollups are kept: the
+    dashboards read them for long windows, across the archive boundary.
+    """
+    conf = get_retention_settings()
+    raw_days = conf["raw_days"] if raw_days is None else raw_days
+    archive_dir = archive_dir or conf["archive_dir"]
+    partitioned = is_partitioned()
+    if partitioned:
+        ensure_partitions(conf["months_ahead"], current)
+    boundary = retention_boundary(raw_days, current)
+    if boundary is None:
+        return []
+    partitions = set(partition_months()) if partitioned else set()
+    results = []
+    for month in expired_months(boundary, partitioned):
+        if month in partitions:
+            path, rows = drop_partition(month, archive_dir, conf["chunk_size"])
+        else:
+            path, rows, last_id = archive_month(month, archive_dir, conf["chunk_size"])
+            if rows:
+                delete_readings(month, conf["chunk_size"], last_id)
+        logger.info(f"Archived {rows} readings of {month:%Y-%m} to {path}")
+        results.append((month, rows, path))
+    return results
@@ -0,0 +1,175 @@
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Avg, Count, Max, Min
+from django.db.models.functions import TruncMinute
+from django.utils import timezone as django_timezone
+
+from .conditional import touch
+from .inserts import insert_ignoring_conflicts
+from .models import WeatherData, WeatherDataRollup, WeatherStation
+
+# Bucket length in seconds of every rollup resolution, finest first
+RESOLUTIONS = {"5m": 300, "1h": 3600, "1d": 86400}
+ROLLUP_FIELDS = ["count", "temperature_min", "temperature_max", "temperature_avg"]
+
+
+def bucket_start(timestamp: datetime, seconds: int) -> datetime:
+    """Start of the UTC bucket of the given length containing the timestamp"""
+    if django_timezone.is_naive(timestamp):
+        timestamp = django_timezone.make_aware(timestamp)
+    epoch = int(timestamp.timestamp())
+    return datetime.fromtimestamp(epoch - epoch % seconds, tz=timezone.utc)
+
+
+def merge_stats(current, new):
+    """Combines two (count, min, max, avg) tuples"""
+    if current is None:
+        return new
+    count = current[0] + new[0]
+    return (
+        count,
+        min(current[1], new[1]),
+        max(current[2], new[2]),
+        (current[3] * current[0] + new[3] * new[0]) / count,
+    )
+
+
+def add_to_buckets(buckets: dict, station_id, timestamp, stats) -> None:
+    """Folds the stats measured at timestamp into the buckets of every resolution"""
+    for resolution, seconds in RESOLUTIONS.items():
+        key = (station_id, resolution, bucket_start(timestamp, seconds))
+        buckets[key] = merge_stats(buckets.get(key), stats)
+
+
+def update_rollups(readings) -> None:
+    """Folds newly stored WeatherData objects into their buckets, to be called in the ingestion transaction"""
+    buckets = {}
+    for reading in readings:
+        stats = (1, reading.temperature, reading.temperature, reading.temperature)
+        add_to_buckets(buckets, reading.station_id, reading.timestamp, stats)
+    merge_into_stored(buckets)
+    created = insert_ignoring_conflicts(
+        (make_rollup(key, stats) for key, stats in buckets.items()), ["station", "resolution", "bucket_start"]
+    )
+    for rollup in created:
+        del buckets[(rollup.station_id, rollup.resolution, rollup.bucket_start)]
+    # the buckets a concurrent ingestion created since the lookup above, committed now that the insert skipped them
+    merge_into_stored(buckets)
+
+
+def merge_into_stored(buckets: dict) -> None:
+    """Merges the stats of the buckets already stored into them, row locked; removes them from ``buckets``"""
+    if not buckets:
+        return
+    existing = WeatherDataRollup.objects.select_for_update().filter(
+        station_id__in={station_id for station_id, _, _ in buckets},
+        bucket_start__in={start for _, _, start in buckets},
+    )
+    to_update = []
+    for rollup in existing:
+        stats = buckets.pop((rollup.station_id, rollup.resolution, rollup.bucket_start), None)
+        if stats is not None:
+            current = tuple(getattr(rollup, field) for field in ROLLUP_FIELDS)
+            for field, value in zip(ROLLUP_FIELDS, merge_stats(current, stats)):
+                setattr(rollup, field, value)
+            to_update.append(rollup)
+    WeatherDataRollup.objects.bulk_update(to_update, ROLLUP_FIELDS)
+
+
+def make_rollup(key, stats) -> WeatherDataRollup:
+    station_id, resolution, start = key
+    return WeatherDataRollup(
+        station_id=station_id, resolution=resolution, bucket_start=start, **dict(zip(ROLLUP_FIELDS, stats))
+    )
+
+
+def rebuild_rollups(since: datetime | None = None, station_ids=None, until: datetime | None = None) -> int:
+    """Recomputes the rollups from the raw readings, one station at a time; returns the buckets written.
+
+    Only the days still holding raw readings are rebuilt: older rollups summarize archived months.
+    With ``until`` the days from the one holding it on are left untouched.
+    """
+    if since is not None:
+        # start from a whole day so that no bucket of any resolution is rebuilt partially
+        since = bucket_start(since, RESOLUTIONS["1d"])
+    if until is not None:
+        until = bucket_start(until, RESOLUTIONS["1d"])
+    stations = WeatherStation.objects.order_by("id").values_list("id", flat=True)
+    if station_ids:
+        stations = stations.filter(id__in=station_ids)
+    written = 0
+    for station_id in stations:
+        readings = WeatherData.objects.filter(station_id=station_id)
+        # the rollups older than the raw readings left by the retention are all that remains of them
+        first = readings.aggregate(first=Min("timestamp"))["first"]
+        if first is None:
+            continue
+        first_day = bucket_start(first, RESOLUTIONS["1d"])
+        station_since = max(since, first_day) if since is not None else first_day
+        readings = readings.filter(timestamp__gte=station_since)
+        rollups = WeatherDataRollup.objects.filter(station_id=station_id, bucket_start__gte=station_since)
+        if until is not None:
+            readings = readings.filter(timestamp__lt=until)
+            rollups = rollups.filter(bucket_start__lt=until)
+        # the database reduces the readings to one row per minute, Python merges them into buckets
+        minutes = (
+            readings.annotate(minute=TruncMinute("timestamp", tzinfo=timezone.utc))
+            .values("minute")
+            .annotate(
+                count=Count("id"),
+                temperature_min=Min("temperature"),
+                temperature_max=Max("temperature"),
+                temperature_avg=Avg("temperature"),
+            )
+            .order_by()
+        )
+        buckets = {}
+        for row in minutes.iterator():
+            stats = tuple(row[field] for field in ROLLUP_FIELDS)
+            add_to_buckets(buckets, station_id, row["minute"], stats)
+        with transaction.atomic():
+            rollups.delete()
+            WeatherDataRollup.objects.bulk_create(
+                (make_rollup(key, stats) for key, stats in buckets.items()), batch_size=1000
+            )
+            transaction.on_commit(lambda station_id=station_id: touch(f"readings:{station_id}"))
+        written += len(buckets)
+    return written
+
+
+def choose_resolution(window_seconds: float) -> str | None:
+    """Coarsest resolution still giving ROLLUP_MIN_POINTS points over the window, None for raw readings"""
+    for resolution, seconds in reversed(RESOLUTIONS.items()):
+        if window_seconds / seconds >= settings.ROLLUP_MIN_POINTS:
+            return resolution
+    return None
+
+
+def series_start(start_time: datetime) -> datetime:
+    """First timestamp of the series read since start_time: the start of its first rollup bucket"""
+    resolution = choose_resolution((django_timezone.now() - start_time).total_seconds())
+    if resolution is None:
+        return start_time
+    return bucket_start(start_time, RESOLUTIONS[resolution])
+
+
+def get_temperature_series(station, start_time: datetime, since: datetime | None = None) -> list:
+    """Returns (timestamp, temperature) pairs since start_time, read from the best fitting rollup.
+
+    With `since`, the last timestamp a client already holds, only the newer points are read;
+    the rollup bucket starting at `since` is read again as it may have been updated meanwhile.
+    """
+    resolution = choose_resolution((django_timezone.now() - start_time).total_seconds())
+    if resolution is None:
+        readings = WeatherData.objects.filter(station=station, timestamp__gte=start_time)
+        if since is not None:
+            readings = readings.filter(timestamp__gt=since)
+        return list(readings.order_by("timestamp").values_list("timestamp", "temperature"))
+    rollups = WeatherDataRollup.objects.filter(
+        station=station, resolution=resolution, bucket_start__gte=bucket_start(start_time, RESOLUTIONS[resolution])
+    )
+    if since is not None:
+        rollups = rollups.filter(bucket_start__gte=since)
+    return list(rollups.order_by("bucket_start").values_list("bucket_start", "temperature_avg"))
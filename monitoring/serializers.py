@@ -1,9 +1,13 @@
 from datetime import datetime
 
+from django.db import transaction
 from django.utils import timezone
 from rest_framework import serializers
 
+from .json_paths import compile_path
 from .models import WeatherData, WeatherStation
+from .rollups import update_rollups
+from .stations import get_or_create_station
 
 
 class UnixTimestampField(serializers.Field):
@@ -79,23 +83,16 @@ class OpenWeatherSerializer(serializers.ModelSerializer):
         mapped_data["station_name"] = self.get_nested_value(data, "name")
         mapped_data["source"] = "openweather"
         mapped_data["source_id"] = self.get_nested_value(data, "id")
-        print(mapped_data)
 
         return super().to_internal_value(mapped_data)
 
     def get_nested_value(self, data, path):
-        """Extracts nested values based on the JSON key."""
-        print(f"Data_type: {type(data)}")
-        keys = path.split(".")
-        for key in keys:
-            data = data.get(key, None)
-            if data is None:
-                break
-        return data
+        """Extracts nested values based on the JSON key, list indexes included (place.location[0])."""
+        return compile_path(path)(data)
 
-    def create(self, validated_data):
-        """Creates a WeatherData object associated with a WeatherStation object"""
-        station_data = {
+    def pop_station_data(self, validated_data):
+        """Removes the station fields from the validated data and returns them"""
+        return {
             "name": validated_data.pop("name"),
             "source": validated_data.pop("source"),
             "source_id": validated_data.pop("id"),
@@ -103,10 +100,20 @@ class OpenWeatherSerializer(serializers.ModelSerializer):
             "latitude": validated_data.pop("latitude", None),
             "locality": validated_data.pop("locality", None),
         }
-        # create or get the station
-        station, _ = WeatherStation.objects.get_or_create(**station_data)
+
+    def create(self, validated_data):
+        """Creates a WeatherData object associated with a WeatherStation object"""
+        station_data = self.pop_station_data(validated_data)
+        # create or get the station, keyed by (source, source_id)
+        station = get_or_create_station(station_data)
         # create the weather data
-        weather_data = WeatherData.objects.create(station=station, **validated_data)
+        with transaction.atomic():
+            # a reading already stored for the same station and time is returned as is
+            weather_data, created = WeatherData.objects.get_or_create(
+                station=station, timestamp=validated_data.pop("timestamp"), defaults=validated_data
+            )
+            if created:
+                update_rollups([weather_data])
         return weather_data
 
 
@@ -155,10 +162,7 @@ class NetatmoSerializer(serializers.ModelSerializer):
         """Maps Netatmo JSON fields to Django fields."""
         mapped_data = {key: self.get_nested_value(data, path) for key, path in self.field_mapping.items()}
         for _, sub_item in mapped_data.pop("measures").items():
-            print(f"measure: {sub_item}")
             if "type" in sub_item.keys():
-                print(f"measure type: {sub_item['type']}")
-                print(f"types number: {len(sub_item['type'])}")
                 for index, metrics_type in enumerate(sub_item["type"]):
                     mapped_data[metrics_type] = next(iter(sub_item["res"].values()))[index]
                     ts_value = next(iter(sub_item["res"].keys()))
@@ -166,23 +170,15 @@ class NetatmoSerializer(serializers.ModelSerializer):
         mapped_data["name"] = " - ".join([mapped_data.get("city"), mapped_data.get("street")])
         mapped_data["source"] = "netatmo"
         mapped_data["locality"] = mapped_data.pop("street")
-        print(mapped_data)
         return super().to_internal_value(mapped_data)
 
     def get_nested_value(self, data, path):
-        """Extracts nested values based on the JSON key."""
-        keys = path.split(".")
-        print(f"Data_type: {type(data)}")
-        print(f"Keys: {keys}")
-        for key in keys:
-            data = data.get(key, None)
-            if data is None:
-                break
-        return data
+        """Extracts nested values based on the JSON key, list indexes included (place.location[0])."""
+        return compile_path(path)(data)
 
-    def create(self, validated_data):
-        """Creates a WeatherData object associated with a WeatherStation object"""
-        station_data = {
+    def pop_station_data(self, validated_data):
+        """Removes the station fields from the validated data and returns them"""
+        return {
             "name": validated_data.pop("name"),
             "source": validated_data.pop("source"),
             "source_id": validated_data.pop("_id"),
@@ -191,8 +187,18 @@ class NetatmoSerializer(serializers.ModelSerializer):
             "latitude": validated_data.pop("latitude", None),
             "locality": validated_data.pop("locality", None),
         }
-        # create or get the station
-        station, _ = WeatherStation.objects.get_or_create(**station_data)
+
+    def create(self, validated_data):
+        """Creates a WeatherData object associated with a WeatherStation object"""
+        station_data = self.pop_station_data(validated_data)
+        # create or get the station, keyed by (source, source_id)
+        station = get_or_create_station(station_data)
         # create the weather data
-        weather_data = WeatherData.objects.create(station=station, **validated_data)
+        with transaction.atomic():
+            # a reading already stored for the same station and time is returned as is
+            weather_data, created = WeatherData.objects.get_or_create(
+                station=station, timestamp=validated_data.pop("timestamp"), defaults=validated_data
+            )
+            if created:
+                update_rollups([weather_data])
         return weather_data
@@ -1,103 +1,189 @@
 import asyncio
 import json
 import logging
-import time
 
-import psycopg2
 from asgiref.sync import sync_to_async
 from django.conf import settings
-from django.utils.timezone import now
+from django.db import IntegrityError, transaction
 
-from .models import PostgresStatusLog
+from . import decoders, metrics
+from .api_clients.errors import ProviderError, ProviderResponseError
+from .api_clients.single_flight import coalesce
+from .conditional import touch
+from .events import broker
+from .inserts import insert_ignoring_conflicts
+from .models import WeatherData
+from .rollups import update_rollups
 from .serializers import NetatmoSerializer, OpenWeatherSerializer
+from .stations import get_or_create_stations, station_cache, station_key
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def log_function_call_with_timing(func):
-    def wrapper(*args, **kwargs):
-        start_time = time.time()
-        logging.info(
-            f"{now()} - Calling function: {func.__name__} with arguments: {args} and keyword arguments: {kwargs}"
-        )
-        result = func(*args, **kwargs)
-        end_time = time.time()
-        execution_time = end_time - start_time
-        logging.info(f"Function: {func.__name__} returned: {result} (Execution time: {execution_time:.4f} seconds)")
-        return result
+def validate_serializers(serializers):
+    """Validates every serializer in memory, returns the (station_data, reading_data) rows and the results"""
+    results = []
+    rows = []
+    for serializer in serializers:
+        if serializer.is_valid():
+            reading_data = dict(serializer.validated_data)
+            station_data = serializer.pop_station_data(reading_data)
+            rows.append((station_data, reading_data))
+            results.append((True, "Success"))
+        else:
+            results.append((False, serializer.errors))
+    return rows, results
+
 
-    return wrapper
+def decode_response(source, json_data):
+    """Decodes a provider response with the compiled decoders, or the serializers in "strict" mode"""
+    with metrics.decode.track(source=source):
+        if settings.INGESTION_DECODER == "strict":
+            return validate_serializers(build_serializers(source, json_data))
+        return decoders.decode_response(source, json_data)
 
 
-# Example: save the serializer synchronously but call it in an asynchronous context
 @sync_to_async
-def save_serializer(serializer):
-    if serializer.is_valid():
-        serializer.save()
-        return True, "Success"
-    else:
-        return False, serializer.errors
+def save_responses(responses):
+    """Decodes (source, json_data) provider responses and saves all their readings in a single transaction"""
+    rows = []
+    results = []
+    for source, json_data in responses:
+        response_rows, response_results = decode_response(source, json_data)
+        rows.extend(response_rows)
+        results.extend(response_results)
+    if rows:
+        try:
+            save_rows(rows)
+        except IntegrityError:
+            # a cached station was deleted meanwhile: forget the cached ids and try once more
+            station_cache.clear()
+            save_rows(rows)
+    return results
+
+
+def save_rows(rows):
+    """Saves (station_data, reading_data) pairs with bulk queries in a single transaction"""
+    with metrics.db_write.track(), transaction.atomic():
+        stations = get_or_create_stations(station_data for station_data, _ in rows)
+        readings = insert_new_readings(
+            WeatherData(station=stations[station_key(station_data)], **reading_data)
+            for station_data, reading_data in rows
+        )
+        update_rollups(readings)
+        # the dashboards polling these stations fetch them again, the others keep getting 304
+        transaction.on_commit(lambda: touch(*{f"readings:{reading.station_id}" for reading in readings}))
+        # dashboards connected to this process get the readings once they are visible
+        transaction.on_commit(
+            lambda: broker.publish_readings(
+                [(reading.station_id, reading.timestamp, reading.temperature) for reading in readings]
+            )
+        )
+    metrics.readings_inserted.inc(len(readings))
+
+
+def insert_new_readings(readings, lookup_size=500):
+    """Inserts the readings whose (station, timestamp) is not stored yet and returns those written.
+
+    Re-polling a provider inside its update window returns readings already stored:
+    they are found through the unique (station, timestamp) index and skipped.
+    """
+    unique_readings = {}
+    for reading in readings:
+        unique_readings.setdefault((reading.station_id, reading.timestamp), reading)
+    keys = list(unique_readings)
+    stored = set()
+    for index in range(0, len(keys), lookup_size):
+        chunk = keys[index : index + lookup_size]
+        existing = WeatherData.objects.filter(
+            station_id__in={station_id for station_id, _ in chunk},
+            timestamp__in={timestamp for _, timestamp in chunk},
+        )
+        stored.update(existing.values_list("station_id", "timestamp"))
+    new_readings = [reading for key, reading in unique_readings.items() if key not in stored]
+    # rows a concurrent worker committed after the lookup are skipped by the database, and not returned:
+    # they are already in its rollups, metrics and events
+    return insert_ignoring_conflicts(new_readings, ["station", "timestamp"])
 
 
 async def fetch_and_save_weather(api_client, **kwargs):
-    json_data = None  # Initialize json_data to avoid UnboundLocalError
+    """Fetches and saves one response; identical concurrent calls share the fetch, the save and the result"""
+    return await coalesce(
+        api_client.source, "fetch-and-save", kwargs, lambda: _fetch_and_save_weather(api_client, **kwargs)
+    )
+
+
+async def _fetch_and_save_weather(api_client, **kwargs):
     try:
         json_data = await api_client.get_weather_data(**kwargs)
-    except Exception as e:
-        if json_data and "403" in json_data:
+    except ProviderResponseError as e:
+        if e.status in (401, 403):
             return {"error": f"Unauthorized {str(e)}"}
-        elif json_data and "404" in json_data:
+        elif e.status == 404:
             return {"error": "No data found"}
-        elif json_data and "500" in json_data:
-            return {"error": "Internal server error"}
-        else:
-            return {"error": f"Unexpected error: {str(e)}"}
-    # temporary debug print
-    print(f"Data_type: {type(json_data)}")
+        return {"error": str(e)}
+    except ProviderError as e:
+        # unavailable provider, open circuit, deadline or rate limit: the message tells which
+        return {"error": str(e)}
+    except Exception as e:
+        return {"error": f"Unexpected error: {str(e)}"}
+    results = await save_responses([(api_client.source, json_data)])
+    return summarize_results(results, partial_errors(json_data))
+
+
+def partial_errors(json_data) -> list:
+    """Errors of the parts of a response that could not be fetched, the tiles of a Netatmo box"""
+    return json_data.get("errors", []) if isinstance(json_data, dict) else []
+
+
+def build_serializers(source, json_data):
+    """Creates the serializers adapting a provider response to the models"""
     serializers = []
-    if api_client.source == "openweather":
+    if source == "openweather":
         serializers.append(OpenWeatherSerializer(data=json_data))
-    elif api_client.source == "netatmo":
-        for station in json.loads(json_data).get("body", []):
+    elif source == "netatmo":
+        if isinstance(json_data, str):
+            json_data = json.loads(json_data)
+        for station in json_data.get("body", []):
             serializers.append(NetatmoSerializer(data=station))
     else:
         raise ValueError("Invalid source")
-    coros = []
-    for serializer in serializers:
-        coros.append(save_serializer(serializer))
-    results = await asyncio.gather(*coros)
-    success = all(result[0] for result in results)
-    errors = [error for success, error in results if not success]
+    return serializers
+
+
+def summarize_results(results, errors=None):
+    """Builds the result dict from the (success, error) pairs returned by the save"""
+    errors = list(errors or []) + [error for success, error in results if not success]
     count = len(results)
 
-    if success:
+    if not errors:
         return {"message": f"N. {count} dati salvati con successo!"}
     else:
         return {"error": errors}
 
 
-@log_function_call_with_timing
-def check_postgres_status():
-    try:
-        conn = psycopg2.connect(
-            dbname=settings.DATABASE_TO_MONITOR["default"]["NAME"],
-            user=settings.DATABASE_TO_MONITOR["default"]["USER"],
-            password=settings.DATABASE_TO_MONITOR["default"]["PASSWORD"],
-            host=settings.DATABASE_TO_MONITOR["default"]["HOST"],
-            port=settings.DATABASE_TO_MONITOR["default"]["PORT"],
-        )
-        conn.close()
-        return True
-    except Exception as e:
-        print(f"Postgres Error: {e}")
-        return False
+async def fetch_many_and_save_weather(client_class, locations, concurrency=None):
+    """Fetches many locations concurrently in one event loop and saves all the readings in one batch.
 
+    At most ``concurrency`` requests (WEATHER_FETCH_CONCURRENCY by default) are in flight at once;
+    a failed fetch is reported in the errors without discarding the other locations.
+    """
+    semaphore = asyncio.Semaphore(concurrency or settings.WEATHER_FETCH_CONCURRENCY)
 
-@log_function_call_with_timing
-def save_postgres_status():
-    status = check_postgres_status()
-    if status:
-        return PostgresStatusLog.objects.create(status="up")
-    else:
-        return PostgresStatusLog.objects.create(status="down")
+    async def fetch(params):
+        async with semaphore:
+            api_client = client_class()
+            return api_client.source, await api_client.get_weather_data(**params)
+
+    responses = await asyncio.gather(*(fetch(params) for params in locations), return_exceptions=True)
+    fetched = []
+    errors = []
+    for params, response in zip(locations, responses):
+        if isinstance(response, Exception):
+            errors.append(f"Unexpected error fetching {params}: {response}")
+        else:
+            fetched.append(response)
+            errors.extend(partial_errors(response[1]))
+    results = await save_responses(fetched)
+    return summarize_results(results, errors)
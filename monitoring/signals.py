@@ -0,0 +1,23 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django_q.models import Task
+
+from .conditional import touch
+from .models import WeatherStation
+from .stations import station_cache
+from .task_stats import record_task
+
+
+@receiver(post_save, sender=WeatherStation)
+@receiver(post_delete, sender=WeatherStation)
+def invalidate_station_cache(sender, instance, **kwargs):
+    """Keeps the station cache in sync with edits made in the admin or elsewhere"""
+    station_cache.invalidate(instance)
+
+
+@receiver(post_save, sender=Task)
+def count_task(sender, instance, created, **kwargs):
+    """Saved by the Django-Q cluster after every attempt of a task: counts it in the task statistics"""
+    record_task(instance, created)
+    transaction.on_commit(lambda: touch("tasks"))
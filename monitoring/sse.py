@@ -0,0 +1,80 @@
+import asyncio
+import json
+from urllib.parse import parse_qs
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .events import TOPICS, broker, get_events_settings, relay
+
+# Served by weatherapp/asgi.py in front of Django: the stream must end as soon as the
+# client goes away, which the Django 4.2 ASGI handler does not notice for streaming responses
+SSE_PATH = "/monitoring/events"
+
+
+def format_event(topic: str, data) -> bytes:
+    return f"event: {topic}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n".encode()
+
+
+def filter_event(topic: str, data, station_ids: set, target: str | None):
+    """Keeps what the dashboard asked for, None when nothing is left to send"""
+    if topic == "readings" and station_ids:
+        data = [reading for reading in data if str(reading["station_id"]) in station_ids]
+        return data or None
+    if topic == "postgres" and target and data["target"] != target:
+        return None
+    return data
+
+
+async def wait_for_disconnect(receive) -> None:
+    while (await receive())["type"] != "http.disconnect":
+        pass
+
+
+async def sse_application(scope, receive, send) -> None:
+    """Streams dashboard events as Server-Sent Events.
+
+    Query parameters: topics (comma separated, default all), station_id (repeatable,
+    filters readings) and target (filters Postgres status changes).
+    """
+    if scope["method"] != "GET":
+        await send({"type": "http.response.start", "status": 405, "headers": [(b"allow", b"GET")]})
+        await send({"type": "http.response.body", "body": b""})
+        return
+    params = parse_qs(scope["query_string"].decode())
+    topics = set(",".join(params.get("topics", [])).split(",")) & TOPICS or TOPICS
+    station_ids = set(params.get("station_id", []))
+    target = params.get("target", [None])[0]
+    heartbeat = get_events_settings()["heartbeat"]
+
+    subscription = broker.subscribe(topics)
+    relay.ensure_running()
+    disconnect = asyncio.ensure_future(wait_for_disconnect(receive))
+    try:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"text/event-stream"),
+                    (b"cache-control", b"no-cache"),
+                    # keeps nginx from buffering the stream
+                    (b"x-accel-buffering", b"no"),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": b": connected\n\n", "more_body": True})
+        while not disconnect.done():
+            event = asyncio.ensure_future(subscription.get())
+            done, _ = await asyncio.wait({event, disconnect}, timeout=heartbeat, return_when=asyncio.FIRST_COMPLETED)
+            if event not in done:
+                event.cancel()
+                if not disconnect.done():
+                    await send({"type": "http.response.body", "body": b": keep-alive\n\n", "more_body": True})
+                continue
+            topic, data = event.result()
+            data = filter_event(topic, data, station_ids, target)
+            if data is not None:
+                await send({"type": "http.response.body", "body": format_event(topic, data), "more_body": True})
+    finally:
+        subscription.close()
+        disconnect.cancel()
@@ -0,0 +1,120 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Q
+
+from .models import WeatherStation
+
+DEFAULT_STATION_CACHE_SETTINGS = {
+    "max_size": 10000,  # stations kept in memory per process
+    "ttl": 3600,  # seconds before a cached station is looked up again
+}
+
+
+def station_key(station_data) -> tuple:
+    """Identity of a station: the provider and the id it has there"""
+    return station_data["source"], str(station_data["source_id"])
+
+
+class StationCache:
+    """Bounded LRU cache of WeatherStation objects keyed by (source, source_id).
+
+    Entries expire after ``ttl`` seconds, so edits made in another process are
+    picked up eventually; edits made in this process invalidate them at once.
+    """
+
+    def __init__(self, max_size: int, ttl: float) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, station) -> None:
+        with self._lock:
+            self._entries[key] = (station, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, station) -> None:
+        """Drops every entry pointing to the station, including keys it no longer has"""
+        with self._lock:
+            stale = [key for key, (cached, _) in self._entries.items() if cached.pk == station.pk]
+            stale.append(station_key({"source": station.source, "source_id": station.source_id}))
+            for key in stale:
+                self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+station_cache = StationCache(**{**DEFAULT_STATION_CACHE_SETTINGS, **getattr(settings, "STATION_CACHE", {})})
+
+
+def get_or_create_station(station_data) -> WeatherStation:
+    """Returns the station for (source, source_id), querying the database only on cache misses"""
+    key = station_key(station_data)
+    station = station_cache.get(key)
+    if station is None:
+        defaults = {name: value for name, value in station_data.items() if name not in ("source", "source_id")}
+        station, _ = WeatherStation.objects.get_or_create(source=key[0], source_id=key[1], defaults=defaults)
+        station_cache.set(key, station)
+    return station
+
+
+def get_or_create_stations(stations_data) -> dict:
+    """Resolves many stations at once: cache first, then one query and one bulk insert for the misses"""
+    stations = {}
+    missing = {}
+    for station_data in stations_data:
+        key = station_key(station_data)
+        if key in stations or key in missing:
+            continue
+        station = station_cache.get(key)
+        if station is not None:
+            stations[key] = station
+        else:
+            missing[key] = {**station_data, "source_id": key[1]}
+    if not missing:
+        return stations
+
+    found = _fetch_stations(missing)
+    to_create = [WeatherStation(**data) for key, data in missing.items() if key not in found]
+    if to_create:
+        # another worker may create the same stations concurrently: skip them and read them back
+        WeatherStation.objects.bulk_create(to_create, ignore_conflicts=True)
+        found.update(_fetch_stations({key: missing[key] for key in missing if key not in found}))
+    for key, station in found.items():
+        station_cache.set(key, station)
+        stations[key] = station
+    return stations
+
+
+def _fetch_stations(keys) -> dict:
+    ids_by_source = {}
+    for source, source_id in keys:
+        ids_by_source.setdefault(source, []).append(source_id)
+    lookup = Q()
+    for source, source_ids in ids_by_source.items():
+        lookup |= Q(source=source, source_id__in=source_ids)
+    return {(station.source, station.source_id): station for station in WeatherStation.objects.filter(lookup)}
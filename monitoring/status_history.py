@@ -0,0 +1,103 @@
+from datetime import datetime
+
+from django.db import transaction
+from django.db.models import Max
+
+from .models import PostgresStatusInterval
+
+
+def extend_interval(interval: PostgresStatusInterval, checked_at: datetime, latency_ms) -> None:
+    """Folds one more probe with the same status into the interval"""
+    interval.ended_at = checked_at
+    if latency_ms is not None:
+        if interval.latency_avg is None:
+            interval.latency_min = interval.latency_max = interval.latency_avg = latency_ms
+        else:
+            interval.latency_min = min(interval.latency_min, latency_ms)
+            interval.latency_max = max(interval.latency_max, latency_ms)
+            interval.latency_avg += (latency_ms - interval.latency_avg) / (interval.sample_count + 1)
+    interval.sample_count += 1
+
+
+def new_interval(status: dict) -> PostgresStatusInterval:
+    latency_ms = status["latency_ms"]
+    return PostgresStatusInterval(
+        target=status["target"],
+        status=status["status"],
+        started_at=status["checked_at"],
+        ended_at=status["checked_at"],
+        latency_min=latency_ms,
+        latency_max=latency_ms,
+        latency_avg=latency_ms,
+    )
+
+
+def record_statuses(statuses: list, max_gap: float) -> list:
+    """Extends the open interval of every target, or starts a new one when its status changed.
+
+    A probe coming more than max_gap seconds after the previous one also starts a new
+    interval: nothing is known about the target while the prober was not running.
+    Returns the intervals written.
+    """
+    with transaction.atomic():
+        latest_ids = (
+            PostgresStatusInterval.objects.filter(target__in={status["target"] for status in statuses})
+            .values("target")
+            .annotate(latest_id=Max("id"))
+            .values_list("latest_id", flat=True)
+        )
+        latest = {
+            interval.target: interval
+            for interval in PostgresStatusInterval.objects.select_for_update().filter(id__in=list(latest_ids))
+        }
+        to_update = []
+        to_create = []
+        for status in statuses:
+            interval = latest.get(status["target"])
+            if interval is not None and (status["checked_at"] - interval.ended_at).total_seconds() <= max_gap:
+                if interval.status == status["status"]:
+                    extend_interval(interval, status["checked_at"], status["latency_ms"])
+                    to_update.append(interval)
+                    continue
+                # the previous status held until this transition
+                interval.ended_at = status["checked_at"]
+                to_update.append(interval)
+            to_create.append(new_interval(status))
+        PostgresStatusInterval.objects.bulk_update(
+            to_update, ["ended_at", "sample_count", "latency_min", "latency_max", "latency_avg"]
+        )
+        PostgresStatusInterval.objects.bulk_create(to_create)
+    return to_update + to_create
+
+
+def get_intervals(target: str, start: datetime, end: datetime):
+    """Intervals of the target overlapping [start, end], oldest first"""
+    return PostgresStatusInterval.objects.filter(target=target, ended_at__gte=start, started_at__lte=end).order_by(
+        "started_at"
+    )
+
+
+def availability(target: str, start: datetime, end: datetime) -> dict:
+    """Seconds spent up and down within [start, end], from the intervals: O(transitions).
+
+    Time not covered by any interval (prober not running) counts neither as up nor as down.
+    """
+    seconds = {"up": 0.0, "down": 0.0}
+    for status, started_at, ended_at in get_intervals(target, start, end).values_list(
+        "status", "started_at", "ended_at"
+    ):
+        seconds[status] += max(0.0, (min(ended_at, end) - max(started_at, start)).total_seconds())
+    observed = seconds["up"] + seconds["down"]
+    return {**seconds, "availability": seconds["up"] / observed if observed else None}
+
+
+def status_series(target: str, start: datetime, end: datetime) -> list:
+    """(timestamp, 1 for up / 0 for down) points drawing the status of the target as steps"""
+    series = []
+    for status, started_at, ended_at in get_intervals(target, start, end).values_list(
+        "status", "started_at", "ended_at"
+    ):
+        value = 1 if status == "up" else 0
+        series.append((max(started_at, start), value))
+        series.append((min(ended_at, end), value))
+    return series
@@ -0,0 +1,100 @@
+import bisect
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.timezone import now
+
+from .models import TaskStatBucket
+
+DEFAULT_TASK_STATS_SETTINGS = {
+    "window_minutes": 60,  # buckets summed by the dashboard
+    "keep_days": 7,  # older buckets are deleted
+}
+# Upper bounds in seconds of the task duration buckets
+DURATION_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+
+def get_task_stats_settings() -> dict:
+    """Returns the task statistics settings, overridable with TASK_STATS"""
+    return {**DEFAULT_TASK_STATS_SETTINGS, **getattr(settings, "TASK_STATS", {})}
+
+
+def minute_start(timestamp: datetime) -> datetime:
+    return timestamp.replace(second=0, microsecond=0)
+
+
+def record_task(task, created: bool = True) -> None:
+    """Counts a task saved by the Django-Q cluster in the bucket of its function and minute.
+
+    A retried task is saved again with the outcome of the new attempt: the outcome is
+    counted, not the duration, its `started` being the one of the first attempt.
+    """
+    minute = minute_start(task.stopped or now())
+    with transaction.atomic():
+        bucket, new_bucket = TaskStatBucket.objects.select_for_update().get_or_create(
+            minute=minute, func=task.func, defaults={"duration_buckets": [0] * (len(DURATION_BUCKETS) + 1)}
+        )
+        if task.success:
+            bucket.success_count += 1
+        else:
+            bucket.failure_count += 1
+        if created and task.started and task.stopped:
+            duration = (task.stopped - task.started).total_seconds()
+            bucket.duration_sum += duration
+            bucket.duration_buckets[bisect.bisect_left(DURATION_BUCKETS, duration)] += 1
+        bucket.save()
+    if new_bucket:
+        # at most once a minute and function
+        keep_days = get_task_stats_settings()["keep_days"]
+        TaskStatBucket.objects.filter(minute__lt=minute - timedelta(days=keep_days)).delete()
+
+
+def percentile(counts: list, q: float) -> float | None:
+    """Duration under which a fraction q of the tasks ran, interpolated within its bucket"""
+    total = sum(counts)
+    if not total:
+        return None
+    rank = q * total
+    cumulative = 0
+    for index, count in enumerate(counts):
+        if count and cumulative + count >= rank:
+            if index == len(DURATION_BUCKETS):
+                # above the last bound: the bound is all that is known
+                return DURATION_BUCKETS[-1]
+            lower = DURATION_BUCKETS[index - 1] if index else 0.0
+            return lower + (DURATION_BUCKETS[index] - lower) * (rank - cumulative) / count
+        cumulative += count
+    return DURATION_BUCKETS[-1]
+
+
+def get_task_summary(minutes: int | None = None) -> dict:
+    """Task counts of the last `minutes` buckets, in total and per function with p50/p95 durations"""
+    minutes = minutes or get_task_stats_settings()["window_minutes"]
+    since = minute_start(now()) - timedelta(minutes=minutes - 1)
+    functions = {}
+    for bucket in TaskStatBucket.objects.filter(minute__gte=since).iterator():
+        summary = functions.setdefault(
+            bucket.func,
+            {
+                "func": bucket.func,
+                "success_count": 0,
+                "failure_count": 0,
+                "duration_sum": 0.0,
+                "duration_buckets": [0] * (len(DURATION_BUCKETS) + 1),
+            },
+        )
+        summary["success_count"] += bucket.success_count
+        summary["failure_count"] += bucket.failure_count
+        summary["duration_sum"] += bucket.duration_sum
+        for index, count in enumerate(bucket.duration_buckets):
+            summary["duration_buckets"][index] += count
+    for summary in functions.values():
+        summary["p50"] = percentile(summary["duration_buckets"], 0.5)
+        summary["p95"] = percentile(summary["duration_buckets"], 0.95)
+    return {
+        "success_count": sum(summary["success_count"] for summary in functions.values()),
+        "failure_count": sum(summary["failure_count"] for summary in functions.values()),
+        "functions": sorted(functions.values(), key=lambda summary: summary["func"]),
+        "window_minutes": minutes,
+    }
@@ -1,9 +1,11 @@
-import asyncio
 from django.conf import settings
 
 from .api_clients.netatmo import NetatmoAPIClient
 from .api_clients.openweather import OpenWeatherAPIClient
-from .services import fetch_and_save_weather, save_postgres_status
+from .api_clients.session import run
+from .postgres_probe import save_postgres_status
+from .retention import apply_retention
+from .services import fetch_and_save_weather, fetch_many_and_save_weather
 
 LAT = float(settings.LATITUDE)
 LON = float(settings.LONGITUDE)
@@ -16,7 +18,18 @@ LON_SW = float(settings.LONGITUDE_SW)
 def fetch_weather_task(lat: float = LAT, lon: float = LON):
     """Launches data collection from OpenWeather"""
     api_client = OpenWeatherAPIClient()
-    asyncio.run(fetch_and_save_weather(api_client, lat=lat, lon=lon))
+    run(fetch_and_save_weather(api_client, lat=lat, lon=lon))
+
+
+def fetch_weather_locations_task(locations="default", concurrency: int | None = None):
+    """Launches data collection from OpenWeather for many locations in a single event loop.
+
+    ``locations`` is either a list of (lat, lon) pairs or the name of a set in WEATHER_LOCATIONS.
+    """
+    if isinstance(locations, str):
+        locations = settings.WEATHER_LOCATIONS[locations]
+    params = [{"lat": float(lat), "lon": float(lon)} for lat, lon in locations]
+    return run(fetch_many_and_save_weather(OpenWeatherAPIClient, params, concurrency))
 
 
 def fetch_netatmo_weather_task(
@@ -24,9 +37,14 @@ def fetch_netatmo_weather_task(
 ):
     """Launches data collection from Netatmo."""
     api_client = NetatmoAPIClient()
-    asyncio.run(fetch_and_save_weather(api_client, lat_ne=lat_ne, lon_ne=lon_ne, lat_sw=lat_sw, lon_sw=lon_sw))
+    run(fetch_and_save_weather(api_client, lat_ne=lat_ne, lon_ne=lon_ne, lat_sw=lat_sw, lon_sw=lon_sw))
 
 
 def check_postgres_task():
-    """Launches the check for Postgres status"""
+    """Launches the check for Postgres status, when the probe_postgres command is not running"""
     save_postgres_status()
+
+
+def apply_retention_task():
+    """Archives and drops the raw readings older than the retention TTL, to schedule daily"""
+    return [(f"{month:%Y-%m}", rows, str(path)) for month, rows, path in apply_retention()]
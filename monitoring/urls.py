@@ -1,6 +1,6 @@
 from django.urls import path
 
-from .views import (monitor_view, postgres_dashboard, postgres_status_page,
+from .views import (export_readings, metrics_view, monitor_view, postgres_dashboard, postgres_status_page,
                     postgres_status_view, task_dashboard, task_stats_partial,
                     temperature_dashboard, temperature_data_partial)
 
@@ -13,4 +13,6 @@ urlpatterns = [
     path("postgres/", postgres_status_page, name="postgres_status_page"),
     path("postgres_status/", postgres_status_view, name="postgres_status_view"),
     path("postgres/dashboard/", postgres_dashboard, name="postgres_dashboard"),
+    path("export/", export_readings, name="export_readings"),
+    path("metrics", metrics_view, name="metrics"),
 ]
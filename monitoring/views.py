@@ -1,16 +1,32 @@
 import json
+import time
+from datetime import datetime, timezone
 
-from django.http import JsonResponse
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
-from django.utils.timezone import now, timedelta
-from django_q.models import Failure, Success
+from django.template.loader import render_to_string
+from django.utils.dateparse import parse_datetime
+from django.utils.text import compress_sequence
+from django.utils.timezone import is_naive, make_aware, now, timedelta
 
 from .api_clients.netatmo import NetatmoAPIClient
 from .api_clients.openweather import OpenWeatherAPIClient
+from .conditional import conditional, get_conditional_settings, last_modified
+from .downsampling import downsample_series
+from .export import ENCODERS, FORMATS, aiterate, export_rows, get_export_settings
 from .forms import NetatmoForm, OpenWeatherForm
-from .models import PostgresStatusLog, WeatherData, WeatherStation
+from .fragments import get_fragment
+from .metrics import registry
+from .models import WeatherStation
+from .postgres_probe import get_postgres_status, get_targets
+from .rollups import bucket_start, get_temperature_series, series_start
 from .serializers import NetatmoSerializer, OpenWeatherSerializer
-from .services import check_postgres_status, fetch_and_save_weather
+from .services import fetch_and_save_weather
+from .sse import SSE_PATH
+from .status_history import availability, status_series
+from .task_stats import get_task_summary
 
 # Define the available intervals
 INTERVALS = {
@@ -20,6 +36,24 @@ INTERVALS = {
     "12h": timedelta(hours=12),
     "24h": timedelta(hours=24),
 }
+DEFAULT_INTERVAL = "1h"
+# a chart window moves forward in steps of 1/WINDOW_STEPS of its interval: 1 minute for the last hour
+WINDOW_STEPS = 60
+
+
+def get_interval(request) -> str:
+    """The interval key asked for, the default one when it is not in INTERVALS: it is part of cache keys"""
+    interval = request.GET.get("interval", DEFAULT_INTERVAL)
+    return interval if interval in INTERVALS else DEFAULT_INTERVAL
+
+
+def window_end(interval: str) -> datetime:
+    """End of the chart window of the interval: now, rounded down to a step of the window.
+
+    It is part of the fragment key and of the validators, so that a chart slides forward
+    without new readings once per step instead of on every request.
+    """
+    return bucket_start(now(), int(INTERVALS[interval].total_seconds()) // WINDOW_STEPS)
 
 
 # Asynchronous view (requires Django 4.2+ and ASGI server)
@@ -62,102 +96,219 @@ async def monitor_view(request):
 
 async def task_dashboard(request):
     """Main page with live task graph and panel"""
-    return render(request, "monitoring/task_dashboard.html")
+    return render(request, "monitoring/task_dashboard.html", {"events_url": SSE_PATH})
 
 
+def task_stats_validators(request):
+    """Version of the task counts: the last task saved, and the last tick as tasks leave the hour"""
+    granularity = get_conditional_settings()["task_granularity"]
+    tick = datetime.fromtimestamp(time.time() // granularity * granularity, tz=timezone.utc)
+    modified = max(last_modified("tasks"), tick)
+    return f"tasks-{modified.timestamp()}", modified
+
+
+@conditional(task_stats_validators)
 async def task_stats_partial(request):
     """HTMX view that returns only updated task data"""
-    one_hour_ago = now() - timedelta(hours=1)
-    success_count = await Success.objects.filter(stopped__gte=one_hour_ago).acount()
-    failure_count = await Failure.objects.filter(started__gte=one_hour_ago).acount()
-
-    return render(
-        request,
-        "monitoring/partials/task_stats_partial.html",
-        {"success_count": success_count, "failure_count": failure_count},
-    )
+    # per-minute buckets counted as the cluster saves the tasks, the task tables are not scanned
+    summary = await sync_to_async(get_task_summary)()
+    return render(request, "monitoring/partials/task_stats_partial.html", summary)
 
 
 def temperature_dashboard(request):
     """Main page with live temperature graph and panel"""
     stations = WeatherStation.objects.all()
-    return render(request, "monitoring/temperature_dashboard.html", {"stations": stations})
+    return render(request, "monitoring/temperature_dashboard.html", {"stations": stations, "events_url": SSE_PATH})
+
+
+def temperature_validators(request):
+    """Version of the temperature data: the last ingestion of readings of the station and the step of the window"""
+    modified = last_modified(f"readings:{request.GET.get('station_id')}")
+    end = window_end(get_interval(request))
+    return f"readings-{modified.timestamp()}-{end.timestamp()}", max(modified, end)
 
 
+@conditional(temperature_validators)
 def temperature_data_partial(request):
-    """Partial view called by HTMX to update temperature data"""
+    """Partial view called by HTMX to update temperature data.
+
+    With a `since` cursor (the last timestamp the chart holds) only the newer points are
+    returned, with the start of the window so that the chart drops the older ones.
+    """
     station_id = request.GET.get("station_id")
-    interval = request.GET.get("interval", "1")
     # Validate the chosen interval
-    time_delta = INTERVALS.get(interval, timedelta(hours=1))
-    start_time = now() - time_delta
+    interval = get_interval(request)
+    end = window_end(interval)
+    start_time = end - INTERVALS[interval]
+    try:
+        since = parse_datetime(request.GET.get("since", ""))
+    except ValueError:
+        since = None
 
     if station_id:
-        station = WeatherStation.objects.get(id=station_id)
-        data = WeatherData.objects.filter(station=station, timestamp__gte=start_time).order_by("timestamp")
-        # Prepare JSON-ready data
-        labels = [entry.timestamp.strftime("%H:%M") for entry in data]
-        temperatures = [entry.temperature for entry in data]
-        # Prepare context in JSON format
-        context = {
-            "station_name": station.name,
-            "labels": json.dumps(labels),
-            "temperatures": json.dumps(temperatures),
-            "interval": interval,
-        }
 
-        return render(
-            request,
-            "monitoring/partials/temperature_data_partial.html",
-            context,
-        )
+        def render_fragment():
+            station = WeatherStation.objects.get(id=station_id)
+            # Raw readings for short windows, the coarsest fitting rollup for longer ones
+            series = downsample_series(get_temperature_series(station, start_time, since))
+            # Prepare JSON-ready data
+            labels = [timestamp.strftime("%H:%M") for timestamp, _ in series]
+            temperatures = [temperature for _, temperature in series]
+            # Prepare context in JSON format
+            context = {
+                "station_name": station.name,
+                "labels": json.dumps(labels),
+                "temperatures": json.dumps(temperatures),
+                "timestamps": json.dumps([timestamp.isoformat() for timestamp, _ in series]),
+                "interval": interval,
+                "delta": since is not None,
+                "window_start": series_start(start_time).isoformat(),
+                "last_update": labels[-1] if labels else (since.strftime("%H:%M") if since else None),
+            }
+            return render_to_string("monitoring/partials/temperature_data_partial.html", context)
+
+        if since is not None:
+            # the points after a cursor are specific to one chart
+            return HttpResponse(render_fragment())
+        # every viewer of the station and interval shares the rendering until new readings are committed
+        # or the window moves forward
+        version = last_modified(f"readings:{station_id}")
+        parts = (station_id, interval, end.timestamp())
+        return HttpResponse(get_fragment("temperature", parts, version, render_fragment))
 
     return JsonResponse({"error": "No data available"})
 
 
 # Main view (loads the complete page)
 def postgres_status_page(request):
-    status = "up" if check_postgres_status() else "down"
-    return render(request, "monitoring/postgres_status.html", {"status": status})
+    # the status published by the prober, the monitored database is never contacted here
+    return render(
+        request,
+        "monitoring/postgres_status.html",
+        {**get_postgres_status(request.GET.get("target", "default")), "events_url": SSE_PATH},
+    )
 
 
 # View for partial updates only
 def postgres_status_view(request):
-    status = "up" if check_postgres_status() else "down"
     return render(
         request,
         "monitoring/partials/postgres_status_partial.html",
-        {"status": status},
+        get_postgres_status(request.GET.get("target", "default")),
     )
 
 
+def postgres_dashboard_validators(request):
+    """Version of the dashboard: the last status published by the prober for the target"""
+    checked_at = get_postgres_status(request.GET.get("target", "default"))["checked_at"]
+    page = "partial" if request.htmx else "page"
+    return f"postgres-{page}-{checked_at.timestamp() if checked_at else 'none'}", checked_at
+
+
+@conditional(postgres_dashboard_validators)
 def postgres_dashboard(request):
-    """PostgreSQL dashboard with time interval selection."""
-    interval = request.GET.get("interval", "1h")
-    time_range = INTERVALS.get(interval, timedelta(hours=1))
-    # Filter logs within the selected time interval
-    logs = PostgresStatusLog.objects.filter(timestamp__gte=now() - time_range).order_by("-timestamp")
-    # Ensure labels and statuses are always valid lists
-    labels = [log.timestamp.strftime("%H:%M") for log in logs[::-1]] if logs else ["No data"]
-    statuses = [1 if log.status == "up" else 0 for log in logs[::-1]] if logs else [0]
-
-    response = {
-        "labels": json.dumps(labels),
-        "statuses": json.dumps(statuses),
-        "interval": interval,
-        "intervals": INTERVALS.keys(),
-    }
+    """PostgreSQL dashboard with time interval and target selection."""
+    interval = get_interval(request)
+    target = request.GET.get("target", "default")
+
+    def build_context():
+        time_range = INTERVALS[interval]
+        end_time = now()
+        start_time = end_time - time_range
+        # one pair of points per status interval, whatever the probe cadence
+        series = downsample_series(status_series(target, start_time, end_time))
+        uptime = availability(target, start_time, end_time)
+        # Ensure labels and statuses are always valid lists
+        labels = [timestamp.strftime("%H:%M") for timestamp, _ in series] if series else ["No data"]
+        statuses = [status for _, status in series] if series else [0]
+
+        return {
+            "labels": json.dumps(labels),
+            "statuses": json.dumps(statuses),
+            "interval": interval,
+            "intervals": INTERVALS.keys(),
+            "target": target,
+            "targets": get_targets().keys(),
+            "availability": uptime["availability"],
+            "uptime_seconds": uptime["up"],
+        }
+
     # If HTMX requests partial update
     if request.htmx:
-        return render(
-            request,
-            "monitoring/partials/postgres_data_partial.html",
-            response,
+        # every viewer of the target and interval shares the rendering until the next status is published
+        version = get_postgres_status(target)["checked_at"]
+        html = get_fragment(
+            "postgres",
+            (target, interval),
+            version,
+            lambda: render_to_string("monitoring/partials/postgres_data_partial.html", build_context()),
         )
+        return HttpResponse(html)
 
     # Initial full view
     return render(
         request,
         "monitoring/postgres_dashboard.html",
-        response,
+        {**build_context(), "events_url": SSE_PATH},
     )
+
+
+def metrics_view(request):
+    """Ingestion and probe metrics in the Prometheus text format"""
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def parse_export_time(value):
+    """Aware datetime of an ISO 8601 query parameter, raising ValueError when invalid.
+
+    The "+" of an offset left unencoded in the URL arrives as a space: "00:00:00 01:00" is read as "00:00:00+01:00".
+    """
+    parsed = parse_datetime(value)
+    if parsed is None and " " in value:
+        parsed = parse_datetime("+".join(value.rsplit(" ", 1)))
+    if parsed is None:
+        raise ValueError(f"Invalid datetime: {value}, expected ISO 8601 such as 2025-03-01T00:00:00Z")
+    return make_aware(parsed) if is_naive(parsed) else parsed
+
+
+def export_readings(request):
+    """Streams the readings (or rollups) of a time range as CSV or NDJSON, optionally gzipped.
+
+    Rows are read as tuples in chunks and encoded in batches, the memory used stays the
+    same whatever the number of rows exported; ASGI clients get the chunks from an async
+    iterator, as Django would otherwise read a sync one whole before sending it.
+    """
+    conf = get_export_settings()
+    output = request.GET.get("format", "csv")
+    resolution = request.GET.get("resolution", "raw")
+    compress = request.GET.get("compress")
+    try:
+        end = parse_export_time(request.GET["end"]) if request.GET.get("end") else now()
+        start = parse_export_time(request.GET["start"]) if request.GET.get("start") else end - timedelta(hours=24)
+        station_ids = [int(station_id) for station_id in request.GET.getlist("station_id")]
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    if output not in FORMATS:
+        return JsonResponse({"error": f"Unknown format: {output}"}, status=400)
+    if compress not in (None, "gzip"):
+        return JsonResponse({"error": f"Unknown compression: {compress}"}, status=400)
+    if not start < end <= start + timedelta(days=conf["max_days"]):
+        return JsonResponse({"error": f"start must precede end by at most {conf['max_days']} days"}, status=400)
+    try:
+        columns, rows = export_rows(start, end, station_ids, resolution, conf["chunk_size"])
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    content = ENCODERS[output](columns, rows, conf["batch_size"])
+    content_type = FORMATS[output]
+    filename = f"weatherdata-{resolution}-{start:%Y%m%dT%H%M}-{end:%Y%m%dT%H%M}.{output}"
+    if compress:
+        # a .gz file to download, rather than a Content-Encoding the client would undo
+        content = compress_sequence(content)
+        content_type = "application/gzip"
+        filename += ".gz"
+    if isinstance(request, ASGIRequest):
+        content = aiterate(content)
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response.headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
@@ -6,12 +6,55 @@ import pytest
 from asyncmock import AsyncMock
 
 
+@pytest.fixture
+def status_cache(settings, tmp_path):
+    """A "status" cache of the test: clearing the configured one would wipe the statuses of a running prober"""
+    settings.CACHES = {
+        **settings.CACHES,
+        "status": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": str(tmp_path / "status"),
+        },
+    }
+
+
 @pytest.fixture(autouse=True)
-def reset_db_after_test(transactional_db):
+def reset_db_after_test(transactional_db, status_cache):
+    from django.core.cache import caches
     from django.db import connection
 
+    from monitoring.api_clients.rate_limit import reset_rate_limiter
+    from monitoring.api_clients.resilience import reset_circuit_breakers
+    from monitoring.api_clients.response_cache import reset_response_cache
+    from monitoring.stations import station_cache
+
     yield
     connection.rollback()
+    # the flushed tables may reuse the ids of cached stations
+    station_cache.clear()
+    reset_response_cache()
+    reset_rate_limiter()
+    reset_circuit_breakers()
+    caches["default"].clear()
+
+
+@pytest.fixture
+def frozen_window(monkeypatch):
+    """The chart windows at a fixed time: they do not move forward between the requests of a test"""
+    from django.utils.timezone import now
+
+    current = now()
+    monkeypatch.setattr("monitoring.views.now", lambda: current)
+    return current
+
+
+@pytest.fixture(autouse=True)
+def skip_unless_postgresql(request):
+    if request.node.get_closest_marker("postgresql"):
+        from django.db import connection
+
+        if connection.vendor != "postgresql":
+            pytest.skip("needs PostgreSQL: set DATABASE_URL")
 
 
 def load_json(name):
@@ -48,3 +91,28 @@ def openweather_api_client():
     client_mock.get_weather_data = AsyncMock(return_value=load_json("openweather"))
     client_mock.source = "openweather"
     return client_mock
+
+
+def netatmo_station(station_id, street, temperature=18.3, timestamp=1741362399):
+    return {
+        "_id": station_id,
+        "place": {"location": [9.22, 45.48], "city": "Milan", "street": street},
+        "measures": {
+            "02:00:00:6b:97:be": {"res": {str(timestamp): [temperature, 47]}, "type": ["temperature", "humidity"]},
+            station_id: {"res": {str(timestamp): [1017.5]}, "type": ["pressure"]},
+        },
+    }
+
+
+@pytest.fixture
+def netatmo_station_data():
+    return netatmo_station("70:ee:50:00:00:01", "Via Test", temperature=21.5)
+
+
+@pytest.fixture
+def netatmo_api_client():
+    body = [netatmo_station(f"70:ee:50:00:00:{index:02x}", f"Via Test {index}") for index in range(3)]
+    client_mock = AsyncMock()
+    client_mock.get_weather_data = AsyncMock(return_value=json.dumps({"status": "ok", "body": body}))
+    client_mock.source = "netatmo"
+    return client_mock
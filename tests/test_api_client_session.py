@@ -0,0 +1,52 @@
+import asyncio
+
+import pytest
+from asgiref.sync import async_to_sync
+
+from monitoring.api_clients import session as session_module
+from monitoring.api_clients.openweather import OpenWeatherAPIClient
+from monitoring.api_clients.session import close_session, get_session, run, shutdown
+
+
+class TestPooledSession:
+    @pytest.mark.asyncio
+    async def test_session_is_shared_by_clients_on_the_same_loop(self):
+        first = get_session()
+        assert OpenWeatherAPIClient().session is first
+        assert get_session() is first
+        await close_session()
+        assert first.closed
+
+    @pytest.mark.asyncio
+    async def test_connector_uses_configured_limits(self, settings):
+        settings.API_CLIENT_SESSION = {"limit_per_host": 3, "limit": 7}
+        session = get_session()
+        assert session.connector.limit_per_host == 3
+        assert session.connector.limit == 7
+        await close_session()
+
+    def test_run_reuses_loop_and_session_between_calls(self):
+        async def current_session():
+            return asyncio.get_running_loop(), get_session()
+
+        first_loop, first_session = run(current_session())
+        second_loop, second_session = run(current_session())
+        assert first_loop is second_loop
+        assert first_session is second_session
+
+        shutdown()
+        assert first_session.closed
+        assert first_loop.is_closed()
+        assert session_module._loop is None
+
+    def test_sessions_of_short_lived_loops_are_closed_with_them(self):
+        async def current_session():
+            assert get_session() is get_session()
+            return get_session()
+
+        # asyncio.run and async_to_sync (an async view under WSGI) make a new loop per call
+        for call in (lambda: asyncio.run(current_session()), async_to_sync(current_session)):
+            first, second = call(), call()
+            assert first is not second
+            assert first.closed and second.closed
+        assert not session_module._closers
@@ -0,0 +1,184 @@
+import gzip
+import io
+import json
+import os
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+from pathlib import Path
+
+import pytest
+from django.core.management import CommandError, call_command
+from django.db import transaction
+
+from monitoring import backfill
+from monitoring.backfill import (BackfillState, WorkItem, copy_readings, iter_documents, iter_lines, parse_item,
+                                 plan_work, run_backfill)
+from monitoring.models import WeatherData, WeatherDataRollup, WeatherStation
+
+DATA = Path(__file__).parent / "data"
+START = datetime(2025, 3, 1, tzinfo=timezone.utc)
+
+
+def openweather_response(index, station=1):
+    response = json.loads((DATA / "openweather.json").read_text())
+    response["id"] = station
+    response["dt"] = int((START + timedelta(minutes=10 * index)).timestamp())
+    response["main"]["temp"] = float(index)
+    return response
+
+
+def write_lines(path, responses):
+    path.write_text("".join(json.dumps(response) + "\n" for response in responses))
+    return path
+
+
+def crashing_parse_item(item, source=None):
+    """parse_item of a worker process killed by the "crash" dumps"""
+    if "crash" in item.path:
+        os._exit(1)
+    return parse_item(item, source)
+
+
+@pytest.fixture
+def backfill_settings(settings, tmp_path):
+    settings.BACKFILL = {"state_file": str(tmp_path / "state.json"), "split_bytes": 4096, "workers": 0}
+    return settings.BACKFILL
+
+
+class TestDumpParsing:
+    def test_documents_are_streamed_whatever_their_layout(self):
+        documents = [{"a": index, "text": "x" * 100} for index in range(20)]
+        concatenated = "\n".join(json.dumps(document, indent=2) for document in documents)
+        assert list(iter_documents(io.StringIO(concatenated), block_size=16)) == documents
+        with pytest.raises(json.JSONDecodeError):
+            list(iter_documents(io.StringIO('{"a": 1} {"b":'), block_size=4))
+
+    def test_json_lines_ranges_hold_every_line_once(self, tmp_path):
+        path = write_lines(tmp_path / "dump.jsonl", [openweather_response(index) for index in range(50)])
+        items = plan_work([path], split_bytes=1000)
+        assert len(items) > 1 and all(item.split for item in items)
+        lines = [line for item in items for line in iter_lines(item)]
+        assert lines == path.read_bytes().splitlines(keepends=True)
+        assert plan_work([DATA / "netatmo.json"], 1000) == [
+            WorkItem(str(DATA / "netatmo.json"), 0, (DATA / "netatmo.json").stat().st_size, False)
+        ]
+
+
+class TestRunBackfill:
+    @pytest.mark.django_db
+    def test_dumps_of_both_providers_are_loaded(self, backfill_settings, tmp_path):
+        write_lines(tmp_path / "openweather.jsonl", [openweather_response(index) for index in range(40)])
+        with gzip.open(tmp_path / "netatmo.json.gz", "wt") as f:
+            # the sample holds a \' escape, invalid in JSON
+            f.write((DATA / "netatmo.json").read_text().replace("\\'", "'"))
+        (tmp_path / "notes.txt").write_text("not a dump")
+
+        totals = run_backfill([tmp_path])
+
+        assert totals["failed"] == []
+        assert WeatherStation.objects.filter(source="netatmo").exists()
+        station = WeatherStation.objects.get(source="openweather")
+        assert WeatherData.objects.filter(station=station).count() == 40
+        assert totals["readings"] == WeatherData.objects.count()
+        # the rollups of the loaded days are rebuilt
+        hourly = WeatherDataRollup.objects.filter(station=station, resolution="1h").order_by("bucket_start")
+        assert [rollup.count for rollup in hourly] == [6] * 6 + [4]
+
+    @pytest.mark.django_db
+    def test_an_interrupted_backfill_resumes(self, backfill_settings, tmp_path):
+        path = write_lines(tmp_path / "dump.jsonl", [openweather_response(index) for index in range(60)])
+        items = plan_work([path], backfill_settings["split_bytes"])
+        state = BackfillState(backfill_settings["state_file"])
+        state.complete(items[0].key, {})
+
+        totals = run_backfill([path])
+
+        assert totals["done"] == totals["items"] == len(items)
+        assert totals["readings"] < 60
+        assert not BackfillState(backfill_settings["state_file"]).days
+        assert WeatherData.objects.count() == totals["readings"]
+        # loading everything again only skips the stored readings
+        assert run_backfill([path], restart=True)["readings"] == 60
+        assert WeatherData.objects.count() == 60
+
+    @pytest.mark.django_db
+    def test_rollups_of_other_days_are_kept(self, backfill_settings, tmp_path):
+        station = WeatherStation.objects.create(name="RandomCity", source="openweather", source_id="1")
+        archived = WeatherDataRollup.objects.create(
+            station=station,
+            resolution="1d",
+            bucket_start=START - timedelta(days=40),
+            count=4,
+            temperature_min=0.0,
+            temperature_max=2.0,
+            temperature_avg=1.0,
+        )
+        write_lines(tmp_path / "dump.jsonl", [openweather_response(0), openweather_response(24 * 6 * 3)])
+        run_backfill([tmp_path])
+        assert WeatherDataRollup.objects.filter(pk=archived.pk).exists()
+        assert WeatherDataRollup.objects.filter(station=station, resolution="1d").count() == 3
+
+    @pytest.mark.django_db(transaction=True)
+    def test_process_pool(self, backfill_settings, tmp_path):
+        write_lines(tmp_path / "dump.jsonl", [openweather_response(index) for index in range(100)])
+        totals = run_backfill([tmp_path], workers=2)
+        assert (totals["done"], totals["readings"]) == (totals["items"], 100)
+        assert WeatherData.objects.count() == 100
+
+    @pytest.mark.django_db
+    def test_an_item_failing_to_decode_does_not_stop_the_others(self, backfill_settings, tmp_path):
+        write_lines(tmp_path / "openweather.jsonl", [openweather_response(index) for index in range(10)])
+        netatmo = json.loads((DATA / "netatmo.json").read_text().replace("\\'", "'"))
+        # measures as a list: the decoder fails with an AttributeError
+        netatmo["body"][0]["measures"] = ["unexpected"]
+        (tmp_path / "netatmo.json").write_text(json.dumps(netatmo))
+
+        totals = run_backfill([tmp_path])
+
+        assert [key for key, _ in totals["failed"]] == [f"{tmp_path / 'netatmo.json'}:0-{len(json.dumps(netatmo))}"]
+        assert totals["failed"][0][1].startswith("AttributeError")
+        assert WeatherData.objects.count() == totals["readings"] == 10
+        assert totals["done"] == totals["items"] - 1
+
+    @pytest.mark.django_db(transaction=True)
+    def test_a_dead_worker_only_fails_the_items_in_flight(self, backfill_settings, tmp_path, monkeypatch):
+        monkeypatch.setattr(backfill, "parse_item", crashing_parse_item)
+        # sorted first: the dumps after it are in flight, or still to submit, when its worker dies
+        (tmp_path / "a-crash.json").write_text(json.dumps(openweather_response(0)))
+        for index in range(6):
+            write_lines(tmp_path / f"dump-{index}.jsonl", [openweather_response(index, station=index + 1)])
+
+        totals = run_backfill([tmp_path], workers=1)
+
+        assert any(key.startswith(str(tmp_path / "a-crash.json")) for key, _ in totals["failed"])
+        assert all("BrokenProcessPool" in error for _, error in totals["failed"])
+        # the items after those in flight are parsed by a new pool
+        assert totals["done"] + len(totals["failed"]) == totals["items"] == 7
+        assert WeatherData.objects.count() == totals["readings"] >= 7 - 2
+
+    @pytest.mark.postgresql
+    @pytest.mark.django_db
+    def test_copy_readings_skips_the_stored_rows(self):
+        station = WeatherStation.objects.create(name="RandomCity", source="openweather", source_id="1")
+        rows = [(station.id, START + timedelta(minutes=10 * index), 1.5, None, 50, 1013.0) for index in range(3)]
+        with transaction.atomic():
+            copy_readings(rows[:2])
+        with transaction.atomic():
+            copy_readings(rows)
+        stored = WeatherData.objects.filter(station=station).order_by("timestamp")
+        assert [reading.timestamp for reading in stored] == [row[1] for row in rows]
+        assert {(reading.temperature, reading.feels_like, reading.humidity) for reading in stored} == {(1.5, None, 50)}
+
+
+class TestCommand:
+    @pytest.mark.django_db
+    def test_progress_and_failures_are_reported(self, backfill_settings, tmp_path):
+        write_lines(tmp_path / "dump.jsonl", [openweather_response(0), {"unknown": "response"}])
+        out = StringIO()
+        call_command("backfill_weather", str(tmp_path), stdout=out)
+        assert "1/1 parts, 2 responses, 1 readings" in out.getvalue()
+        assert "1 invalid" in out.getvalue()
+
+        (tmp_path / "broken.json").write_text('{"main": ')
+        with pytest.raises(CommandError, match="1 part"):
+            call_command("backfill_weather", str(tmp_path), stdout=StringIO(), stderr=StringIO())
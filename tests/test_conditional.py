@@ -0,0 +1,106 @@
+from datetime import timedelta
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import Client
+from django.urls import reverse
+from django.utils.timezone import now
+from django_q.models import Task
+
+from monitoring.models import WeatherData, WeatherStation
+from monitoring.postgres_probe import publish_statuses
+from monitoring.services import save_responses
+
+
+def status(seconds=0, value="up"):
+    return {
+        "target": "default",
+        "status": value,
+        "latency_ms": 1.0,
+        "error": None,
+        "checked_at": now() - timedelta(seconds=60 - seconds),
+    }
+
+
+@pytest.mark.usefixtures("frozen_window")
+class TestTemperatureDataPartial:
+    @pytest.mark.django_db
+    def test_not_modified_until_the_station_gets_readings(self, openweather_data, django_assert_num_queries):
+        async_to_sync(save_responses)([("openweather", openweather_data)])
+        station = WeatherStation.objects.get()
+        url = reverse("temperature_data_partial")
+        params = {"station_id": station.id, "interval": "1h"}
+        client = Client()
+
+        first = client.get(url, params)
+        assert first.status_code == 200
+        assert first["Cache-Control"] == "no-cache"
+        with django_assert_num_queries(0):
+            again = client.get(url, params, HTTP_IF_NONE_MATCH=first["ETag"])
+        assert again.status_code == 304
+        assert client.get(url, params, HTTP_IF_MODIFIED_SINCE=first["Last-Modified"]).status_code == 304
+
+        WeatherData.objects.filter(station=station).delete()
+        async_to_sync(save_responses)([("openweather", openweather_data)])
+        changed = client.get(url, params, HTTP_IF_NONE_MATCH=first["ETag"])
+        assert changed.status_code == 200
+        assert changed["ETag"] != first["ETag"]
+
+    @pytest.mark.django_db
+    def test_other_stations_stay_not_modified(self, openweather_data, weather_station):
+        other = WeatherStation.objects.create(**{**weather_station, "source_id": "other"})
+        url = reverse("temperature_data_partial")
+        first = Client().get(url, {"station_id": other.id, "interval": "1h"})
+        async_to_sync(save_responses)([("openweather", openweather_data)])
+        again = Client().get(url, {"station_id": other.id, "interval": "1h"}, HTTP_IF_NONE_MATCH=first["ETag"])
+        assert again.status_code == 304
+
+    @pytest.mark.django_db
+    def test_modified_once_the_window_moves_forward(self, openweather_data, frozen_window, monkeypatch):
+        async_to_sync(save_responses)([("openweather", openweather_data)])
+        params = {"station_id": WeatherStation.objects.get().id, "interval": "1h"}
+        url = reverse("temperature_data_partial")
+        first = Client().get(url, params)
+        # the window of the last hour moves in steps of a minute
+        monkeypatch.setattr("monitoring.views.now", lambda: frozen_window + timedelta(minutes=1))
+        moved = Client().get(url, params, HTTP_IF_NONE_MATCH=first["ETag"])
+        assert moved.status_code == 200
+        assert moved["ETag"] != first["ETag"]
+        assert Client().get(url, params, HTTP_IF_MODIFIED_SINCE=first["Last-Modified"]).status_code == 200
+
+
+class TestPostgresDashboard:
+    @pytest.mark.django_db
+    def test_not_modified_until_the_next_probe(self, django_assert_num_queries):
+        publish_statuses([status(0)])
+        url = reverse("postgres_dashboard")
+        client = Client()
+        page = client.get(url)
+        partial = client.get(url, HTTP_HX_REQUEST="true")
+        assert page["ETag"] != partial["ETag"]
+        assert "HX-Request" in partial["Vary"]
+
+        with django_assert_num_queries(0):
+            assert client.get(url, HTTP_HX_REQUEST="true", HTTP_IF_NONE_MATCH=partial["ETag"]).status_code == 304
+        publish_statuses([status(10)])
+        assert client.get(url, HTTP_HX_REQUEST="true", HTTP_IF_NONE_MATCH=partial["ETag"]).status_code == 200
+
+
+class TestTaskStatsPartial:
+    @pytest.mark.django_db
+    def test_not_modified_until_a_task_is_saved(self, settings, django_assert_num_queries):
+        # a long tick, so that the test does not cross one
+        settings.CONDITIONAL_RESPONSES = {"task_granularity": 24 * 3600}
+        url = reverse("task_stats_partial")
+        client = Client()
+        first = client.get(url)
+        assert first.status_code == 200
+        with django_assert_num_queries(0):
+            assert client.get(url, HTTP_IF_NONE_MATCH=first["ETag"]).status_code == 304
+
+        Task.objects.create(
+            id="a" * 32, name="task", func="monitoring.tasks.fetch", started=now(), stopped=now(), success=True
+        )
+        changed = client.get(url, HTTP_IF_NONE_MATCH=first["ETag"])
+        assert changed.status_code == 200
+        assert b'<span id="success-count">1</span>' in changed.content
@@ -0,0 +1,87 @@
+import pytest
+from asgiref.sync import async_to_sync
+
+from monitoring.decoders import DECODERS, DecodeError, decode_response
+from monitoring.json_paths import compile_path
+from monitoring.models import WeatherData, WeatherStation
+from monitoring.serializers import NetatmoSerializer, OpenWeatherSerializer
+from monitoring.services import fetch_and_save_weather
+
+
+def strict_decode(serializer):
+    assert serializer.is_valid(), serializer.errors
+    reading = dict(serializer.validated_data)
+    station = serializer.pop_station_data(reading)
+    return station, reading
+
+
+class TestCompilePath:
+    def test_list_indexes_are_resolved(self):
+        data = {"place": {"location": [9.2, 45.4], "city": "Milan"}}
+        assert compile_path("place.location[0]")(data) == 9.2
+        assert compile_path("place.location[1]")(data) == 45.4
+        assert compile_path("place.city")(data) == "Milan"
+
+    def test_missing_parts_return_none(self):
+        data = {"place": {"location": [9.2]}}
+        assert compile_path("place.location[1]")(data) is None
+        assert compile_path("place.street.name")(data) is None
+        assert compile_path("main.temp")(None) is None
+
+    def test_netatmo_serializer_resolves_coordinates(self, netatmo_station_data):
+        serializer = NetatmoSerializer(data=netatmo_station_data)
+        station, _ = strict_decode(serializer)
+        assert (station["longitude"], station["latitude"]) == (9.22, 45.48)
+
+
+class TestFastDecoders:
+    def test_openweather_matches_serializer(self, openweather_data):
+        station, reading = DECODERS["openweather"].decode(openweather_data)
+        strict_station, strict_reading = strict_decode(OpenWeatherSerializer(data=openweather_data))
+        assert station == strict_station
+        assert reading == strict_reading
+
+    def test_netatmo_matches_serializer(self, netatmo_station_data):
+        station, reading = DECODERS["netatmo"].decode(netatmo_station_data)
+        strict_station, strict_reading = strict_decode(NetatmoSerializer(data=netatmo_station_data))
+        assert station == strict_station
+        assert reading == strict_reading
+
+    def test_invalid_records_report_serializer_like_errors(self):
+        with pytest.raises(DecodeError) as error:
+            DECODERS["openweather"].decode({"Error": "401, message='Unauthorized'"})
+        assert error.value.errors["temperature"] == ["This field is required."]
+        assert error.value.errors["timestamp"] == ["This field is required."]
+
+        rows, results = decode_response("netatmo", {"body": [{"_id": "70:ee:50:00:00:02", "measures": {}}]})
+        assert rows == []
+        assert results[0][0] is False
+        assert set(results[0][1]) == {"timestamp", "temperature", "name"}
+
+    @pytest.mark.parametrize("humidity, expected", [(47.0, 47), ("47", 47), (47.6, None), ("47.6", None), (True, None)])
+    def test_integers_are_parsed_as_the_serializer_does(self, openweather_data, humidity, expected):
+        data = {**openweather_data, "main": {**openweather_data["main"], "humidity": humidity}}
+        serializer = OpenWeatherSerializer(data=data)
+        if expected is None:
+            with pytest.raises(DecodeError) as error:
+                DECODERS["openweather"].decode(data)
+            assert error.value.errors == {"humidity": ["A valid integer is required."]}
+            assert not serializer.is_valid()
+            assert "humidity" in serializer.errors
+        else:
+            assert DECODERS["openweather"].decode(data).reading["humidity"] == expected
+            assert strict_decode(serializer)[1]["humidity"] == expected
+
+    def test_unknown_source(self):
+        with pytest.raises(ValueError):
+            decode_response("darksky", {})
+
+
+class TestStrictMode:
+    @pytest.mark.django_db
+    def test_strict_mode_stores_the_same_rows(self, netatmo_api_client, settings):
+        settings.INGESTION_DECODER = "strict"
+        result = async_to_sync(fetch_and_save_weather)(netatmo_api_client)
+        assert result == {"message": "N. 3 dati salvati con successo!"}
+        assert WeatherStation.objects.count() == 3
+        assert WeatherData.objects.count() == 3
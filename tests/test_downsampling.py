@@ -0,0 +1,83 @@
+import json
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from django.test import Client
+from django.urls import reverse
+
+from monitoring.downsampling import downsample_series, lttb
+from monitoring.models import PostgresStatusInterval, WeatherData, WeatherStation
+
+
+def reference_lttb(points, threshold):
+    """Straightforward pure Python LTTB, as in the original paper"""
+    every = (len(points) - 2) / (threshold - 2)
+    selected = [0]
+    previous = 0
+    for bucket in range(threshold - 2):
+        start = int(bucket * every) + 1
+        end = int((bucket + 1) * every) + 1
+        next_end = min(int((bucket + 2) * every) + 1, len(points))
+        next_points = points[end:next_end] or [points[-1]]
+        next_x = sum(x for x, _ in next_points) / len(next_points)
+        next_y = sum(y for _, y in next_points) / len(next_points)
+        px, py = points[previous]
+        areas = [abs((px - next_x) * (y - py) - (px - x) * (next_y - py)) for x, y in points[start:end]]
+        previous = start + areas.index(max(areas))
+        selected.append(previous)
+    selected.append(len(points) - 1)
+    return selected
+
+
+class TestLTTB:
+    def test_matches_reference_implementation(self):
+        rnd = random.Random(3)
+        points = [(float(index), rnd.gauss(15, 3)) for index in range(1000)]
+        x, y = zip(*points)
+        assert list(lttb(x, y, 50)) == reference_lttb(points, 50)
+
+    def test_keeps_endpoints_and_spikes(self):
+        y = [10.0] * 10000
+        y[4321] = 40.0
+        indices = lttb(range(10000), y, 100)
+        assert len(indices) == 100
+        assert indices[0] == 0 and indices[-1] == 9999
+        assert 4321 in indices
+
+    def test_short_series_are_untouched(self):
+        start = datetime(2025, 3, 10, tzinfo=timezone.utc)
+        series = [(start + timedelta(minutes=index), float(index)) for index in range(10)]
+        assert downsample_series(series, 500) == series
+        assert downsample_series(series, None) == series
+        assert len(downsample_series(series, 5)) == 5
+
+
+class TestDashboardDownsampling:
+    @pytest.mark.django_db
+    def test_temperature_partial_respects_point_budget(self, weather_station, settings):
+        settings.CHART_MAX_POINTS = 100
+        station = WeatherStation.objects.create(**weather_station)
+        start = datetime.now(timezone.utc) - timedelta(minutes=59)
+        WeatherData.objects.bulk_create(
+            WeatherData(station=station, timestamp=start + timedelta(seconds=2 * index), temperature=index % 7)
+            for index in range(1500)
+        )
+        response = Client().get(reverse("temperature_data_partial"), {"station_id": station.id, "interval": "1h"})
+        assert len(json.loads(response.context["temperatures"])) == 100
+        assert len(json.loads(response.context["labels"])) == 100
+
+    @pytest.mark.django_db
+    def test_postgres_dashboard_respects_point_budget(self, settings):
+        settings.CHART_MAX_POINTS = 50
+        start = datetime.now(timezone.utc) - timedelta(minutes=50)
+        PostgresStatusInterval.objects.bulk_create(
+            PostgresStatusInterval(
+                status="up",
+                started_at=start + timedelta(seconds=10 * index),
+                ended_at=start + timedelta(seconds=10 * index + 5),
+            )
+            for index in range(200)
+        )
+        response = Client().get(reverse("postgres_dashboard"), {"interval": "1h"})
+        assert json.loads(response.context["statuses"]) == [1] * 50
@@ -0,0 +1,218 @@
+import asyncio
+import logging
+import threading
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.cache import caches
+
+from monitoring import events, postgres_probe, services
+from monitoring.events import Broker, Relay
+from monitoring.models import WeatherData, WeatherStation
+from monitoring.sse import sse_application
+
+TIMESTAMP = datetime(2025, 3, 10, 9, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def broker(monkeypatch):
+    broker = Broker()
+    monkeypatch.setattr(events, "broker", broker)
+    monkeypatch.setattr(services, "broker", broker)
+    monkeypatch.setattr(postgres_probe, "broker", broker)
+    monkeypatch.setattr("monitoring.sse.broker", broker)
+    monkeypatch.setattr("monitoring.sse.relay", Relay(broker))
+    return broker
+
+
+def status(target="default", value="up"):
+    return {"target": target, "status": value, "latency_ms": 1.0, "error": None, "checked_at": TIMESTAMP}
+
+
+class TestBroker:
+    def test_publish_from_other_threads_reaches_the_subscriber_loop(self, broker):
+        async def scenario():
+            subscription = broker.subscribe({"tasks"})
+            threads = [threading.Thread(target=broker.publish, args=("tasks", index)) for index in range(5)]
+            broker.publish("postgres", "ignored")
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            received = [await asyncio.wait_for(subscription.get(), 1) for _ in threads]
+            subscription.close()
+            return received
+
+        received = async_to_sync(scenario)()
+        assert sorted(data for _, data in received) == list(range(5))
+        assert not broker.has_subscribers()
+
+    def test_a_slow_subscriber_is_told_to_reset(self, broker):
+        async def scenario():
+            subscription = broker.subscribe({"tasks"}, size=2)
+            for index in range(5):
+                broker.publish("tasks", index)
+            await asyncio.sleep(0)
+            return await subscription.get(), subscription.queue.empty()
+
+        assert async_to_sync(scenario)() == (("reset", {}), True)
+
+
+class TestSSEApplication:
+    def test_streams_the_filtered_events_until_the_client_disconnects(self, broker):
+        async def scenario():
+            disconnected = asyncio.Event()
+            messages = []
+
+            async def receive():
+                await disconnected.wait()
+                return {"type": "http.disconnect"}
+
+            async def send(message):
+                messages.append(message)
+
+            scope = {"type": "http", "method": "GET", "query_string": b"topics=readings&station_id=1"}
+            stream = asyncio.ensure_future(sse_application(scope, receive, send))
+            while not broker.has_subscribers("readings"):
+                await asyncio.sleep(0)
+            broker.publish("readings", [{"station_id": 2, "temperature": 1.0}])
+            broker.publish("readings", [{"station_id": 1, "temperature": 2.0}, {"station_id": 2, "temperature": 3.0}])
+            broker.publish("tasks", {"success_count": 1})
+            while len(messages) < 3:
+                await asyncio.sleep(0.01)
+            disconnected.set()
+            await asyncio.wait_for(stream, 1)
+            return messages
+
+        messages = async_to_sync(scenario)()
+        assert messages[0]["status"] == 200
+        assert (b"content-type", b"text/event-stream") in messages[0]["headers"]
+        assert messages[2]["body"] == b'event: readings\ndata: [{"station_id": 1, "temperature": 2.0}]\n\n'
+        assert len(messages) == 3
+        assert not broker.has_subscribers()
+
+    def test_only_get_is_allowed(self, broker):
+        messages = []
+
+        async def send(message):
+            messages.append(message)
+
+        async_to_sync(sse_application)({"type": "http", "method": "POST", "query_string": b""}, None, send)
+        assert messages[0]["status"] == 405
+
+
+class TestPublishers:
+    @pytest.mark.django_db(transaction=True)
+    def test_saved_readings_are_published_once_committed(self, broker, openweather_data):
+        async def scenario():
+            subscription = broker.subscribe({"readings"})
+            await services.save_responses([("openweather", openweather_data)] * 2)
+            readings = await asyncio.wait_for(subscription.get(), 1)
+            # the relay finds the same readings in the table and does not publish them again
+            relay = Relay(broker)
+            relay.last_reading_id = 0
+            await sync_to_async(relay.poll_readings)()
+            await asyncio.sleep(0.01)
+            return readings, subscription.queue.empty()
+
+        (topic, data), empty = async_to_sync(scenario)()
+        assert topic == "readings"
+        assert [reading["station_id"] for reading in data] == [WeatherStation.objects.get().id]
+        assert empty
+
+    @pytest.mark.django_db(transaction=True)
+    def test_relay_publishes_readings_committed_by_other_processes(self, broker):
+        station = WeatherStation.objects.create(name="Milan", latitude=45.0, longitude=9.0, source="openweather")
+
+        async def scenario():
+            subscription = broker.subscribe({"readings"})
+            relay = Relay(broker)
+            await sync_to_async(relay.poll_readings)()
+            await WeatherData.objects.acreate(station=station, timestamp=TIMESTAMP, temperature=12.5)
+            await sync_to_async(relay.poll_readings)()
+            await sync_to_async(relay.poll_readings)()
+            return await asyncio.wait_for(subscription.get(), 1), subscription.queue.empty()
+
+        (topic, data), empty = async_to_sync(scenario)()
+        assert data == [{"station_id": station.id, "timestamp": TIMESTAMP.isoformat(), "temperature": 12.5}]
+        assert empty
+
+    @pytest.mark.django_db(transaction=True)
+    def test_relay_publishes_readings_committed_after_a_higher_id(self, broker):
+        station = WeatherStation.objects.create(name="Milan", latitude=45.0, longitude=9.0, source="openweather")
+        later = TIMESTAMP + timedelta(minutes=10)
+
+        async def scenario():
+            subscription = broker.subscribe({"readings"})
+            relay = Relay(broker)
+            await sync_to_async(relay.poll_readings)()
+            # two ingestions took ids 5 and 10, the one holding 10 committed first
+            await WeatherData.objects.acreate(id=10, station=station, timestamp=later, temperature=14.0)
+            await sync_to_async(relay.poll_readings)()
+            await WeatherData.objects.acreate(id=5, station=station, timestamp=TIMESTAMP, temperature=12.5)
+            await sync_to_async(relay.poll_readings)()
+            received = [await asyncio.wait_for(subscription.get(), 1) for _ in range(2)]
+            return received, subscription.queue.empty()
+
+        received, empty = async_to_sync(scenario)()
+        assert [[reading["temperature"] for reading in data] for _, data in received] == [[14.0], [12.5]]
+        assert empty
+
+    def test_relay_keeps_polling_after_a_failure(self, broker, settings, caplog):
+        settings.DASHBOARD_EVENTS = {"relay_interval": 0}
+        relay = Relay(broker)
+        polls = []
+
+        def poll():
+            polls.append(1)
+            if len(polls) == 1:
+                raise ConnectionError("database unavailable")
+            # the last subscriber leaves: the relay stops
+            broker.unsubscribe(next(iter(broker._subscriptions)))
+
+        relay.poll = poll
+
+        async def scenario():
+            broker.subscribe({"readings"})
+            relay.ensure_running()
+            await asyncio.wait_for(relay.task, 1)
+
+        with caplog.at_level(logging.ERROR, logger="monitoring.events"):
+            async_to_sync(scenario)()
+        assert len(polls) == 2
+        assert "relay poll failed" in caplog.text
+
+    @pytest.mark.django_db
+    def test_statuses_are_published_on_change_only(self, broker):
+        async def scenario():
+            subscription = broker.subscribe({"postgres"})
+            for value in ["up", "up", "down", "down"]:
+                await asyncio.get_running_loop().run_in_executor(
+                    None, postgres_probe.publish_statuses, [status(value=value)]
+                )
+            await asyncio.sleep(0.01)
+            received = []
+            while not subscription.queue.empty():
+                received.append(subscription.queue.get_nowait())
+            return received
+
+        received = async_to_sync(scenario)()
+        assert [data["status"] for _, data in received] == ["up", "down"]
+        assert received[0][1]["checked_at"] == TIMESTAMP.isoformat()
+
+    @pytest.mark.django_db
+    def test_relay_publishes_status_changes_of_the_prober(self, broker):
+        cache = caches["status"]
+
+        async def scenario():
+            subscription = broker.subscribe({"postgres"})
+            relay = Relay(broker)
+            for value in ["up", "up", "down"]:
+                cache.set(postgres_probe.status_key("default"), status(value=value))
+                relay.poll_postgres()
+            return await asyncio.wait_for(subscription.get(), 1), subscription.queue.empty()
+
+        (topic, data), empty = async_to_sync(scenario)()
+        assert (topic, data["status"]) == ("postgres", "down")
+        assert empty
@@ -0,0 +1,135 @@
+import csv
+import gzip
+import io
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from monitoring import views
+from monitoring.models import WeatherData, WeatherStation
+from monitoring.export import export_rows
+from monitoring.rollups import update_rollups
+
+START = datetime(2025, 3, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def stations(weather_station):
+    first = WeatherStation.objects.create(**weather_station)
+    second = WeatherStation.objects.create(**{**weather_station, "source_id": "second"})
+    for station in (first, second):
+        readings = WeatherData.objects.bulk_create(
+            WeatherData(station=station, timestamp=START + timedelta(minutes=10 * index), temperature=float(index))
+            for index in range(12)
+        )
+        update_rollups(readings)
+    return first, second
+
+
+def export(**params):
+    params.setdefault("start", START.isoformat())
+    params.setdefault("end", (START + timedelta(days=1)).isoformat())
+    return Client().get(reverse("export_readings"), params)
+
+
+def content(response):
+    return b"".join(response.streaming_content)
+
+
+class TestExport:
+    @pytest.mark.django_db
+    def test_csv_of_the_filtered_readings(self, stations, settings):
+        settings.EXPORT = {"chunk_size": 5, "batch_size": 4}
+        first, _ = stations
+        response = export(station_id=first.id, end=(START + timedelta(minutes=60)).isoformat())
+        assert response["Content-Type"] == "text/csv"
+        assert "attachment" in response["Content-Disposition"]
+        rows = list(csv.reader(io.StringIO(content(response).decode())))
+        assert rows[0] == ["station_id", "timestamp", "temperature", "feels_like", "humidity", "pressure"]
+        assert len(rows) == 7
+        assert rows[1] == [str(first.id), START.isoformat(), "0.0", "", "", ""]
+
+    @pytest.mark.django_db
+    def test_ndjson_of_every_station(self, stations):
+        response = export(format="ndjson")
+        lines = content(response).decode().splitlines()
+        assert len(lines) == 24
+        assert json.loads(lines[-1]) == {
+            "station_id": stations[1].id,
+            "timestamp": (START + timedelta(minutes=110)).isoformat(),
+            "temperature": 11.0,
+            "feels_like": None,
+            "humidity": None,
+            "pressure": None,
+        }
+
+    @pytest.mark.django_db
+    def test_gzip_and_rollups(self, stations):
+        response = export(format="ndjson", resolution="1h", compress="gzip")
+        assert response["Content-Type"] == "application/gzip"
+        assert response["Content-Disposition"].endswith('.ndjson.gz"')
+        lines = gzip.decompress(content(response)).decode().splitlines()
+        assert [json.loads(line)["count"] for line in lines] == [6, 6, 6, 6]
+
+    @pytest.mark.django_db
+    def test_rows_are_read_as_tuples_in_chunks(self, stations, settings):
+        settings.EXPORT = {"chunk_size": 10}
+        with CaptureQueriesContext(connection) as queries:
+            content(export())
+        # values_list: only the exported columns are selected
+        (query,) = [query for query in queries if "monitoring_weatherdata" in query["sql"]]
+        assert '"monitoring_weatherdata"."id"' not in query["sql"]
+
+    @pytest.mark.asyncio
+    @pytest.mark.django_db(transaction=True)
+    async def test_asgi_clients_get_the_rows_as_they_are_read(self, stations, settings, monkeypatch):
+        settings.EXPORT = {"chunk_size": 5, "batch_size": 4}
+        read = []
+
+        def counting_rows(*args):
+            columns, rows = export_rows(*args)
+            return columns, (read.append(row) or row for row in rows)
+
+        monkeypatch.setattr(views, "export_rows", counting_rows)
+        response = await AsyncClient().get(
+            reverse("export_readings"), {"start": START.isoformat(), "end": (START + timedelta(days=1)).isoformat()}
+        )
+        assert response.is_async
+        chunks = aiter(response.streaming_content)
+        assert await anext(chunks) == b"station_id,timestamp,temperature,feels_like,humidity,pressure\r\n"
+        await anext(chunks)
+        # one batch sent, the rest still unread
+        assert len(read) == 4
+        assert len([chunk async for chunk in chunks]) == 5
+        assert len(read) == 24
+
+    @pytest.mark.django_db
+    @pytest.mark.parametrize("offset", ["Z", "+00:00", "%2B00:00", "+0100"])
+    def test_offsets_left_unencoded_in_the_url(self, stations, offset):
+        hour = "01" if offset == "+0100" else "00"
+        url = f"{reverse('export_readings')}?start=2025-03-01T{hour}:00:00{offset}&end=2025-03-01T{hour}:30:00{offset}"
+        response = Client().get(url)
+        assert response.status_code == 200
+        assert len(content(response).splitlines()) == 1 + 3 * 2
+
+    @pytest.mark.django_db
+    @pytest.mark.parametrize(
+        "params",
+        [
+            {"format": "xml"},
+            {"resolution": "1w"},
+            {"compress": "brotli"},
+            {"start": "yesterday"},
+            {"station_id": "first"},
+            {"start": "2024-01-01T00:00:00Z"},
+        ],
+    )
+    def test_invalid_parameters(self, params):
+        response = export(**params)
+        assert response.status_code == 400
+        assert "error" in response.json()
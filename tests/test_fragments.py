@@ -0,0 +1,109 @@
+from datetime import timedelta
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import Client
+from django.urls import reverse
+from django.utils.timezone import now
+
+from monitoring import metrics
+from monitoring.models import WeatherStation
+from monitoring.postgres_probe import publish_statuses
+from monitoring.services import save_responses
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    # the other tests render fragments too
+    metrics.registry.reset()
+    yield
+    metrics.registry.reset()
+
+
+def cache_requests(fragment, result):
+    return metrics.fragment_cache.snapshot().get((fragment, result), 0)
+
+
+def status(seconds):
+    return {
+        "target": "default",
+        "status": "up",
+        "latency_ms": 1.0,
+        "error": None,
+        "checked_at": now() - timedelta(seconds=60 - seconds),
+    }
+
+
+@pytest.mark.usefixtures("frozen_window")
+class TestTemperatureFragment:
+    @pytest.mark.django_db
+    def test_viewers_share_the_fragment_until_readings_are_committed(
+        self, openweather_data, django_assert_num_queries
+    ):
+        async_to_sync(save_responses)([("openweather", openweather_data)])
+        station = WeatherStation.objects.get()
+        url = reverse("temperature_data_partial")
+        params = {"station_id": station.id, "interval": "1h"}
+
+        first = Client().get(url, params)
+        with django_assert_num_queries(0):
+            second = Client().get(url, params)
+        assert second.content == first.content
+        assert (cache_requests("temperature", "miss"), cache_requests("temperature", "hit")) == (1, 1)
+
+        # another interval is another fragment
+        Client().get(url, {**params, "interval": "24h"})
+        assert cache_requests("temperature", "miss") == 2
+
+        # the same reading polled again is not stored: the fragment is still valid
+        async_to_sync(save_responses)([("openweather", openweather_data)])
+        assert Client().get(url, params).content == first.content
+        newer = {**openweather_data, "dt": int(now().timestamp()), "main": {**openweather_data["main"], "temp": -5.5}}
+        async_to_sync(save_responses)([("openweather", newer)])
+        assert b"-5.5" in Client().get(url, params).content
+        assert (cache_requests("temperature", "miss"), cache_requests("temperature", "hit")) == (3, 2)
+
+    @pytest.mark.django_db
+    def test_unknown_intervals_share_the_default_fragment(self, openweather_data):
+        async_to_sync(save_responses)([("openweather", openweather_data)])
+        station = WeatherStation.objects.get()
+        url = reverse("temperature_data_partial")
+        first = Client().get(url, {"station_id": station.id})
+        for interval in ("1h", "1", "x" * 200):
+            assert Client().get(url, {"station_id": station.id, "interval": interval}).content == first.content
+        assert (cache_requests("temperature", "miss"), cache_requests("temperature", "hit")) == (1, 3)
+
+    @pytest.mark.django_db
+    def test_the_window_moving_forward_renders_again(self, openweather_data, frozen_window, monkeypatch):
+        async_to_sync(save_responses)([("openweather", openweather_data)])
+        params = {"station_id": WeatherStation.objects.get().id, "interval": "24h"}
+        url = reverse("temperature_data_partial")
+        Client().get(url, params)
+        # the window of the last 24 hours moves in steps of 24 minutes
+        monkeypatch.setattr("monitoring.views.now", lambda: frozen_window + timedelta(minutes=24))
+        Client().get(url, params)
+        assert (cache_requests("temperature", "miss"), cache_requests("temperature", "hit")) == (2, 0)
+
+    @pytest.mark.django_db
+    def test_delta_requests_are_not_cached(self, openweather_data):
+        async_to_sync(save_responses)([("openweather", openweather_data)])
+        station = WeatherStation.objects.get()
+        params = {"station_id": station.id, "interval": "1h", "since": now().isoformat()}
+        Client().get(reverse("temperature_data_partial"), params)
+        assert metrics.fragment_cache.snapshot() == {}
+
+
+class TestPostgresFragment:
+    @pytest.mark.django_db
+    def test_viewers_share_the_fragment_until_the_next_status(self, django_assert_num_queries):
+        publish_statuses([status(0)])
+        url = reverse("postgres_dashboard")
+        Client().get(url, HTTP_HX_REQUEST="true")
+        with django_assert_num_queries(0):
+            Client().get(url, HTTP_HX_REQUEST="true")
+        publish_statuses([status(10)])
+        Client().get(url, HTTP_HX_REQUEST="true")
+        assert (cache_requests("postgres", "miss"), cache_requests("postgres", "hit")) == (2, 1)
+
+        text = Client().get(reverse("metrics")).content.decode()
+        assert 'dashboard_fragment_cache_total{fragment="postgres",result="hit"} 1' in text
@@ -0,0 +1,62 @@
+from datetime import timedelta
+
+import pytest
+from django.db import connection
+from django.utils.timezone import now
+
+from monitoring.models import WeatherData, WeatherDataRollup, WeatherStation
+from monitoring.serializers import OpenWeatherSerializer
+
+
+def explain(queryset):
+    """Returns the query plan, forcing PostgreSQL to prefer indexes on the tiny test tables"""
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("SET enable_seqscan = off")
+    return queryset.explain()
+
+
+def assert_uses_index(plan, index_name):
+    if connection.vendor == "sqlite":
+        # SQLite names the index of an inline UNIQUE constraint sqlite_autoindex_<table>_<n>
+        assert "USING INDEX" in plan or "USING COVERING INDEX" in plan, plan
+    elif connection.vendor == "postgresql":
+        assert index_name in plan and "Seq Scan" not in plan, plan
+    else:
+        pytest.skip(f"No plan expectation for {connection.vendor}")
+
+
+class TestDashboardIndexes:
+    @pytest.mark.django_db
+    def test_raw_series_query_uses_station_timestamp_index(self, weather_station):
+        station = WeatherStation.objects.create(**weather_station)
+        queryset = WeatherData.objects.filter(station=station, timestamp__gte=now() - timedelta(hours=1)).order_by(
+            "timestamp"
+        )
+        plan = explain(queryset.values_list("timestamp", "temperature"))
+        assert_uses_index(plan, "unique_reading_station_timestamp")
+        if connection.vendor == "sqlite":
+            assert "station_id=? AND timestamp>?" in plan
+            assert "TEMP B-TREE" not in plan, "the index order must make the ORDER BY free"
+
+    @pytest.mark.django_db
+    def test_rollup_series_query_uses_bucket_index(self, weather_station):
+        station = WeatherStation.objects.create(**weather_station)
+        queryset = WeatherDataRollup.objects.filter(
+            station=station, resolution="5m", bucket_start__gte=now() - timedelta(hours=24)
+        ).order_by("bucket_start")
+        plan = explain(queryset.values_list("bucket_start", "temperature_avg"))
+        assert_uses_index(plan, "unique_rollup_bucket")
+        if connection.vendor == "sqlite":
+            assert "station_id=? AND resolution=? AND bucket_start>?" in plan
+
+
+class TestIdempotentIngestion:
+    @pytest.mark.django_db
+    def test_same_reading_is_stored_once(self, openweather_data):
+        for _ in range(3):
+            serializer = OpenWeatherSerializer(data=openweather_data)
+            assert serializer.is_valid(), serializer.errors
+            serializer.save()
+        assert WeatherData.objects.count() == 1
+        assert set(WeatherDataRollup.objects.values_list("count", flat=True)) == {1}
@@ -0,0 +1,133 @@
+import asyncio
+import json
+import os
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.urls import reverse
+
+from monitoring import metrics
+from monitoring.metrics import Registry
+from monitoring.services import save_responses
+
+
+@pytest.fixture
+def registry():
+    return Registry()
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    yield
+    metrics.registry.reset()
+
+
+def sample(text, line_start):
+    """Value of the exposition line starting with line_start"""
+    for line in text.splitlines():
+        if line.startswith(line_start + " "):
+            return float(line.rsplit(" ", 1)[1])
+    raise AssertionError(f"{line_start} not found in:\n{text}")
+
+
+class TestMetrics:
+    def test_histogram_exposition(self, registry):
+        fetch = registry.operation("fetch", "Fetches", ["source"])
+        fetch.duration.observe(0.02, source="netatmo")
+        fetch.duration.observe(3, source="netatmo")
+        text = registry.render()
+
+        assert "# TYPE fetch_duration_seconds histogram" in text
+        assert sample(text, 'fetch_duration_seconds_bucket{source="netatmo",le="0.01"}') == 0
+        assert sample(text, 'fetch_duration_seconds_bucket{source="netatmo",le="0.025"}') == 1
+        assert sample(text, 'fetch_duration_seconds_bucket{source="netatmo",le="+Inf"}') == 2
+        assert sample(text, 'fetch_duration_seconds_sum{source="netatmo"}') == pytest.approx(3.02)
+        assert sample(text, 'fetch_duration_seconds_count{source="netatmo"}') == 2
+
+    def test_async_calls_are_timed_until_awaited(self, registry):
+        fetch = registry.operation("fetch", "Fetches", ["source"])
+        in_flight = []
+
+        @fetch.timed(source="openweather")
+        async def get_weather_data():
+            in_flight.append(fetch.in_progress.snapshot()[("openweather",)])
+            await asyncio.sleep(0.05)
+            return {"ok": True}
+
+        assert asyncio.run(get_weather_data()) == {"ok": True}
+        text = registry.render()
+        assert in_flight == [1]
+        assert sample(text, 'fetch_duration_seconds_sum{source="openweather"}') >= 0.05
+        assert sample(text, 'fetch_total{source="openweather",outcome="ok"}') == 1
+        assert sample(text, 'fetch_in_progress{source="openweather"}') == 0
+
+    def test_sync_errors_are_counted_and_raised(self, registry):
+        probe = registry.operation("probe", "Probes")
+
+        @probe.timed()
+        def connect():
+            raise ConnectionError("down")
+
+        with pytest.raises(ConnectionError):
+            connect()
+        assert sample(registry.render(), 'probe_total{outcome="error"}') == 1
+
+    def test_metrics_published_by_other_processes_are_merged(self, tmp_path):
+        # what a worker that has since exited left behind: its counters still count, its gauges do not
+        published = {"readings_total": [[[], 5.0]], "fetch_in_progress": [[[], 1.0]]}
+        (tmp_path / "metrics-999999999-1.json").write_text(json.dumps({"pid": 999999999, "metrics": published}))
+        # a live worker, whose gauges count
+        live = {"pid": os.getppid(), "metrics": published}
+        (tmp_path / f"metrics-{os.getppid()}-1.json").write_text(json.dumps(live))
+
+        web = Registry(multiprocess_dir=str(tmp_path))
+        web.counter("readings_total", "Readings").inc(2)
+        web.operation("fetch", "Fetches")
+        text = web.render()
+        assert sample(text, "readings_total") == 12
+        assert sample(text, "fetch_in_progress") == 1
+
+        web.flush()
+        own = json.loads((tmp_path / f"metrics-{web.process}.json").read_text())
+        assert own["metrics"]["readings_total"] == [[[], 2.0]]
+
+    def test_files_of_exited_processes_are_folded(self, tmp_path):
+        web = Registry(multiprocess_dir=str(tmp_path))
+        web.counter("readings_total", "Readings")
+        web.operation("fetch", "Fetches")
+        for index in range(3):
+            published = {"readings_total": [[[], 5.0]], "fetch_in_progress": [[[], 1.0]]}
+            path = tmp_path / f"metrics-{999999990 + index}-1.json"
+            path.write_text(json.dumps({"pid": 999999990 + index, "metrics": published}))
+            assert sample(web.render(), "readings_total") == 5 * (index + 1)
+
+        assert sorted(path.name for path in tmp_path.glob("*.json")) == ["metrics-merged.json"]
+        text = web.render()
+        assert sample(text, "readings_total") == 15
+        assert "\nfetch_in_progress " not in text
+
+    def test_a_recycled_pid_does_not_overwrite_the_counters_of_the_exited_process(self, tmp_path):
+        exited = Registry(multiprocess_dir=str(tmp_path))
+        exited.counter("readings_total", "Readings").inc(5)
+        exited.flush()
+        recycled = Registry(multiprocess_dir=str(tmp_path))
+        recycled.counter("readings_total", "Readings").inc(1)
+        recycled.flush()
+        assert len(list(tmp_path.glob("metrics-*.json"))) == 2
+
+        web = Registry(multiprocess_dir=str(tmp_path))
+        web.counter("readings_total", "Readings")
+        assert sample(web.render(), "readings_total") == 6
+
+    @pytest.mark.django_db
+    def test_endpoint_exposes_ingestion_metrics(self, client, netatmo_station_data):
+        async_to_sync(save_responses)([("netatmo", {"body": [netatmo_station_data]})])
+        response = client.get(reverse("metrics"))
+
+        assert response.status_code == 200
+        assert response["Content-Type"].startswith("text/plain; version=0.0.4")
+        text = response.content.decode()
+        assert sample(text, 'weather_decode_total{source="netatmo",outcome="ok"}') >= 1
+        assert sample(text, 'weather_db_write_total{outcome="ok"}') >= 1
+        assert sample(text, "weather_readings_inserted_total") >= 1
+        assert "# TYPE postgres_probe_duration_seconds histogram" in text
@@ -0,0 +1,162 @@
+import asyncio
+import random
+
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from monitoring.api_clients.errors import ProviderResponseError, RateLimitExceeded
+from monitoring.api_clients.netatmo import NetatmoAPIClient
+from monitoring.api_clients.session import close_session
+from monitoring.api_clients.tiling import BoundingBox
+
+BBOX = {"lat_ne": 45.6, "lon_ne": 9.4, "lat_sw": 45.4, "lon_sw": 9.0}
+NETATMO_LIMIT = {"rate": 500 / 3600, "burst": 50}
+
+
+def synthetic_stations(count):
+    rnd = random.Random(42)
+    return [
+        {
+            "_id": f"70:ee:50:{index:06x}",
+            "place": {"location": [rnd.uniform(9.0, 9.4), rnd.uniform(45.4, 45.6)], "city": "Milan", "street": "Via"},
+            "measures": {},
+        }
+        for index in range(count)
+    ]
+
+
+@pytest_asyncio.fixture
+async def netatmo_server(settings):
+    """Fake getpublicdata returning at most 50 stations per request, like the thinned out real API"""
+    stations = synthetic_stations(1000)
+    requests = []
+    # boxes answered with a 404
+    failing = []
+
+    async def getpublicdata(request):
+        bbox = {name: float(request.query[name]) for name in BBOX}
+        requests.append(bbox)
+        if bbox in failing:
+            return web.Response(status=404)
+        inside = [
+            station
+            for station in stations
+            if bbox["lon_sw"] <= station["place"]["location"][0] < bbox["lon_ne"]
+            and bbox["lat_sw"] <= station["place"]["location"][1] < bbox["lat_ne"]
+        ]
+        return web.json_response({"status": "ok", "body": inside[:50]})
+
+    app = web.Application()
+    app.router.add_get("/getpublicdata", getpublicdata)
+    server = TestServer(app)
+    await server.start_server()
+    settings.NETATMO_BASE_URL = str(server.make_url("")).rstrip("/")
+    settings.API_RESPONSE_CACHE = {"backend": None}
+    # the Netatmo quota of the settings, failing at once once used up
+    settings.API_RATE_LIMIT = {"backend": "local", "max_wait": 0, "limits": {"netatmo": NETATMO_LIMIT}}
+    yield stations, requests, failing
+    await close_session()
+    await server.close()
+
+
+class TestBoundingBox:
+    def test_quadrants_share_the_center(self):
+        quadrants = BoundingBox(2.0, 2.0, 0.0, 0.0).quadrants()
+        assert sorted(quadrants) == sorted(
+            [
+                BoundingBox(2.0, 2.0, 1.0, 1.0),
+                BoundingBox(2.0, 1.0, 1.0, 0.0),
+                BoundingBox(1.0, 2.0, 0.0, 1.0),
+                BoundingBox(1.0, 1.0, 0.0, 0.0),
+            ]
+        )
+
+
+class TestNetatmoTiling:
+    @pytest.mark.asyncio
+    async def test_thinned_out_tiles_are_subdivided(self, netatmo_server, settings):
+        stations, requests, _ = netatmo_server
+        settings.NETATMO_TILING = {"max_stations": 50, "max_depth": 5}
+        settings.API_RATE_LIMIT["limits"] = {"netatmo": {**NETATMO_LIMIT, "burst": 100}}
+        data = await NetatmoAPIClient().get_weather_data(**BBOX)
+        ids = [station["_id"] for station in data["body"]]
+        assert len(ids) == len(set(ids))
+        assert len(ids) == len(stations)
+        # the whole box first, then only the quadrants of thinned out tiles
+        assert requests[0] == BBOX
+        assert len(requests) % 4 == 1
+        assert "errors" not in data
+
+    @pytest.mark.asyncio
+    async def test_the_netatmo_burst_bounds_the_subdivision(self, netatmo_server, settings):
+        stations, requests, _ = netatmo_server
+        settings.NETATMO_TILING = {"max_stations": 50, "max_depth": 5}
+        data = await NetatmoAPIClient().get_weather_data(**BBOX)
+        # the tiles left unsplit keep their thinned out stations, no request is refused
+        assert len(requests) <= NETATMO_LIMIT["burst"]
+        assert "errors" not in data
+        assert len(data["body"]) > 0.8 * len(stations)
+
+    @pytest.mark.asyncio
+    async def test_sparse_box_is_a_single_request(self, netatmo_server, settings):
+        _, requests, _ = netatmo_server
+        settings.NETATMO_TILING = {"max_stations": 50, "max_depth": 4}
+        data = await NetatmoAPIClient().get_weather_data(lat_ne=45.41, lon_ne=9.01, lat_sw=45.4, lon_sw=9.0)
+        assert len(data["body"]) < 50
+        assert len(requests) == 1
+
+    @pytest.mark.asyncio
+    async def test_single_request_without_tiling(self, netatmo_server, settings):
+        _, requests, _ = netatmo_server
+        settings.NETATMO_TILING = {"max_stations": 50, "max_depth": 0}
+        data = await NetatmoAPIClient().get_weather_data(**BBOX)
+        assert len(data["body"]) == 50
+        assert len(requests) == 1
+
+    @pytest.mark.asyncio
+    async def test_failed_tiles_leave_the_others(self, netatmo_server, settings):
+        _, requests, failing = netatmo_server
+        settings.NETATMO_TILING = {"max_stations": 50, "max_depth": 1}
+        failing.append(BoundingBox(**BBOX).quadrants()[0].as_params())
+        data = await NetatmoAPIClient().get_weather_data(**BBOX)
+        assert len(requests) == 5
+        # the root request and three quadrants, deduplicated
+        assert 50 < len(data["body"]) <= 200
+        assert len(data["errors"]) == 1
+        assert "404" in data["errors"][0]
+
+        # nothing fetched at all: the error is raised
+        failing.append(BBOX)
+        with pytest.raises(ProviderResponseError):
+            await NetatmoAPIClient().get_weather_data(**BBOX)
+
+    @pytest.mark.asyncio
+    async def test_subdivision_stays_within_the_rate_limit(self, netatmo_server, settings):
+        _, requests, _ = netatmo_server
+        settings.NETATMO_TILING = {"max_stations": 50, "max_depth": 5}
+        settings.API_RATE_LIMIT["limits"] = {"netatmo": {"rate": 1e-6, "burst": 10}}
+        # the root request, then the quadrants of two of the four thinned out quadrants
+        data = await NetatmoAPIClient().get_weather_data(**BBOX)
+        assert len(requests) == 9
+        assert "errors" not in data
+        assert len(data["body"]) > 200
+
+        # one token left: the box alone, then nothing
+        assert len((await NetatmoAPIClient().get_weather_data(**BBOX))["body"]) == 50
+        assert len(requests) == 10
+        with pytest.raises(RateLimitExceeded):
+            await NetatmoAPIClient().get_weather_data(**BBOX)
+
+    @pytest.mark.asyncio
+    async def test_tiles_refused_by_the_rate_limit_are_partial_errors(self, netatmo_server, settings, monkeypatch):
+        _, requests, _ = netatmo_server
+        settings.NETATMO_TILING = {"max_stations": 50, "max_depth": 1}
+        settings.API_RATE_LIMIT["limits"] = {"netatmo": {"rate": 1e-6, "burst": 3}}
+        # another process draws from the bucket after the budget was read
+        monkeypatch.setattr(NetatmoAPIClient, "request_budget", lambda self: asyncio.sleep(0, 5))
+        data = await NetatmoAPIClient().get_weather_data(**BBOX)
+        assert len(requests) == 3
+        assert len(data["errors"]) == 2
+        assert all("rate limit exceeded" in error for error in data["errors"])
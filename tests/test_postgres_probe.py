@@ -0,0 +1,172 @@
+import asyncio
+import socket
+import time
+from datetime import timedelta
+from unittest.mock import patch
+
+import psycopg2
+import psycopg2.extensions
+import pytest
+from django.core.management import call_command
+from django.test import Client
+from django.urls import reverse
+from django.utils.timezone import now
+
+from monitoring.models import PostgresStatusInterval
+from monitoring.postgres_probe import PostgresProber, get_postgres_status, probe_and_save, prober
+
+
+def target(name, **overrides):
+    return {"NAME": name, "USER": "", "PASSWORD": "", "HOST": "", "PORT": "", **overrides}
+
+
+class FakeConnection:
+    """Stands in for an asynchronous psycopg2 connection; a hung one never becomes readable"""
+
+    def __init__(self, hung=False):
+        self.hung = hung
+        self.closed = 0
+        self.queries = []
+        self.sockets = socket.socketpair()
+
+    def poll(self):
+        if self.closed:
+            raise psycopg2.InterfaceError("connection already closed")
+        return psycopg2.extensions.POLL_READ if self.hung else psycopg2.extensions.POLL_OK
+
+    def fileno(self):
+        return self.sockets[0].fileno()
+
+    def cursor(self):
+        return self
+
+    def execute(self, query):
+        self.queries.append(query)
+
+    def fetchone(self):
+        return (1,)
+
+    def close(self):
+        self.closed = 1
+        for sock in self.sockets:
+            sock.close()
+
+
+@pytest.fixture
+def connections():
+    """Patches psycopg2.connect, returning the fake connections opened per database name"""
+    opened = {}
+
+    def connect(dbname, **kwargs):
+        assert kwargs["async_"] is True
+        conn = FakeConnection(hung=dbname.startswith("hung"))
+        conn.kwargs = kwargs
+        opened.setdefault(dbname, []).append(conn)
+        return conn
+
+    with patch("monitoring.postgres_probe.psycopg2.connect", side_effect=connect):
+        yield opened
+    prober.close()
+
+
+class TestPostgresProber:
+    def test_targets_are_probed_concurrently_with_timeouts(self, connections, settings):
+        settings.POSTGRES_PROBE = {"connect_timeout": 0.2}
+        targets = {f"hung-{index}": target(f"hung-{index}") for index in range(5)}
+        targets["fast"] = target("fast", STATEMENT_TIMEOUT=500)
+
+        start = time.perf_counter()
+        statuses = {status["target"]: status for status in asyncio.run(PostgresProber().probe_all(targets))}
+        elapsed = time.perf_counter() - start
+
+        # the five hung targets time out together, not one after the other
+        assert elapsed < 0.2 * 3
+        assert statuses["fast"]["status"] == "up"
+        assert statuses["fast"]["latency_ms"] is not None
+        assert connections["fast"][0].kwargs["options"] == "-c statement_timeout=500"
+        assert connections["fast"][0].queries == ["SELECT 1"]
+        assert {statuses[f"hung-{index}"]["status"] for index in range(5)} == {"down"}
+        assert all(conn.closed for index in range(5) for conn in connections[f"hung-{index}"])
+
+    def test_parallelism_is_bounded(self, connections, settings):
+        settings.POSTGRES_PROBE = {"connect_timeout": 0.1, "concurrency": 2}
+        targets = {f"hung-{index}": target(f"hung-{index}") for index in range(4)}
+
+        start = time.perf_counter()
+        asyncio.run(PostgresProber().probe_all(targets))
+        # two waves of two timeouts
+        assert time.perf_counter() - start >= 0.2
+
+    def test_connections_are_reused_and_replaced_when_broken(self, connections):
+        targets = {"main": target("main")}
+        instance = PostgresProber()
+
+        async def probe_three_times():
+            first = await instance.probe_all(targets)
+            second = await instance.probe_all(targets)
+            instance.connections["main"].close()
+            third = await instance.probe_all(targets)
+            return first + second + third
+
+        statuses = asyncio.run(probe_three_times())
+        assert [status["status"] for status in statuses] == ["up", "up", "up"]
+        assert len(connections["main"]) == 2
+        assert connections["main"][0].queries == ["SELECT 1", "SELECT 1"]
+        instance.close()
+
+    @pytest.mark.django_db
+    def test_statuses_are_published_and_logged_per_target(self, connections, settings):
+        settings.DATABASE_TO_MONITOR = {"default": target("default"), "hung": target("hung")}
+        settings.POSTGRES_PROBE = {"connect_timeout": 0.1}
+        asyncio.run(probe_and_save())
+
+        assert get_postgres_status("default")["status"] == "up"
+        assert get_postgres_status("hung")["status"] == "down"
+        assert get_postgres_status("missing")["status"] == "unknown"
+        intervals = dict(PostgresStatusInterval.objects.values_list("target", "status"))
+        assert intervals == {"default": "up", "hung": "down"}
+        assert PostgresStatusInterval.objects.get(target="default").latency_avg is not None
+
+    @pytest.mark.django_db
+    def test_stale_status_is_unknown(self, connections, settings):
+        settings.POSTGRES_PROBE = {"stale_after": 30}
+        with patch("monitoring.postgres_probe.now", return_value=now() - timedelta(minutes=5)):
+            asyncio.run(probe_and_save({"default": target("default")}))
+
+        assert get_postgres_status()["status"] == "unknown"
+
+    @pytest.mark.django_db
+    def test_command_probes_once_and_logs(self, connections, settings):
+        settings.DATABASE_TO_MONITOR = {"default": target("default")}
+        call_command("probe_postgres", "--once")
+        assert list(PostgresStatusInterval.objects.values_list("status", flat=True)) == ["up"]
+
+
+class TestPostgresStatusViews:
+    @pytest.mark.django_db
+    def test_views_never_contact_the_monitored_database(self, connections, settings):
+        settings.DATABASE_TO_MONITOR = {"default": target("default"), "replica": target("replica")}
+        response = Client().get(reverse("postgres_status_view"))
+        assert "UNKNOWN" in response.content.decode()
+
+        asyncio.run(probe_and_save())
+        opened = sum(len(conns) for conns in connections.values())
+        for name in ("postgres_status_view", "postgres_status_page"):
+            response = Client().get(reverse(name), {"target": "replica"})
+            assert response.status_code == 200
+            assert "PostgreSQL replica is UP" in response.content.decode()
+        assert sum(len(conns) for conns in connections.values()) == opened
+
+    @pytest.mark.django_db
+    def test_dashboard_filters_by_target(self, settings):
+        settings.DATABASE_TO_MONITOR = {"default": target("default"), "replica": target("replica")}
+        checked_at = now() - timedelta(minutes=5)
+        PostgresStatusInterval.objects.bulk_create(
+            PostgresStatusInterval(target=name, status=status, started_at=checked_at, ended_at=checked_at)
+            for name, status in (("default", "up"), ("replica", "down"))
+        )
+        response = Client().get(reverse("postgres_dashboard"), {"target": "replica"})
+
+        assert response.context["statuses"] == "[0, 0]"
+        assert list(response.context["targets"]) == ["default", "replica"]
+        assert '<option value="replica" selected>' in response.content.decode()
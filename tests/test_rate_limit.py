@@ -0,0 +1,113 @@
+import asyncio
+import time
+
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from monitoring import metrics
+from monitoring.api_clients.openweather import OpenWeatherAPIClient
+from monitoring.api_clients.errors import RateLimitExceeded
+from monitoring.api_clients.rate_limit import DatabaseBackend, LocalBackend, RateLimiter, get_rate_limiter
+from monitoring.api_clients.session import close_session
+from monitoring.models import RateLimitBucket
+
+LIMITS = {"openweather": {"rate": 50.0, "burst": 5}}
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.registry.reset()
+    yield
+    metrics.registry.reset()
+
+
+class TestRateLimiter:
+    @pytest.mark.asyncio
+    async def test_requests_beyond_the_burst_wait_for_a_token(self):
+        limiter = RateLimiter(LocalBackend(), LIMITS, max_wait=1)
+        started = time.monotonic()
+        waits = [await limiter.acquire("openweather") for _ in range(10)]
+        assert waits[:5] == [0.0] * 5
+        # five more tokens at 50 per second
+        assert time.monotonic() - started >= 0.09
+        assert all(wait > 0 for wait in waits[5:])
+        # providers without limits are never throttled
+        assert await limiter.acquire("netatmo") == 0.0
+
+        snapshot = metrics.registry.snapshot()["weather_provider_rate_limit_wait_seconds"]
+        assert snapshot[("openweather",)][0] == 5
+
+    @pytest.mark.asyncio
+    async def test_a_request_that_would_wait_too_long_fails(self):
+        limiter = RateLimiter(LocalBackend(), {"openweather": {"rate": 0.1, "burst": 1}}, max_wait=1)
+        await limiter.acquire("openweather")
+        with pytest.raises(RateLimitExceeded) as exc_info:
+            await limiter.acquire("openweather")
+        assert exc_info.value.retry_after == pytest.approx(10, abs=0.1)
+        assert metrics.registry.snapshot()["weather_provider_rate_limit_rejected_total"] == {("openweather",): 1}
+
+    @pytest.mark.asyncio
+    @pytest.mark.django_db(transaction=True)
+    async def test_database_buckets_are_shared_between_processes(self):
+        # two limiters stand for the web server and a Django-Q worker
+        limits = {"openweather": {"rate": 0.1, "burst": 5}}
+        server, worker = (RateLimiter(DatabaseBackend(), limits, max_wait=0) for _ in range(2))
+        waits = await asyncio.gather(*(limiter.acquire("openweather") for limiter in ([server, worker] * 3)[:5]))
+        assert waits == [0.0] * 5
+        with pytest.raises(RateLimitExceeded):
+            await worker.acquire("openweather")
+        bucket = await RateLimitBucket.objects.aget(name="openweather")
+        assert bucket.tokens < 1
+
+    @pytest.mark.asyncio
+    @pytest.mark.django_db(transaction=True)
+    @pytest.mark.parametrize("backend", [LocalBackend, DatabaseBackend])
+    async def test_budget_forecasts_the_slots_without_taking_them(self, backend):
+        limiter = RateLimiter(backend(), {"openweather": {"rate": 0.1, "burst": 5}}, max_wait=10)
+        assert await limiter.budget("openweather") == pytest.approx(6)
+        await limiter.acquire("openweather")
+        await limiter.acquire("openweather")
+        assert await limiter.budget("openweather") == pytest.approx(4, abs=0.01)
+        assert await limiter.budget("openweather") == pytest.approx(4, abs=0.01)
+        assert await limiter.budget("netatmo") is None
+
+
+@pytest_asyncio.fixture
+async def openweather_server(settings):
+    requests = []
+
+    async def weather(request):
+        requests.append(request.query)
+        return web.json_response({"dt": 1741599999})
+
+    app = web.Application()
+    app.router.add_get("/weather", weather)
+    server = TestServer(app)
+    await server.start_server()
+    settings.OPENWEATHER_BASE_URL = str(server.make_url("")).rstrip("/")
+    settings.API_RESPONSE_CACHE = {"backend": None}
+    yield requests
+    await close_session()
+    await server.close()
+
+
+class TestClientThrottling:
+    @pytest.mark.asyncio
+    async def test_requests_go_through_the_limiter(self, openweather_server, settings):
+        settings.API_RATE_LIMIT = {
+            "backend": "local",
+            "max_wait": 0,
+            "limits": {"openweather": {"rate": 0.1, "burst": 2}},
+        }
+        client = OpenWeatherAPIClient()
+        responses = [await client.get_weather_data(lat=45.0, lon=9.0) for _ in range(2)]
+        assert responses == [{"dt": 1741599999}] * 2
+        with pytest.raises(RateLimitExceeded):
+            await client.get_weather_data(lat=45.0, lon=9.0)
+        assert len(openweather_server) == 2
+
+    def test_disabled_limiter(self, settings):
+        settings.API_RATE_LIMIT = {"backend": None}
+        assert get_rate_limiter() is None
@@ -0,0 +1,151 @@
+import asyncio
+import time
+
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from monitoring import metrics
+from monitoring.api_clients.errors import (CircuitOpen, DeadlineExceeded, ProviderResponseError, ProviderThrottled,
+                                           ProviderUnavailable)
+from monitoring.api_clients.openweather import OpenWeatherAPIClient
+from monitoring.api_clients.resilience import get_circuit_breaker
+from monitoring.api_clients.session import close_session
+from monitoring.services import fetch_and_save_weather
+
+
+@pytest_asyncio.fixture
+async def provider(settings):
+    """OpenWeather stand-in answering with the queued (status, delay) pairs, then 200"""
+    answers = []
+    requests = []
+
+    async def weather(request):
+        requests.append(request)
+        status, delay, headers = answers.pop(0) if answers else (200, 0, {})
+        await asyncio.sleep(delay)
+        if status != 200:
+            return web.Response(status=status, headers=headers)
+        return web.json_response({"dt": 1741599999})
+
+    app = web.Application()
+    app.router.add_get("/weather", weather)
+    server = TestServer(app)
+    await server.start_server()
+    settings.OPENWEATHER_BASE_URL = str(server.make_url("")).rstrip("/")
+    settings.API_RESPONSE_CACHE = {"backend": None}
+    settings.API_RATE_LIMIT = {"backend": None}
+    settings.API_RESILIENCE = {"retries": 2, "backoff": 0.01, "failure_threshold": 3, "reset_timeout": 0.2}
+    metrics.registry.reset()
+    yield answers, requests
+    metrics.registry.reset()
+    await close_session()
+    await server.close()
+
+
+class TestRetries:
+    @pytest.mark.asyncio
+    async def test_transient_failures_are_retried(self, provider):
+        answers, requests = provider
+        answers += [(503, 0, {}), (502, 0, {})]
+        assert await OpenWeatherAPIClient().get_weather_data(lat=45.0, lon=9.0) == {"dt": 1741599999}
+        assert len(requests) == 3
+        assert metrics.registry.snapshot()["weather_provider_retries_total"] == {("openweather",): 2}
+
+    @pytest.mark.asyncio
+    async def test_retries_are_bounded(self, provider):
+        answers, requests = provider
+        answers += [(500, 0, {})] * 5
+        with pytest.raises(ProviderUnavailable, match="500"):
+            await OpenWeatherAPIClient().get_weather_data(lat=45.0, lon=9.0)
+        assert len(requests) == 3
+
+    @pytest.mark.asyncio
+    async def test_client_errors_are_not_retried(self, provider):
+        answers, requests = provider
+        answers.append((401, 0, {}))
+        with pytest.raises(ProviderResponseError) as exc_info:
+            await OpenWeatherAPIClient().get_weather_data(lat=45.0, lon=9.0)
+        assert exc_info.value.status == 401
+        assert len(requests) == 1
+
+    @pytest.mark.asyncio
+    async def test_throttled_requests_wait_for_retry_after(self, provider, settings):
+        answers, requests = provider
+        answers.append((429, 0, {"Retry-After": "1"}))
+        started = time.monotonic()
+        assert await OpenWeatherAPIClient().get_weather_data(lat=45.0, lon=9.0) == {"dt": 1741599999}
+        assert time.monotonic() - started >= 1
+        # a Retry-After beyond the deadline fails at once
+        settings.API_RESILIENCE = {"deadline": 0.5}
+        answers.append((429, 0, {"Retry-After": "60"}))
+        with pytest.raises(DeadlineExceeded) as exc_info:
+            await OpenWeatherAPIClient().get_weather_data(lat=45.0, lon=9.0)
+        assert isinstance(exc_info.value.__cause__, ProviderThrottled)
+
+
+class TestDeadline:
+    @pytest.mark.asyncio
+    async def test_slow_requests_stop_at_the_deadline(self, provider, settings):
+        answers, requests = provider
+        settings.API_RESILIENCE = {"deadline": 0.3, "attempt_timeout": 0.1, "backoff": 0.01}
+        answers += [(200, 1, {})] * 5
+        started = time.monotonic()
+        with pytest.raises(DeadlineExceeded):
+            await OpenWeatherAPIClient().get_weather_data(lat=45.0, lon=9.0)
+        assert time.monotonic() - started < 0.5
+        # every attempt was cut by its own timeout
+        assert len(requests) >= 2
+
+
+class TestCircuitBreaker:
+    @pytest.mark.asyncio
+    async def test_circuit_opens_then_closes_after_a_successful_trial(self, provider, settings):
+        answers, requests = provider
+        settings.API_RESILIENCE = {"retries": 0, "failure_threshold": 3, "reset_timeout": 0.2}
+        answers += [(503, 0, {})] * 3
+        client = OpenWeatherAPIClient()
+        for _ in range(3):
+            with pytest.raises(ProviderUnavailable):
+                await client.get_weather_data(lat=45.0, lon=9.0)
+        assert get_circuit_breaker("openweather").state == "open"
+
+        with pytest.raises(CircuitOpen):
+            await client.get_weather_data(lat=45.0, lon=9.0)
+        assert len(requests) == 3
+        assert metrics.registry.snapshot()["weather_provider_circuit_open_total"] == {("openweather",): 1}
+
+        await asyncio.sleep(0.2)
+        assert get_circuit_breaker("openweather").state == "half-open"
+        assert await client.get_weather_data(lat=45.0, lon=9.0) == {"dt": 1741599999}
+        assert get_circuit_breaker("openweather").state == "closed"
+
+    @pytest.mark.asyncio
+    async def test_a_failed_trial_opens_the_circuit_again(self, provider, settings):
+        answers, requests = provider
+        settings.API_RESILIENCE = {"retries": 0, "failure_threshold": 1, "reset_timeout": 0.1}
+        answers += [(503, 0, {})] * 2
+        client = OpenWeatherAPIClient()
+        with pytest.raises(ProviderUnavailable):
+            await client.get_weather_data(lat=45.0, lon=9.0)
+        await asyncio.sleep(0.1)
+        with pytest.raises(ProviderUnavailable):
+            await client.get_weather_data(lat=45.0, lon=9.0)
+        with pytest.raises(CircuitOpen):
+            await client.get_weather_data(lat=45.0, lon=9.0)
+        assert len(requests) == 2
+
+
+class TestFetchAndSave:
+    @pytest.mark.asyncio
+    @pytest.mark.django_db(transaction=True)
+    async def test_errors_are_reported_by_type(self, provider):
+        answers, _ = provider
+        answers.append((403, 0, {}))
+        assert (await fetch_and_save_weather(OpenWeatherAPIClient(), lat=45.0, lon=9.0))["error"].startswith(
+            "Unauthorized"
+        )
+        answers += [(503, 0, {})] * 3
+        result = await fetch_and_save_weather(OpenWeatherAPIClient(), lat=45.0, lon=9.0)
+        assert result == {"error": "openweather: 503 Service Unavailable"}
@@ -0,0 +1,79 @@
+import pytest
+
+from monitoring import metrics
+from monitoring.api_clients.response_cache import cached_response, get_response_cache, reset_response_cache
+
+
+class CountingClient:
+    source = "openweather"
+    update_interval = 600
+
+    def __init__(self):
+        self.calls = 0
+
+    @cached_response
+    async def get_weather_data(self, endpoint="weather", **kwargs):
+        self.calls += 1
+        if kwargs.get("lat") is None:
+            return {"Error": "400, message='Bad Request'"}
+        return {"endpoint": endpoint, "call": self.calls}
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.registry.reset()
+    yield
+    metrics.registry.reset()
+
+
+class TestResponseCache:
+    @pytest.mark.asyncio
+    async def test_nearby_coordinates_share_the_cached_response(self):
+        client = CountingClient()
+        first = await client.get_weather_data(lat=45.49681, lon=9.21940)
+        second = await client.get_weather_data(lat=45.49684, lon=9.21936)
+        assert first == second == {"endpoint": "weather", "call": 1}
+        assert client.calls == 1
+        assert get_response_cache().stats() == {"hits": {"openweather": 1}, "misses": {"openweather": 1}}
+        # exposed at /monitoring/metrics as well
+        assert metrics.response_cache.snapshot() == {("openweather", "hit"): 1, ("openweather", "miss"): 1}
+
+    @pytest.mark.asyncio
+    async def test_key_includes_endpoint_and_precision(self, settings):
+        settings.API_RESPONSE_CACHE = {"backend": "local", "precision": 4}
+        reset_response_cache()
+        client = CountingClient()
+        await client.get_weather_data(lat=45.49681, lon=9.21940)
+        await client.get_weather_data(lat=45.49694, lon=9.21940)
+        await client.get_weather_data("forecast", lat=45.49694, lon=9.21940)
+        assert client.calls == 3
+
+    @pytest.mark.asyncio
+    async def test_errors_and_expired_responses_are_fetched_again(self, settings):
+        settings.API_RESPONSE_CACHE = {"backend": "local", "ttl": {"openweather": 0}}
+        reset_response_cache()
+        client = CountingClient()
+        await client.get_weather_data(lat=None)
+        await client.get_weather_data(lat=None)
+        await client.get_weather_data(lat=45.0, lon=9.0)
+        await client.get_weather_data(lat=45.0, lon=9.0)
+        assert client.calls == 4
+
+    @pytest.mark.asyncio
+    async def test_django_cache_backend(self, settings):
+        settings.CACHES = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+        settings.API_RESPONSE_CACHE = {"backend": "django"}
+        reset_response_cache()
+        client = CountingClient()
+        await client.get_weather_data(lat=45.0, lon=9.0)
+        assert await client.get_weather_data(lat=45.0, lon=9.0) == {"endpoint": "weather", "call": 1}
+        assert client.calls == 1
+
+    @pytest.mark.asyncio
+    async def test_disabled_cache(self, settings):
+        settings.API_RESPONSE_CACHE = {"backend": None}
+        reset_response_cache()
+        client = CountingClient()
+        await client.get_weather_data(lat=45.0, lon=9.0)
+        await client.get_weather_data(lat=45.0, lon=9.0)
+        assert client.calls == 2
@@ -0,0 +1,157 @@
+import math
+from datetime import datetime, timedelta, timezone
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+
+from monitoring.models import WeatherData, WeatherDataRollup, WeatherStation
+from monitoring.retention import (DEFAULT_PARTITION, apply_retention, archive_path, ensure_partitions,
+                                  is_partitioned, month_start, months_between, next_month, partition_months,
+                                  partition_name, read_archive, retention_boundary)
+from monitoring.rollups import rebuild_rollups, update_rollups
+
+CURRENT = datetime(2025, 5, 20, 12, 0, tzinfo=timezone.utc)
+FEBRUARY, MARCH, APRIL = (datetime(2025, month, 1, tzinfo=timezone.utc) for month in (2, 3, 4))
+
+
+@pytest.fixture
+def station(weather_station):
+    return WeatherStation.objects.create(**weather_station)
+
+
+@pytest.fixture
+def retention_settings(settings, tmp_path):
+    settings.RETENTION = {"raw_days": 30, "archive_dir": str(tmp_path), "chunk_size": 7}
+    return settings.RETENTION
+
+
+def add_readings(station, start, days, humidity=50):
+    """One reading every 6 hours from start, with their rollups"""
+    readings = WeatherData.objects.bulk_create(
+        WeatherData(
+            station=station, timestamp=start + timedelta(hours=6 * index), temperature=float(index), humidity=humidity
+        )
+        for index in range(days * 4)
+    )
+    update_rollups(readings)
+    return readings
+
+
+class TestRetentionBoundary:
+    def test_only_whole_months_older_than_the_ttl_expire(self):
+        assert retention_boundary(30, CURRENT) == datetime(2025, 4, 1, tzinfo=timezone.utc)
+        assert retention_boundary(None, CURRENT) is None
+        months = months_between(datetime(2024, 12, 15, tzinfo=timezone.utc), datetime(2025, 3, 1, tzinfo=timezone.utc))
+        assert [month.month for month in months] == [12, 1, 2]
+
+
+class TestApplyRetention:
+    @pytest.mark.django_db
+    def test_expired_months_are_archived_then_deleted(self, station, retention_settings, tmp_path):
+        add_readings(station, datetime(2025, 2, 1, tzinfo=timezone.utc), days=28, humidity=None)
+        add_readings(station, datetime(2025, 3, 1, tzinfo=timezone.utc), days=31)
+        add_readings(station, datetime(2025, 4, 1, tzinfo=timezone.utc), days=30)
+
+        results = apply_retention(current=CURRENT)
+
+        assert [(f"{month:%Y-%m}", rows) for month, rows, _ in results] == [("2025-02", 112), ("2025-03", 124)]
+        assert WeatherData.objects.count() == 120
+        assert WeatherData.objects.earliest("timestamp").timestamp == datetime(2025, 4, 1, tzinfo=timezone.utc)
+        february = read_archive(archive_path(tmp_path, datetime(2025, 2, 1, tzinfo=timezone.utc)))
+        assert len(february["id"]) == 112
+        assert february["timestamp"][1] == datetime(2025, 2, 1, 6, tzinfo=timezone.utc)
+        assert february["temperature"][1] == 1.0
+        assert math.isnan(february["humidity"][0])
+        assert read_archive(results[1][2])["humidity"][0] == 50
+
+        assert apply_retention(current=CURRENT) == []
+
+    @pytest.mark.django_db
+    def test_late_readings_are_added_to_the_archive(self, station, retention_settings, tmp_path):
+        add_readings(station, datetime(2025, 2, 1, tzinfo=timezone.utc), days=2)
+        apply_retention(current=CURRENT)
+        WeatherData.objects.create(
+            station=station, timestamp=datetime(2025, 2, 20, tzinfo=timezone.utc), temperature=-3.0
+        )
+        apply_retention(current=CURRENT)
+        archive = read_archive(archive_path(tmp_path, datetime(2025, 2, 1, tzinfo=timezone.utc)))
+        assert len(archive["id"]) == 9
+        assert archive["temperature"][-1] == -3.0
+        assert not WeatherData.objects.exists()
+
+    @pytest.mark.django_db
+    def test_rollups_outlive_the_raw_readings(self, station, retention_settings):
+        add_readings(station, datetime(2025, 3, 1, tzinfo=timezone.utc), days=31)
+        add_readings(station, datetime(2025, 4, 1, tzinfo=timezone.utc), days=30)
+        rollups = WeatherDataRollup.objects.count()
+        apply_retention(current=CURRENT)
+
+        # a full rebuild only recomputes the days still holding raw readings
+        rebuild_rollups()
+        assert WeatherDataRollup.objects.count() == rollups
+        march = WeatherDataRollup.objects.filter(resolution="1d", bucket_start__month=3)
+        assert march.count() == 31
+
+    @pytest.mark.django_db
+    def test_command(self, station, retention_settings):
+        add_readings(station, datetime(2025, 2, 1, tzinfo=timezone.utc), days=1)
+        out = StringIO()
+        call_command("apply_retention", "--raw-days", "30", stdout=out)
+        assert "2025-02: 4 readings archived" in out.getvalue()
+
+
+def count_rows(table):
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT count(*) FROM "{table}"')
+        return cursor.fetchone()[0]
+
+
+@pytest.fixture
+def partitions():
+    """Drops the monthly partitions the test created: DDL outlives the flush between tests"""
+    before = set(partition_months())
+    yield
+    with connection.cursor() as cursor:
+        for month in set(partition_months()) - before:
+            cursor.execute(f'DROP TABLE "{partition_name(month)}"')
+
+
+@pytest.mark.postgresql
+class TestPartitions:
+    @pytest.mark.django_db(transaction=True)
+    def test_migration_partitions_the_readings_by_month(self):
+        assert is_partitioned()
+        current = month_start(datetime.now(timezone.utc))
+        assert {current, next_month(current), next_month(next_month(current))} <= set(partition_months())
+        assert count_rows(DEFAULT_PARTITION) == 0
+
+    @pytest.mark.django_db(transaction=True)
+    def test_new_partitions_take_the_readings_of_the_default_one(self, station, partitions):
+        # older than the partitions of the migration: stored in the default partition
+        add_readings(station, FEBRUARY, days=28)
+        assert count_rows(DEFAULT_PARTITION) == 112
+
+        assert ensure_partitions(1, current=FEBRUARY) == [FEBRUARY, MARCH]
+        assert count_rows(partition_name(FEBRUARY)) == 112
+        assert count_rows(DEFAULT_PARTITION) == 0
+        assert WeatherData.objects.count() == 112
+        # the attached partition keeps the unique (station, timestamp) constraint
+        with pytest.raises(IntegrityError), transaction.atomic():
+            WeatherData.objects.create(station=station, timestamp=FEBRUARY, temperature=1.0)
+
+    @pytest.mark.django_db(transaction=True)
+    def test_expired_partitions_are_archived_then_dropped(self, station, retention_settings, partitions):
+        ensure_partitions(2, current=FEBRUARY)
+        add_readings(station, FEBRUARY, days=28)
+        add_readings(station, MARCH, days=31)
+        add_readings(station, APRIL, days=30)
+
+        results = apply_retention(current=CURRENT)
+
+        assert [(f"{month:%Y-%m}", rows) for month, rows, _ in results] == [("2025-02", 112), ("2025-03", 124)]
+        assert {FEBRUARY, MARCH}.isdisjoint(partition_months())
+        assert APRIL in partition_months()
+        assert WeatherData.objects.count() == 120
+        assert len(read_archive(results[0][2])["id"]) == 112
@@ -0,0 +1,142 @@
+from datetime import datetime, timedelta, timezone
+
+import json
+
+import pytest
+from django.core.management import call_command
+from django.test import Client
+from django.urls import reverse
+from django.utils.timezone import now
+
+from monitoring import rollups
+from monitoring.models import WeatherData, WeatherDataRollup, WeatherStation
+from monitoring.rollups import (RESOLUTIONS, bucket_start, choose_resolution, get_temperature_series, make_rollup,
+                               series_start, update_rollups)
+
+
+@pytest.fixture
+def station(weather_station):
+    return WeatherStation.objects.create(**weather_station)
+
+
+def add_readings(station, readings):
+    """Stores (timestamp, temperature) pairs the way the ingestion does"""
+    created = WeatherData.objects.bulk_create(
+        WeatherData(station=station, timestamp=timestamp, temperature=temperature)
+        for timestamp, temperature in readings
+    )
+    update_rollups(created)
+
+
+def rollup_values(resolution):
+    return list(
+        WeatherDataRollup.objects.filter(resolution=resolution)
+        .order_by("bucket_start")
+        .values_list("bucket_start", "count", "temperature_min", "temperature_max", "temperature_avg")
+    )
+
+
+class TestRollups:
+    def test_bucket_start_is_aligned_in_utc(self):
+        timestamp = datetime(2025, 3, 10, 9, 47, 39, tzinfo=timezone.utc)
+        assert bucket_start(timestamp, 300) == datetime(2025, 3, 10, 9, 45, tzinfo=timezone.utc)
+        assert bucket_start(timestamp, 86400) == datetime(2025, 3, 10, tzinfo=timezone.utc)
+
+    @pytest.mark.django_db
+    def test_ingestion_updates_every_resolution_incrementally(self, station):
+        base = datetime(2025, 3, 10, 9, 0, tzinfo=timezone.utc)
+        add_readings(station, [(base, 10.0), (base + timedelta(minutes=2), 14.0)])
+        add_readings(station, [(base + timedelta(minutes=4), 12.0), (base + timedelta(minutes=6), 20.0)])
+
+        assert rollup_values("5m") == [(base, 3, 10.0, 14.0, 12.0), (base + timedelta(minutes=5), 1, 20.0, 20.0, 20.0)]
+        assert rollup_values("1h") == [(base, 4, 10.0, 20.0, 14.0)]
+        assert rollup_values("1d") == [(base.replace(hour=0), 4, 10.0, 20.0, 14.0)]
+
+    @pytest.mark.django_db
+    def test_buckets_created_concurrently_are_merged(self, station, monkeypatch):
+        base = datetime(2025, 3, 10, 9, 0, tzinfo=timezone.utc)
+        insert = rollups.insert_ignoring_conflicts
+
+        def insert_after_another_ingestion(objs, unique_fields):
+            # another ingestion commits the buckets of a reading at 9:01 between the lookup and the insert
+            WeatherDataRollup.objects.bulk_create(
+                make_rollup((station.id, resolution, bucket_start(base, seconds)), (1, 8.0, 8.0, 8.0))
+                for resolution, seconds in RESOLUTIONS.items()
+            )
+            return insert(objs, unique_fields)
+
+        monkeypatch.setattr(rollups, "insert_ignoring_conflicts", insert_after_another_ingestion)
+        add_readings(station, [(base, 10.0), (base + timedelta(minutes=6), 20.0)])
+
+        assert rollup_values("5m") == [(base, 2, 8.0, 10.0, 9.0), (base + timedelta(minutes=5), 1, 20.0, 20.0, 20.0)]
+        assert rollup_values("1h") == [(base, 3, 8.0, 20.0, pytest.approx(38 / 3))]
+
+    @pytest.mark.django_db
+    def test_rebuild_command_matches_incremental_rollups(self, station):
+        base = datetime(2025, 3, 10, 23, 50, tzinfo=timezone.utc)
+        add_readings(station, [(base + timedelta(minutes=7 * index), float(index)) for index in range(10)])
+        incremental = {resolution: rollup_values(resolution) for resolution in ("5m", "1h", "1d")}
+
+        WeatherDataRollup.objects.all().delete()
+        call_command("rebuild_rollups")
+        for resolution, values in incremental.items():
+            assert rollup_values(resolution) == pytest.approx(values)
+
+        call_command("rebuild_rollups", "--since", "2025-03-11", "--station", str(station.id))
+        for resolution, values in incremental.items():
+            assert rollup_values(resolution) == pytest.approx(values)
+
+
+class TestTemperatureSeries:
+    def test_choose_resolution(self, settings):
+        settings.ROLLUP_MIN_POINTS = 60
+        assert choose_resolution(3600) is None
+        assert choose_resolution(24 * 3600) == "5m"
+        assert choose_resolution(7 * 24 * 3600) == "1h"
+        assert choose_resolution(90 * 24 * 3600) == "1d"
+
+    @pytest.mark.django_db
+    def test_long_windows_read_rollups(self, station, settings):
+        settings.ROLLUP_MIN_POINTS = 60
+        start = now() - timedelta(hours=24)
+        add_readings(station, [(start + timedelta(minutes=index), 10.0 + index % 5) for index in range(1, 1440)])
+
+        series = get_temperature_series(station, start)
+        assert 288 <= len(series) <= 289
+        assert all(temperature == pytest.approx(12.0, abs=1) for _, temperature in series[1:-1])
+
+        short = get_temperature_series(station, now() - timedelta(hours=1))
+        assert 59 <= len(short) <= 60
+
+    @pytest.mark.django_db
+    def test_since_returns_only_the_newer_points(self, station, settings):
+        settings.ROLLUP_MIN_POINTS = 60
+        start = now() - timedelta(hours=24)
+        add_readings(station, [(start + timedelta(minutes=index), 10.0) for index in range(1, 1440)])
+        raw = get_temperature_series(station, now() - timedelta(hours=1))
+        rollups = get_temperature_series(station, start)
+
+        assert get_temperature_series(station, now() - timedelta(hours=1), since=raw[-3][0]) == raw[-2:]
+        # the bucket the client holds last is sent again, it may still be filling up
+        assert get_temperature_series(station, start, since=rollups[-2][0]) == rollups[-2:]
+        assert series_start(start) == bucket_start(start, 300)
+
+
+class TestTemperatureDelta:
+    @pytest.mark.django_db
+    def test_partial_sends_the_points_after_the_cursor(self, station, django_assert_max_num_queries):
+        start = now() - timedelta(minutes=30)
+        add_readings(station, [(start + timedelta(minutes=index), float(index)) for index in range(30)])
+        url = reverse("temperature_data_partial")
+        full = Client().get(url, {"station_id": station.id, "interval": "1h"})
+        assert len(json.loads(full.context["timestamps"])) == 30
+        assert not full.context["delta"]
+
+        since = json.loads(full.context["timestamps"])[-1]
+        add_readings(station, [(now(), 99.0)])
+        with django_assert_max_num_queries(2):
+            delta = Client().get(url, {"station_id": station.id, "interval": "1h", "since": since})
+        assert json.loads(delta.context["temperatures"]) == [99.0]
+        assert delta.context["delta"]
+        assert b"data-delta" in delta.content
+        assert delta.context["window_start"] < since
@@ -0,0 +1,163 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from django.core.cache import caches
+
+from monitoring import metrics
+from monitoring.api_clients.errors import ProviderResponseError
+from monitoring.api_clients.openweather import OpenWeatherAPIClient
+from monitoring.api_clients.response_cache import request_key
+from monitoring.api_clients.session import close_session
+from monitoring.api_clients.single_flight import flights, run_shared
+from monitoring.models import WeatherData
+from monitoring.services import fetch_and_save_weather
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.registry.reset()
+    yield
+    metrics.registry.reset()
+
+
+@pytest_asyncio.fixture
+async def provider(settings, openweather_data):
+    """Slow OpenWeather stand-in answering with the queued statuses, then 200"""
+    statuses = []
+    requests = []
+
+    async def weather(request):
+        requests.append(request.query)
+        await asyncio.sleep(0.1)
+        status = statuses.pop(0) if statuses else 200
+        if status != 200:
+            return web.Response(status=status)
+        return web.json_response(openweather_data)
+
+    app = web.Application()
+    app.router.add_get("/weather", weather)
+    server = TestServer(app)
+    await server.start_server()
+    settings.OPENWEATHER_BASE_URL = str(server.make_url("")).rstrip("/")
+    settings.API_RESPONSE_CACHE = {"backend": None}
+    settings.API_RATE_LIMIT = {"backend": None}
+    yield statuses, requests
+    await close_session()
+    await server.close()
+
+
+def roles():
+    return metrics.registry.snapshot().get("weather_provider_single_flight_total", {})
+
+
+class TestSingleFlight:
+    @pytest.mark.asyncio
+    async def test_identical_concurrent_calls_share_one_request(self, provider, openweather_data):
+        _, requests = provider
+        responses = await asyncio.gather(
+            *(OpenWeatherAPIClient().get_weather_data(lat=45.0, lon=9.0) for _ in range(5)),
+            # equal once rounded to the key precision
+            OpenWeatherAPIClient().get_weather_data(lat=45.00001, lon=9.0),
+            OpenWeatherAPIClient().get_weather_data(lat=46.0, lon=9.0),
+        )
+        assert responses == [openweather_data] * 7
+        assert len(requests) == 2
+        assert roles() == {("openweather", "leader"): 2, ("openweather", "follower"): 5}
+        assert len(flights) == 0
+
+        # once answered, the next call makes its own request
+        await OpenWeatherAPIClient().get_weather_data(lat=45.0, lon=9.0)
+        assert len(requests) == 3
+
+    @pytest.mark.asyncio
+    async def test_errors_reach_every_caller(self, provider):
+        statuses, requests = provider
+        statuses.append(404)
+        results = await asyncio.gather(
+            *(OpenWeatherAPIClient().get_weather_data(lat=45.0, lon=9.0) for _ in range(3)), return_exceptions=True
+        )
+        assert all(isinstance(result, ProviderResponseError) and result.status == 404 for result in results)
+        assert len(requests) == 1
+
+    @pytest.mark.asyncio
+    async def test_followers_call_again_when_the_leader_is_cancelled(self, provider, openweather_data):
+        _, requests = provider
+        leader = asyncio.create_task(OpenWeatherAPIClient().get_weather_data(lat=45.0, lon=9.0))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(OpenWeatherAPIClient().get_weather_data(lat=45.0, lon=9.0))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        assert await follower == openweather_data
+        assert leader.cancelled()
+        assert len(requests) == 2
+
+    @pytest.mark.asyncio
+    async def test_disabled(self, provider, settings):
+        _, requests = provider
+        settings.API_SINGLE_FLIGHT = {"enabled": False}
+        await asyncio.gather(*(OpenWeatherAPIClient().get_weather_data(lat=45.0, lon=9.0) for _ in range(3)))
+        assert len(requests) == 3
+
+
+class TestSharedLock:
+    conf = {"cache_alias": "default", "lock_timeout": 5, "result_ttl": 5, "poll_interval": 0.01}
+
+    @pytest.mark.asyncio
+    async def test_other_processes_wait_for_the_result(self):
+        calls = []
+
+        async def call():
+            calls.append(1)
+            await asyncio.sleep(0.1)
+            return {"dt": 1741599999}
+
+        # run_shared called twice stands for two processes, each with its own in-process flights
+        results = await asyncio.gather(*(run_shared("test-key", call, "openweather", self.conf) for _ in range(2)))
+        assert results == [{"dt": 1741599999}] * 2
+        assert len(calls) == 1
+        assert roles() == {("openweather", "remote"): 1}
+
+    @pytest.mark.asyncio
+    async def test_a_failed_holder_lets_the_waiting_process_call(self):
+        calls = []
+
+        async def call():
+            calls.append(1)
+            await asyncio.sleep(0.05)
+            if len(calls) == 1:
+                raise ProviderResponseError("openweather", 404, "Not Found")
+            return {"dt": 1741599999}
+
+        results = await asyncio.gather(
+            *(run_shared("test-key", call, "openweather", self.conf) for _ in range(2)), return_exceptions=True
+        )
+        assert isinstance(results[0], ProviderResponseError)
+        assert results[1] == {"dt": 1741599999}
+        assert len(calls) == 2
+
+    @pytest.mark.asyncio
+    async def test_clients_use_the_shared_lock_when_enabled(self, provider, settings):
+        _, requests = provider
+        settings.API_SINGLE_FLIGHT = {"shared": True, "cache_alias": "default"}
+        await asyncio.gather(*(OpenWeatherAPIClient().get_weather_data(lat=45.0, lon=9.0) for _ in range(3)))
+        assert len(requests) == 1
+        # the response stays readable by the processes that waited for it, the lock is gone
+        key = request_key("single-flight", "openweather", "weather", {"lat": 45.0, "lon": 9.0}, 3)
+        assert caches["default"].get(f"{key}:result") is not None
+        assert caches["default"].get(f"{key}:lock") is None
+
+
+class TestFetchAndSave:
+    @pytest.mark.asyncio
+    @pytest.mark.django_db(transaction=True)
+    async def test_identical_concurrent_calls_save_once(self, provider):
+        _, requests = provider
+        results = await asyncio.gather(
+            *(fetch_and_save_weather(OpenWeatherAPIClient(), lat=45.0, lon=9.0) for _ in range(3))
+        )
+        assert results == [{"message": "N. 1 dati salvati con successo!"}] * 3
+        assert len(requests) == 1
+        assert await WeatherData.objects.acount() == 1
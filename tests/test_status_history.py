@@ -0,0 +1,93 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+
+from monitoring.models import PostgresStatusInterval
+from monitoring.status_history import availability, record_statuses, status_series
+
+START = datetime(2025, 3, 10, 9, 0, tzinfo=timezone.utc)
+
+
+def probe(seconds, status="up", latency_ms=1.0, target="default"):
+    return {
+        "target": target,
+        "status": status,
+        "latency_ms": latency_ms if status == "up" else None,
+        "checked_at": START + timedelta(seconds=seconds),
+    }
+
+
+def intervals():
+    return list(
+        PostgresStatusInterval.objects.order_by("started_at").values_list(
+            "status", "started_at", "ended_at", "sample_count"
+        )
+    )
+
+
+class TestStatusIntervals:
+    @pytest.mark.django_db
+    def test_probes_extend_the_open_interval_until_a_transition(self):
+        for seconds, status, latency_ms in [(0, "up", 1.0), (10, "up", 3.0), (20, "down", None), (30, "down", None)]:
+            record_statuses([probe(seconds, status, latency_ms)], max_gap=60)
+        record_statuses([probe(40, "up", 2.0)], max_gap=60)
+
+        assert intervals() == [
+            ("up", START, START + timedelta(seconds=20), 2),
+            ("down", START + timedelta(seconds=20), START + timedelta(seconds=40), 2),
+            ("up", START + timedelta(seconds=40), START + timedelta(seconds=40), 1),
+        ]
+        first = PostgresStatusInterval.objects.order_by("started_at").first()
+        assert (first.latency_min, first.latency_max, first.latency_avg) == (1.0, 3.0, 2.0)
+
+    @pytest.mark.django_db
+    def test_a_gap_in_the_probes_starts_a_new_interval(self):
+        record_statuses([probe(0), probe(0, target="replica")], max_gap=60)
+        record_statuses([probe(600), probe(10, target="replica")], max_gap=60)
+
+        assert PostgresStatusInterval.objects.filter(target="default").count() == 2
+        assert PostgresStatusInterval.objects.filter(target="replica").count() == 1
+
+    @pytest.mark.django_db
+    def test_availability_and_series_come_from_the_intervals(self, django_assert_num_queries):
+        for seconds in range(0, 3600, 10):
+            record_statuses([probe(seconds, "down" if 900 <= seconds < 1800 else "up")], max_gap=60)
+        assert PostgresStatusInterval.objects.count() == 3
+
+        with django_assert_num_queries(1):
+            result = availability("default", START, START + timedelta(hours=1))
+        assert result["up"] == pytest.approx(2690)
+        assert result["down"] == pytest.approx(900)
+        assert result["availability"] == pytest.approx(2690 / 3590)
+
+        window = availability("default", START + timedelta(minutes=10), START + timedelta(minutes=20))
+        assert (window["up"], window["down"]) == (300, 300)
+        assert [value for _, value in status_series("default", START, START + timedelta(hours=1))] == [1, 1, 0, 0, 1, 1]
+        assert availability("missing", START, START + timedelta(hours=1))["availability"] is None
+
+
+class TestCompactionMigration:
+    @pytest.mark.django_db(transaction=True)
+    def test_existing_logs_are_compacted(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate([("monitoring", "0006_postgresstatuslog_target_latency")])
+        old_apps = executor.loader.project_state([("monitoring", "0006_postgresstatuslog_target_latency")]).apps
+        PostgresStatusLog = old_apps.get_model("monitoring", "PostgresStatusLog")
+        statuses = ["up"] * 5 + ["down"] * 3 + ["up"] * 2
+        logs = PostgresStatusLog.objects.bulk_create(
+            PostgresStatusLog(status=status, latency_ms=1.0 if status == "up" else None) for status in statuses
+        )
+        for index, log in enumerate(logs):
+            log.timestamp = START + timedelta(minutes=index)
+        PostgresStatusLog.objects.bulk_update(logs, ["timestamp"])
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+        assert intervals() == [
+            ("up", START, START + timedelta(minutes=5), 5),
+            ("down", START + timedelta(minutes=5), START + timedelta(minutes=8), 3),
+            ("up", START + timedelta(minutes=8), START + timedelta(minutes=9), 2),
+        ]
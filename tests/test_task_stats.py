@@ -0,0 +1,112 @@
+from datetime import timedelta
+
+import pytest
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.timezone import now
+from django_q.models import Task
+
+from monitoring.models import TaskStatBucket
+from monitoring.task_stats import DURATION_BUCKETS, get_task_summary, minute_start, percentile
+
+
+def save_task(index, func="monitoring.tasks.fetch", success=True, seconds=1.0, stopped=None):
+    """Saves a task result the way the Django-Q cluster does"""
+    stopped = stopped or now()
+    return Task.objects.create(
+        id=f"{index:032d}",
+        name=f"task-{index}",
+        func=func,
+        started=stopped - timedelta(seconds=seconds),
+        stopped=stopped,
+        success=success,
+    )
+
+
+class TestTaskStatBuckets:
+    @pytest.mark.django_db
+    def test_saved_tasks_are_counted_per_function_and_minute(self):
+        for index in range(20):
+            save_task(index, seconds=0.2 if index < 18 else 20.0)
+        save_task(20, func="monitoring.tasks.probe", success=False)
+
+        bucket = TaskStatBucket.objects.get(func="monitoring.tasks.fetch")
+        assert (bucket.minute, bucket.success_count, bucket.failure_count) == (minute_start(now()), 20, 0)
+        assert bucket.duration_sum == pytest.approx(18 * 0.2 + 2 * 20.0)
+
+        summary = get_task_summary()
+        assert (summary["success_count"], summary["failure_count"]) == (20, 1)
+        fetch, probe = summary["functions"]
+        assert fetch["func"] == "monitoring.tasks.fetch"
+        assert 0.1 < fetch["p50"] <= 0.25
+        assert 10.0 < fetch["p95"] <= 30.0
+        assert (probe["failure_count"], probe["p50"]) == (1, pytest.approx(0.75))
+
+    @pytest.mark.django_db
+    def test_a_retry_counts_its_outcome_only(self):
+        task = save_task(0, success=False)
+        task.success = True
+        task.stopped = task.stopped + timedelta(seconds=5)
+        task.save()
+        bucket = TaskStatBucket.objects.get()
+        assert (bucket.success_count, bucket.failure_count) == (1, 1)
+        assert sum(bucket.duration_buckets) == 1
+
+    @pytest.mark.django_db
+    def test_window_and_pruning(self, settings):
+        settings.TASK_STATS = {"keep_days": 1}
+        save_task(0, stopped=now() - timedelta(hours=3))
+        assert get_task_summary(minutes=60)["success_count"] == 0
+        assert get_task_summary(minutes=240)["success_count"] == 1
+        save_task(1, stopped=now() - timedelta(days=2))
+        save_task(2)
+        assert TaskStatBucket.objects.count() == 2
+
+    def test_percentile_interpolates_within_the_bucket(self):
+        counts = [0] * (len(DURATION_BUCKETS) + 1)
+        counts[3] = 4  # four tasks between 0.5 and 1 second
+        assert percentile(counts, 0.5) == pytest.approx(0.75)
+        assert percentile([0] * len(counts), 0.5) is None
+        counts[-1] = 100
+        assert percentile(counts, 0.95) == DURATION_BUCKETS[-1]
+
+
+class TestTaskStatsPartial:
+    @pytest.mark.django_db
+    def test_partial_reads_the_buckets_only(self):
+        for index in range(3):
+            save_task(index, success=index != 0)
+        with CaptureQueriesContext(connection) as queries:
+            response = Client().get(reverse("task_stats_partial"))
+        assert not [query for query in queries if "django_q_task" in query["sql"]]
+        assert (response.context["success_count"], response.context["failure_count"]) == (2, 1)
+        assert b"monitoring.tasks.fetch" in response.content
+
+
+class TestBackfillMigration:
+    @pytest.mark.django_db(transaction=True)
+    def test_tasks_saved_before_the_migration_are_counted(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate([("monitoring", "0007_postgresstatusinterval")])
+        stopped = now()
+        # bulk_create sends no post_save: nothing is counted before the migration
+        Task.objects.bulk_create(
+            Task(
+                id=f"{index:032d}",
+                name=f"task-{index}",
+                func="monitoring.tasks.fetch",
+                started=stopped - timedelta(seconds=1),
+                stopped=stopped,
+                success=index % 2 == 0,
+            )
+            for index in range(10)
+        )
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+        bucket = TaskStatBucket.objects.get()
+        assert (bucket.success_count, bucket.failure_count) == (5, 5)
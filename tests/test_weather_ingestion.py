@@ -1,20 +1,27 @@
 import asyncio
+import json
 from datetime import datetime
 from unittest.mock import patch
 
+import aiohttp
 import pytest
 import pytest_asyncio
-from asgiref.sync import sync_to_async
+from asgiref.sync import async_to_sync, sync_to_async
+from django.db import connection
 from django.test import AsyncClient
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from django.utils import timezone
 
+from monitoring import decoders, metrics, services
 from monitoring.api_clients.openweather import OpenWeatherAPIClient
-from monitoring.models import WeatherData, WeatherStation
+from monitoring.models import WeatherData, WeatherDataRollup, WeatherStation
 from monitoring.serializers import (NetatmoSerializer, OpenWeatherSerializer,
                                     WeatherDataSerializer,
                                     WeatherStationSerializer)
-from monitoring.services import fetch_and_save_weather
+from monitoring.services import fetch_and_save_weather, fetch_many_and_save_weather, save_rows
+from monitoring.stations import StationCache, get_or_create_station, station_cache, station_key
+from monitoring.tasks import fetch_weather_locations_task
 
 
 @sync_to_async
@@ -230,6 +237,113 @@ class TestFetchAndSaveWeather:
         print(result)
         assert result == {"message": "N. 1 dati salvati con successo!"}
 
+    @pytest.mark.django_db
+    def test_fetch_and_save_weather_netatmo_in_bulk(self, netatmo_api_client, django_assert_max_num_queries):
+        params = {"lat_ne": 45.5, "lon_ne": 9.3, "lat_sw": 45.4, "lon_sw": 9.2}
+        # stations: SELECT, bulk INSERT, SELECT back; readings: SELECT, bulk INSERT; rollups: SELECT, bulk INSERT
+        with django_assert_max_num_queries(9):
+            result = async_to_sync(fetch_and_save_weather)(netatmo_api_client, **params)
+        assert result == {"message": "N. 3 dati salvati con successo!"}
+        assert WeatherStation.objects.filter(source="netatmo").count() == 3
+        assert WeatherData.objects.count() == 3
+        assert set(WeatherData.objects.values_list("temperature", "humidity", "pressure")) == {(18.3, 47, 1017.5)}
+
+        # a second poll resolves the stations from the cache and skips the readings already stored
+        with CaptureQueriesContext(connection) as queries:
+            result = async_to_sync(fetch_and_save_weather)(netatmo_api_client, **params)
+        assert result == {"message": "N. 3 dati salvati con successo!"}
+        assert not [query for query in queries if "monitoring_weatherstation" in query["sql"]]
+        assert not [query for query in queries if query["sql"].startswith("INSERT")]
+        assert WeatherStation.objects.count() == 3
+        assert WeatherData.objects.count() == 3
+
+    @pytest.mark.django_db
+    def test_fetch_and_save_weather_netatmo_reports_invalid_rows(self, netatmo_api_client):
+        payload = json.loads(netatmo_api_client.get_weather_data.return_value)
+        # a station without a temperature module cannot be stored
+        del payload["body"][1]["measures"]["02:00:00:6b:97:be"]
+        netatmo_api_client.get_weather_data.return_value = json.dumps(payload)
+        result = async_to_sync(fetch_and_save_weather)(netatmo_api_client)
+        assert list(result) == ["error"]
+        assert len(result["error"]) == 1
+        assert "temperature" in result["error"][0]
+        assert WeatherData.objects.count() == 2
+
+
+class FakeOpenWeatherClient:
+    """Returns one reading per location, tracking how many fetches run at once"""
+
+    source = "openweather"
+    in_flight = 0
+    max_in_flight = 0
+
+    async def get_weather_data(self, lat, lon):
+        cls = FakeOpenWeatherClient
+        cls.in_flight += 1
+        cls.max_in_flight = max(cls.max_in_flight, cls.in_flight)
+        await asyncio.sleep(0.01)
+        cls.in_flight -= 1
+        if lat < 0:
+            raise aiohttp.ClientError("boom")
+        return {
+            "coord": {"lon": lon, "lat": lat},
+            "main": {"temp": lat, "feels_like": lat, "humidity": 50, "pressure": 1012},
+            "dt": 1741599999,
+            "id": int(lat * 1000),
+            "name": f"Point {lat}",
+        }
+
+
+class TestConcurrentSaves:
+    @pytest.mark.django_db(transaction=True)
+    def test_readings_saved_meanwhile_by_another_worker_are_counted_once(self, openweather_data, monkeypatch):
+        rows, _ = decoders.decode_response("openweather", openweather_data)
+        insert = services.insert_ignoring_conflicts
+
+        def insert_after_the_other_worker(readings, unique_fields):
+            # the other worker saves the same payload between the lookup and the insert of this one
+            monkeypatch.setattr(services, "insert_ignoring_conflicts", insert)
+            save_rows(rows)
+            return insert(readings, unique_fields)
+
+        monkeypatch.setattr(services, "insert_ignoring_conflicts", insert_after_the_other_worker)
+        published = []
+        monkeypatch.setattr(services.broker, "publish_readings", published.append)
+        metrics.registry.reset()
+        save_rows(rows)
+
+        assert WeatherData.objects.count() == 1
+        assert set(WeatherDataRollup.objects.values_list("count", flat=True)) == {1}
+        assert metrics.registry.snapshot()["weather_readings_inserted_total"] == {(): 1}
+        assert [len(readings) for readings in published if readings] == [1]
+
+
+class TestFetchManyAndSaveWeather:
+    @pytest.mark.django_db
+    def test_locations_are_fetched_concurrently_and_saved_in_one_batch(self):
+        FakeOpenWeatherClient.max_in_flight = 0
+        locations = [{"lat": 45 + index / 100, "lon": 9.0} for index in range(20)]
+        result = async_to_sync(fetch_many_and_save_weather)(FakeOpenWeatherClient, locations, concurrency=5)
+        assert result == {"message": "N. 20 dati salvati con successo!"}
+        assert FakeOpenWeatherClient.max_in_flight == 5
+        assert WeatherStation.objects.count() == 20
+        assert WeatherData.objects.count() == 20
+
+    @pytest.mark.django_db
+    def test_failed_location_does_not_discard_the_others(self):
+        locations = [{"lat": 45.0, "lon": 9.0}, {"lat": -1.0, "lon": 9.0}]
+        result = async_to_sync(fetch_many_and_save_weather)(FakeOpenWeatherClient, locations)
+        assert result == {"error": ["Unexpected error fetching {'lat': -1.0, 'lon': 9.0}: boom"]}
+        assert WeatherData.objects.count() == 1
+
+    @pytest.mark.django_db
+    def test_task_sweeps_configured_location_set(self, settings):
+        settings.WEATHER_LOCATIONS = {"milan": [("45.46", "9.19"), ("45.48", "9.21")]}
+        with patch("monitoring.tasks.OpenWeatherAPIClient", FakeOpenWeatherClient):
+            result = fetch_weather_locations_task("milan")
+        assert result == {"message": "N. 2 dati salvati con successo!"}
+        assert sorted(WeatherData.objects.values_list("temperature", flat=True)) == [45.46, 45.48]
+
 
 class TestMonitorView:
     @pytest.mark.django_db
@@ -243,9 +357,8 @@ class TestMonitorView:
             "lon": 9.21940,
             "openweather_submit": "Submit",
         }
-        # Mock the API client to return the openweather data
-        mock_get_weather_data.return_value = asyncio.Future()
-        mock_get_weather_data.return_value.set_result({
+        # Mock the API client to return the openweather data (patched with an AsyncMock, it is a coroutine)
+        mock_get_weather_data.return_value = {
             "coord": {"lon": 10.1234, "lat": 46.7890},
             "weather": [
                 {"id": 801, "main": "Clear", "description": "clear sky", "icon": "01d"}
@@ -276,7 +389,7 @@ class TestMonitorView:
             "id": 6694000,
             "name": "RandomCity",
             "cod": 200
-        })
+        }
          
         response = await async_client.post(reverse("monitor_view"), data=form_post_data)
 
@@ -306,3 +419,46 @@ class TestMonitorView:
         assert first_data.timestamp == datetime(2025, 3, 10, 9, 46, 39, tzinfo=timezone.utc)
         data_station = await get_data_station(first_data)
         assert data_station.name == first_station.name
+
+
+class TestStationCache:
+    @pytest.mark.django_db
+    def test_cached_station_needs_no_query(self, openweather_data):
+        first = OpenWeatherSerializer(data=openweather_data)
+        assert first.is_valid(), first.errors
+        station = first.save().station
+        second = OpenWeatherSerializer(data=openweather_data)
+        assert second.is_valid(), second.errors
+        with CaptureQueriesContext(connection) as queries:
+            assert second.save().station_id == station.id
+        assert not [query for query in queries if "monitoring_weatherstation" in query["sql"]]
+
+    @pytest.mark.django_db
+    def test_changed_locality_does_not_duplicate_station(self, openweather_data):
+        serializer = OpenWeatherSerializer(data=openweather_data)
+        assert serializer.is_valid(), serializer.errors
+        station = serializer.save().station
+        station_cache.clear()
+        openweather_data["name"] = "Renamed City"
+        serializer = OpenWeatherSerializer(data=openweather_data)
+        assert serializer.is_valid(), serializer.errors
+        assert serializer.save().station == station
+        assert WeatherStation.objects.count() == 1
+
+    @pytest.mark.django_db
+    def test_editing_station_invalidates_cache(self, weather_station):
+        station = get_or_create_station(weather_station)
+        assert station_cache.get(station_key(weather_station)) == station
+        station.source_id = "renamed_id"
+        station.save()
+        assert station_cache.get(station_key(weather_station)) is None
+
+    def test_cache_is_bounded_and_expires(self):
+        cache = StationCache(max_size=2, ttl=60)
+        for index in range(3):
+            cache.set(("netatmo", str(index)), WeatherStation(pk=index))
+        assert len(cache) == 2
+        assert cache.get(("netatmo", "0")) is None
+        expired = StationCache(max_size=2, ttl=0)
+        expired.set(("netatmo", "1"), WeatherStation(pk=1))
+        assert expired.get(("netatmo", "1")) is None
@@ -13,4 +13,14 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "weatherapp.settings")
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up
+from monitoring.sse import SSE_PATH, sse_application  # noqa: E402
+
+
+async def application(scope, receive, send):
+    """Serves the dashboard Server-Sent Events stream, everything else goes to Django"""
+    if scope["type"] == "http" and scope["path"] == SSE_PATH:
+        return await sse_application(scope, receive, send)
+    return await django_application(scope, receive, send)
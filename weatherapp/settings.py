@@ -84,11 +84,18 @@ WSGI_APPLICATION = "weatherapp.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# SQLite by default; DATABASE_URL=postgres://... for PostgreSQL, which also runs the tests marked postgresql
 DATABASES = {
-    "default": {
-        "ENGINE": "django.db.backends.sqlite3",
-        "NAME": BASE_DIR / "db.sqlite3",
-    }
+    "default": env.db("DATABASE_URL", default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}"),
+}
+
+CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+    # shared by the web server, the Django-Q workers and the probe_postgres command: statuses,
+    # data versions (ETags) and rendered fragments. By default a directory of this checkout, to
+    # delete along with db.sqlite3 as the versions describe that database. A multi-process or
+    # multi-host deployment sets STATUS_CACHE_URL, e.g. redis://host:6379/1
+    "status": env.cache("STATUS_CACHE_URL", default=f"filecache://{BASE_DIR / 'status-cache'}"),
 }
 
 
@@ -146,10 +153,165 @@ Q_CLUSTER = {
 
 SECURE_CONTENT_TYPE_NOSNIFF = True
 
+# Connection pool shared by the weather API clients (see monitoring/api_clients/session.py)
+API_CLIENT_SESSION = {
+    "limit": 100,
+    "limit_per_host": 10,
+    "keepalive_timeout": 30,
+    "ttl_dns_cache": 300,
+    "total_timeout": 30,
+}
+
+# Cache of the provider responses (see monitoring/api_clients/response_cache.py):
+# "local" keeps them per process, "django" shares them through CACHES, None disables it
+API_RESPONSE_CACHE = {
+    "backend": "local",
+    "cache_alias": "default",
+    "max_size": 1024,
+    "precision": 3,
+    "ttl": {"openweather": 600, "netatmo": 300},
+}
+
+# Token buckets throttling the provider requests (see monitoring/api_clients/rate_limit.py):
+# "database" shares them between the web server and the Django-Q workers, "local" keeps them
+# per process, None disables them. rate is in requests per second, burst the bucket size.
+API_RATE_LIMIT = {
+    "backend": "database",
+    "max_wait": 10,
+    "limits": {
+        # free plan: 60 calls per minute
+        "openweather": {"rate": 1.0, "burst": 10},
+        # getpublicdata: 500 calls per hour, 50 per 10 seconds
+        "netatmo": {"rate": 500 / 3600, "burst": 50},
+    },
+}
+
+# Retries of the provider requests and circuit breaker per provider (see
+# monitoring/api_clients/resilience.py); the deadline stays below the Q_CLUSTER timeout
+API_RESILIENCE = {
+    "deadline": 20,
+    "attempt_timeout": 10,
+    "retries": 2,
+    "backoff": 0.5,
+    "max_backoff": 8,
+    "failure_threshold": 5,
+    "reset_timeout": 60,
+}
+
+# Identical concurrent provider calls share one request and one save (see
+# monitoring/api_clients/single_flight.py); "shared" extends this to the Django-Q workers
+# through a lock in the cache_alias cache, which should then be Redis (STATUS_CACHE_URL)
+API_SINGLE_FLIGHT = {
+    "enabled": True,
+    "shared": False,
+    "cache_alias": "status",
+    "lock_timeout": 30,
+    "result_ttl": 30,
+    "poll_interval": 0.1,
+    "precision": 3,
+}
+
+# How provider responses are decoded at ingestion: "fast" uses the compiled decoders of
+# monitoring/decoders.py, "strict" runs the full DRF serializer validation
+INGESTION_DECODER = "fast"
+
+# Minimum number of points a dashboard series must have before a coarser rollup is used
+ROLLUP_MIN_POINTS = 60
+
+# Maximum number of points sent to a dashboard chart, larger series are downsampled with LTTB
+CHART_MAX_POINTS = 500
+
+# Metrics exposed at /monitoring/metrics (see monitoring/metrics.py): point multiprocess_dir
+# to a directory shared by the web server and the Django-Q workers to aggregate them
+METRICS = {
+    "multiprocess_dir": env("METRICS_MULTIPROCESS_DIR", default=None),
+    "flush_interval": 5,
+}
+
+# Server-Sent Events pushed to the dashboards (see monitoring/events.py), served by weatherapp/asgi.py
+DASHBOARD_EVENTS = {
+    "queue_size": 100,
+    "heartbeat": 15,
+    "relay_interval": 1,
+    "relay_overlap": 30,
+    "task_interval": 5,
+}
+
+# ETag/Last-Modified of the dashboard partials (see monitoring/conditional.py): the versions of
+# the data are kept in a cache shared with the processes that change it
+CONDITIONAL_RESPONSES = {
+    "cache_alias": "status",
+    "task_granularity": 60,
+}
+
+# Rendered dashboard fragments shared by their viewers (see monitoring/fragments.py), keyed by
+# the version of their data: committing new readings or statuses invalidates them. Kept in the
+# "status" cache, shared by the web server processes: "default" (LocMem) holds one copy per process
+FRAGMENT_CACHE = {
+    "cache_alias": "status",
+    "timeout": 3600,
+}
+
+# Per-minute task counters fed by the tasks the Django-Q cluster saves (see monitoring/task_stats.py)
+TASK_STATS = {
+    "window_minutes": 60,
+    "keep_days": 7,
+}
+
+# Raw WeatherData older than raw_days is archived by month to compressed columnar files, then
+# dropped (see monitoring/retention.py and the apply_retention command); rollups are kept forever
+RETENTION = {
+    "raw_days": env.int("RAW_RETENTION_DAYS", default=90),
+    "archive_dir": env.str("ARCHIVE_DIR", default=str(BASE_DIR / "archive")),
+    "chunk_size": 10000,
+    "months_ahead": 2,
+}
+
+# Streaming exports of the readings (see monitoring/export.py), rows read from the database
+# chunk_size at a time and encoded batch_size at a time
+EXPORT = {
+    "chunk_size": 2000,
+    "batch_size": 500,
+    "max_days": 366,
+}
+
+# Loading of provider response dumps with the backfill_weather command (see monitoring/backfill.py)
+BACKFILL = {
+    "workers": None,
+    "batch_size": 10000,
+    "split_bytes": 16 * 1024 * 1024,
+    "state_file": str(BASE_DIR / "backfill-state.json"),
+    "progress_seconds": 5,
+}
+
+# In-process cache resolving (source, source_id) to a WeatherStation (see monitoring/stations.py)
+STATION_CACHE = {
+    "max_size": 10000,
+    "ttl": 3600,
+}
+
 NETATMO_TOKEN = env("NETATMO_TOKEN", default="")
 NETATMO_BASE_URL = env("NETATMO_BASE_URL", default="")
+# Quadtree tiling of the getpublicdata bounding box (see monitoring/api_clients/netatmo.py)
+NETATMO_TILING = {
+    "max_stations": 200,
+    "max_depth": 4,
+    "concurrency": 10,
+}
 OPENWEATHER_API_KEY = env("OPENWEATHER_API_KEY", default="")
 OPENWEATHER_BASE_URL = env("OPENWEATHER_BASE_URL", default="")
+# Background prober of DATABASE_TO_MONITOR (see monitoring/postgres_probe.py and the
+# probe_postgres command): the status views only read what it publishes in the "status" cache
+POSTGRES_PROBE = {
+    "interval": 10,
+    "connect_timeout": 3,
+    "statement_timeout": 2000,
+    "concurrency": 10,
+    "stale_after": 120,
+    "cache_alias": "status",
+}
+# Named Postgres targets probed concurrently; an entry can override the POSTGRES_PROBE
+# timeouts with CONNECT_TIMEOUT (seconds) and STATEMENT_TIMEOUT (milliseconds)
 DATABASE_TO_MONITOR = {
     "default": {
         "NAME": env("POSTGRES_DB", default=""),
@@ -166,3 +328,10 @@ LATITUDE_NE = env("LATITUDE_NE")
 LONGITUDE_NE = env("LONGITUDE_NE")
 LATITUDE_SW = env("LATITUDE_SW")
 LONGITUDE_SW = env("LONGITUDE_SW")
+
+# Named sets of (lat, lon) swept by fetch_weather_locations_task
+WEATHER_LOCATIONS = {
+    "default": [(LATITUDE, LONGITUDE)],
+}
+# Maximum number of provider requests in flight during a sweep
+WEATHER_FETCH_CONCURRENCY = env.int("WEATHER_FETCH_CONCURRENCY", default=20)